@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+# ============== DASHBOARD AGGREGATES ==============
+# Everything the KPI cards, charts and priority table render, reduced from an
+# inventory frame in a single pass: one bincount over (status, category) codes
+# gives every count and value total, and two partial selections give the
+# top-N lists. Summaries of separate chunks merge into the summary of the
+# whole file, so uploads can be aggregated without holding every row.
+
+TOP_N = 8
+
+DEAD_STATUS = 'Dead Stock (6+ months)'
+PROBLEM_STATUSES = [DEAD_STATUS, 'Slow Moving (3-6 months)']
+
+TOP_DEAD_COLUMNS = ['product_name', 'stock_value']
+PRIORITY_COLUMNS = ['product_name', 'category', 'current_stock', 'stock_value', 'days_since_last_sale', 'action_required', 'urgency_score',
+                    'sell_through_date', 'dead_stock_date']
+
+
+def _codes(series):
+    """Category codes and labels of series; missing values get the trailing None label"""
+    values = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    labels = [str(label) for label in values.cat.categories] + [None]
+    codes = values.cat.codes.to_numpy().astype(np.intp)
+    codes[codes < 0] = len(labels) - 1
+    return codes, labels
+
+
+def _top(df, scores, columns, n=TOP_N):
+    """Rows with the n largest non-NaN scores, ties broken by position like nlargest(keep='first')"""
+    positions = np.flatnonzero(~np.isnan(scores))
+    best = pd.Series(scores[positions], index=positions).nlargest(n)
+    # reindex: frames stored before a column was added still rank, with it left blank
+    return df.iloc[best.index.to_numpy()].reindex(columns=columns)
+
+
+class InventorySummary:
+    """Status x category count and value matrices plus the top-N rows.
+
+    Rows and columns of the matrices follow status_labels and category_labels;
+    a trailing None label collects rows where the value was missing.
+    """
+
+    def __init__(self, status_labels, category_labels, count, value, top_dead, top_priority):
+        self.status_labels = status_labels
+        self.category_labels = category_labels
+        self.count = count
+        self.value = value
+        self.top_dead = top_dead
+        self.top_priority = top_priority
+
+    @classmethod
+    def empty(cls):
+        return cls([None], [None], np.zeros((1, 1), dtype=np.int64), np.zeros((1, 1)),
+                   pd.DataFrame(columns=TOP_DEAD_COLUMNS), pd.DataFrame(columns=PRIORITY_COLUMNS))
+
+    @property
+    def rows(self):
+        return int(self.count.sum())
+
+    @property
+    def total_value(self):
+        return float(self.value.sum())
+
+    def status_total(self, status):
+        """(value, count) for one stock status"""
+        if status not in self.status_labels:
+            return 0.0, 0
+        i = self.status_labels.index(status)
+        return float(self.value[i].sum()), int(self.count[i].sum())
+
+    def status_totals(self):
+        """count and value per stock status present in the data"""
+        frame = pd.DataFrame({'count': self.count.sum(axis=1), 'value': self.value.sum(axis=1)}, index=self.status_labels)
+        return frame[(frame['count'] > 0) & frame.index.notna()]
+
+    def problem_count(self):
+        return sum(self.status_total(status)[1] for status in PROBLEM_STATUSES)
+
+    def category_problem(self):
+        """Stock value per category over dead and slow-moving rows"""
+        rows = [i for i, label in enumerate(self.status_labels) if label in PROBLEM_STATUSES]
+        count = self.count[rows].sum(axis=0)
+        series = pd.Series(self.value[rows].sum(axis=0), index=self.category_labels)
+        return series[(count > 0) & series.index.notna()]
+
+    def _combined(self, other, sign=1):
+        """Labels and matrices of self plus sign * other"""
+        status_labels = self.status_labels[:-1] + [s for s in other.status_labels[:-1] if s not in self.status_labels] + [None]
+        category_labels = self.category_labels[:-1] + [c for c in other.category_labels[:-1] if c not in self.category_labels] + [None]
+        count = np.zeros((len(status_labels), len(category_labels)), dtype=np.int64)
+        value = np.zeros(count.shape)
+        for part, factor in ((self, 1), (other, sign)):
+            rows = np.array([status_labels.index(s) for s in part.status_labels])
+            cols = np.array([category_labels.index(c) for c in part.category_labels])
+            count[np.ix_(rows, cols)] += factor * part.count
+            value[np.ix_(rows, cols)] += factor * part.value
+        return status_labels, category_labels, count, value
+
+    def merge(self, other):
+        """Summary of this chunk followed by other"""
+        return InventorySummary(*self._combined(other),
+                                _merge_top(self.top_dead, other.top_dead, 'stock_value'),
+                                _merge_top(self.top_priority, other.top_priority, 'urgency_score'))
+
+    def replace_rows(self, before, after, frame):
+        """Summary after the rows in before were replaced by after.
+
+        Row labels are positions in frame, the updated whole frame; rows in
+        after but not before are new. Only the changed rows are reduced, and
+        frame is scanned only when a row in a top-N list changed.
+        """
+        removed, added = summarize(before), summarize(after)
+        grown = InventorySummary(*self._combined(added), self.top_dead, self.top_priority)
+        status_labels, category_labels, count, value = grown._combined(removed, sign=-1)
+        if before.index.isin(self.top_dead.index).any():
+            top_dead = _top_dead(frame)
+        else:
+            top_dead = _merge_top(self.top_dead, added.top_dead, 'stock_value', by_label=True)
+        if before.index.isin(self.top_priority.index).any():
+            top_priority = _top_priority(frame)
+        else:
+            top_priority = _merge_top(self.top_priority, added.top_priority, 'urgency_score', by_label=True)
+        return InventorySummary(status_labels, category_labels, count, value, top_dead, top_priority)
+
+
+def _merge_top(left, right, column, by_label=False):
+    """Top rows of left and right; by_label orders ties by row label rather than left before right"""
+    if len(left) == 0:
+        return right
+    if len(right) == 0:
+        return left
+    # Earlier rows go first so ties resolve like a single nlargest(keep='first')
+    both = pd.concat([left, right])
+    if by_label:
+        both = both.sort_index(kind='stable')
+    return both.nlargest(TOP_N, column)
+
+
+def _dead_values(df, status=None, status_labels=None):
+    if status is None:
+        status, status_labels = _codes(df['stock_status'])
+    value = df['stock_value'].to_numpy(dtype=np.float64, na_value=0.0)
+    dead = status == status_labels.index(DEAD_STATUS) if DEAD_STATUS in status_labels else np.zeros(len(df), dtype=bool)
+    return np.where(dead, value, np.nan)
+
+
+def _top_dead(df):
+    return _top(df, _dead_values(df), TOP_DEAD_COLUMNS)
+
+
+def _top_priority(df):
+    return _top(df, df['urgency_score'].to_numpy(dtype=np.float64, na_value=np.nan), PRIORITY_COLUMNS)
+
+
+@timed('summarize')
+def summarize(df):
+    """Reduce a processed inventory frame to an InventorySummary in one pass"""
+    status, status_labels = _codes(df['stock_status'])
+    category, category_labels = _codes(df['category'])
+    # Sum in float64 even when the frame stores money as float32
+    value = df['stock_value'].to_numpy(dtype=np.float64, na_value=0.0)
+
+    shape = (len(status_labels), len(category_labels))
+    cell = status * shape[1] + category
+    count = np.bincount(cell, minlength=shape[0] * shape[1]).reshape(shape)
+    totals = np.bincount(cell, weights=value, minlength=shape[0] * shape[1]).reshape(shape)
+
+    top_dead = _top(df, _dead_values(df, status, status_labels), TOP_DEAD_COLUMNS)
+    return InventorySummary(status_labels, category_labels, count, totals, top_dead, _top_priority(df))
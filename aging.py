@@ -0,0 +1,93 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from classification import classify_inventory
+from forecast import forecast_inventory
+from metrics import timed
+from schema import apply_schema
+
+# ============== AGING ==============
+# Day counts taken from a row's dates against an as-of date, so an exported
+# file keeps aging correctly instead of freezing on the day it was written.
+# Dates are categorical after apply_schema and a year of trading has a few
+# hundred distinct ones, so each distinct label is parsed once and the rows
+# pick theirs up by category code. Re-aging a stored frame to another as-of
+# date is then a subtraction, a reclassification and no re-parse.
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y']
+
+# Date column -> the day count aged from it
+AGE_COLUMNS = {
+    'last_sale_date': 'days_since_last_sale',
+    'stock_received_date': 'days_in_stock',
+}
+
+
+def _parse_labels(labels):
+    """datetime64 array for an array of date strings, trying each of DATE_FORMATS"""
+    labels = pd.Index(labels).astype(str)
+    parsed = pd.to_datetime(labels, format=DATE_FORMATS[0], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS[1:]:
+        missing = np.isnat(parsed)
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(labels[missing], format=fmt, errors='coerce').to_numpy(dtype='datetime64[ns]')
+    return parsed
+
+
+def parse_dates(values):
+    """Parse YYYY-MM-DD and dd/mm/YYYY dates into a datetime64 Series; anything else becomes NaT"""
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if values.dtype.kind == 'M':
+        return values
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, labels = pd.factorize(values)
+    parsed = _parse_labels(labels)[codes] if len(labels) else np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+    return pd.Series(np.where(codes >= 0, parsed, np.datetime64('NaT')), index=values.index)
+
+
+def days_since(dates, as_of):
+    """Whole days from each date to as_of as float64, NaN where the date is missing; dates after as_of count as 0"""
+    days = (pd.Timestamp(as_of) - parse_dates(dates)).dt.days.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.maximum(days, 0)
+
+
+def has_dates(df):
+    """Whether df carries a date column that age_inventory can age from"""
+    return any(col in df.columns for col in AGE_COLUMNS)
+
+
+@timed('age_inventory')
+def age_inventory(df, as_of=None):
+    """Recompute df's day counts from its dates against as_of (default today), in place.
+
+    Rows whose date is missing or unreadable keep the day count they had, or
+    NaN when the column is new. Returns the day count columns that were aged.
+    """
+    as_of = as_of or date.today()
+    aged = []
+    for date_col, days_col in AGE_COLUMNS.items():
+        if date_col not in df.columns:
+            continue
+        days = days_since(df[date_col], as_of)
+        dated = ~np.isnan(days)
+        if not dated.any():
+            continue
+        if days_col in df.columns:
+            days = np.where(dated, days, df[days_col].to_numpy(dtype=np.float64, na_value=np.nan))
+        df[days_col] = days.astype(np.int64) if not np.isnan(days).any() else days
+        aged.append(days_col)
+    return aged
+
+
+def reage(df, as_of, thresholds=None):
+    """Copy of a processed frame aged to as_of, reclassified and re-forecast"""
+    frame = df.copy()
+    age_inventory(frame, as_of)
+    classify_inventory(frame, thresholds)
+    forecast_inventory(frame, as_of, thresholds)
+    return apply_schema(frame)
@@ -0,0 +1,285 @@
+import itertools
+import json
+from datetime import date
+
+from metrics import timed
+
+# ============== HEADLESS AUDIT API ==============
+# The upload pipeline over plain HTTP, for scripts and nightly jobs:
+#
+#   POST /api/audit           the classified rows, then the KPI summary
+#   POST /api/audit/summary   the KPI summary only, as JSON
+#
+# The body is the raw file (CSV, Parquet, Arrow or a sales event log), not a
+# base64 data URL. It is parsed off the request stream and each chunk is
+# written back out as soon as it is processed, so neither side holds the
+# whole file and the first rows go out while the rest is still arriving.
+#
+# Query parameters:
+#   as_of      YYYY-MM-DD date to age stock against (default today)
+#   format     ndjson (default) or arrow; Accept: application/vnd.apache.arrow.stream works too
+#   catalog    dataset ID of a loaded inventory, for a sales log without product columns
+#   moderate_days, slow_days, dead_days   classification thresholds
+#   label      name the audit is kept under in the history, e.g. the store (default "api")
+#
+# Each audit is also recorded as the history snapshot of its as_of date and
+# label (see history.py), so nightly jobs feed the dashboard's trend chart. It
+# replaces an earlier audit of the same date and label only once its summary
+# is written, so a stream that fails part way leaves the earlier one current.
+# NDJSON responses are one JSON object per row, then a last line
+# {"summary": {...}}. Arrow responses are an IPC stream of the rows whose
+# final, empty batch carries the summary JSON as "summary" custom metadata.
+# Bad input is a 400 with {"error": ...}; an error after rows have gone out
+# takes the summary's place.
+
+NDJSON = 'application/x-ndjson'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+# Thresholds that can be overridden from the query string
+THRESHOLD_PARAMS = ['moderate_days', 'slow_days', 'dead_days']
+
+
+class APIError(ValueError):
+    """A request the API refuses, with the HTTP status to answer it with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def request_options(args, headers):
+    """(as_of, thresholds, format) from a request's query string and headers"""
+    try:
+        as_of = date.fromisoformat(args['as_of']) if args.get('as_of') else date.today()
+    except ValueError:
+        raise APIError("as_of must be a YYYY-MM-DD date") from None
+    thresholds = {}
+    for name in THRESHOLD_PARAMS:
+        if args.get(name):
+            try:
+                thresholds[name] = int(args[name])
+            except ValueError:
+                raise APIError(f"{name} must be a whole number of days") from None
+    fmt = args.get('format') or ('arrow' if ARROW_STREAM in headers.get('Accept', '') else 'ndjson')
+    if fmt not in ('ndjson', 'arrow'):
+        raise APIError("format must be ndjson or arrow")
+    return as_of, thresholds or None, fmt
+
+
+def processed_chunks(stream, thresholds=None, as_of=None, catalog=None):
+    """Yield processed chunks of a raw file body as it is read; raises APIError on invalid rows"""
+    from ingest import inventory_chunks, iter_stream_chunks, open_stream, process_data
+    for chunk in inventory_chunks(iter_stream_chunks(open_stream(stream)), as_of=as_of, catalog=catalog):
+        chunk, error = process_data(chunk, thresholds, as_of)
+        if error:
+            raise APIError(error)
+        yield chunk
+
+
+def summary_record(summary, as_of=None):
+    """JSON-ready KPI summary: status and category totals plus the top-N tables the dashboard shows"""
+    from aggregate import TOP_DEAD_COLUMNS
+    from ranking import table_records
+    from schema import rounded_floats
+    return {
+        'as_of': as_of.isoformat() if as_of else None,
+        'rows': summary.rows,
+        'total_value': round(summary.total_value, 2),
+        'problem_count': int(summary.problem_count()),
+        'statuses': {status: {'count': int(row['count']), 'value': round(float(row['value']), 2)}
+                     for status, row in summary.status_totals().iterrows()},
+        'category_problem_value': {category: round(float(value), 2) for category, value in summary.category_problem().items()},
+        'top_priority': table_records(rounded_floats(summary.top_priority)),
+        'top_dead': rounded_floats(summary.top_dead.reindex(columns=TOP_DEAD_COLUMNS)).to_dict('records'),
+    }
+
+
+@timed('api_ndjson')
+def ndjson_rows(chunk):
+    """NDJSON bytes for one processed chunk, dates as YYYY-MM-DD"""
+    import numpy as np
+    import pandas as pd
+    from schema import rounded_floats
+    chunk = rounded_floats(chunk)
+    for col in chunk.columns:
+        if chunk[col].dtype.kind == 'M':
+            # Each distinct day is formatted once; code -1 (NaT) picks the trailing None
+            codes, days = pd.factorize(chunk[col])
+            chunk[col] = np.append(days.strftime('%Y-%m-%d').to_numpy(dtype=object), None)[codes]
+    text = chunk.to_json(orient='records')
+    # Splitting the array at row boundaries is much cheaper than lines=True; the
+    # count shows whether any "},{" came from inside a string instead
+    if text.count('},{') == len(chunk) - 1:
+        return text[1:-1].replace('},{', '}\n{').encode() + b'\n'
+    return chunk.to_json(orient='records', lines=True).encode()
+
+
+def arrow_schema(pa, table):
+    """A chunk's Arrow schema made the same for every chunk.
+
+    Chunks are downcast and dictionary-encoded independently, so one chunk's
+    int16 is another's int32; the stream carries int64, float64, string and
+    date32 columns instead.
+    """
+    fields = []
+    for field in table.schema:
+        kind = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+        if pa.types.is_integer(kind):
+            kind = pa.int64()
+        elif pa.types.is_floating(kind):
+            kind = pa.float64()
+        elif pa.types.is_timestamp(kind):
+            kind = pa.date32()
+        elif pa.types.is_null(kind):
+            kind = pa.string()
+        fields.append(pa.field(field.name, kind))
+    return pa.schema(fields)
+
+
+@timed('api_arrow')
+def arrow_table(pa, chunk, schema=None):
+    """One processed chunk as an Arrow table of schema (default: the chunk's own arrow_schema)"""
+    from schema import rounded_floats
+    table = pa.Table.from_pandas(rounded_floats(chunk), preserve_index=False)
+    schema = schema or arrow_schema(pa, table)
+    columns = [table.column(field.name).cast(field.type, safe=False) if field.name in table.column_names else pa.nulls(len(table), field.type)
+               for field in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def ndjson_body(chunks, as_of, on_summary=None):
+    """Response body: each chunk's rows, then the summary line; on_summary(summary) runs once all rows are out"""
+    from aggregate import InventorySummary, summarize
+    summary = InventorySummary.empty()
+    try:
+        for chunk in chunks:
+            summary = summary.merge(summarize(chunk))
+            yield ndjson_rows(chunk)
+        if on_summary is not None:
+            on_summary(summary)
+        tail = {'summary': summary_record(summary, as_of)}
+    except Exception as e:
+        tail = {'error': str(e)}
+    yield json.dumps(tail).encode() + b'\n'
+
+
+def arrow_body(chunks, as_of, on_summary=None):
+    """Response body: an Arrow IPC stream of the rows, summary in the last batch's metadata; see ndjson_body"""
+    import io
+    from aggregate import InventorySummary, summarize
+    from ingest import import_pyarrow
+    pa = import_pyarrow()
+    summary = InventorySummary.empty()
+    sink = io.BytesIO()
+    writer = schema = None
+
+    def take():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    try:
+        for chunk in chunks:
+            summary = summary.merge(summarize(chunk))
+            table = arrow_table(pa, chunk, schema)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_stream(sink, schema)
+            writer.write_table(table)
+            yield take()
+        if on_summary is not None:
+            on_summary(summary)
+        metadata = {'summary': json.dumps(summary_record(summary, as_of))}
+    except Exception as e:
+        if writer is None:
+            raise
+        metadata = {'error': str(e)}
+    writer.write_batch(pa.RecordBatch.from_pylist([], schema=schema), custom_metadata=metadata)
+    writer.close()
+    yield take()
+
+
+def recorded(chunks, history, snapshot_id):
+    """Pass chunks through, queuing each one's rows for a history snapshot"""
+    for chunk in chunks:
+        history.add_rows_later(snapshot_id, chunk)
+        yield chunk
+
+
+def install(server, datasets=None, history=None):
+    """Add the /api/audit routes to a Flask server.
+
+    datasets(dataset_id) looks up a catalog frame; audits are recorded in
+    history, a SnapshotStore, when one is given.
+    """
+    import sqlite3
+    from flask import Response, jsonify, request, stream_with_context
+
+    def begin_snapshot(as_of):
+        """Snapshot ID for this request's audit, None without a (writable) history"""
+        if history is None:
+            return None
+        try:
+            return history.begin(as_of, request.args.get('label', 'api'))
+        except sqlite3.Error:
+            return None
+
+    def finish_snapshot(snapshot_id, summary):
+        try:
+            history.finish(snapshot_id, summary)
+        except sqlite3.Error:
+            pass
+
+    def catalog():
+        dataset_id = request.args.get('catalog')
+        if not dataset_id:
+            return None
+        frame = datasets(dataset_id) if datasets is not None else None
+        if frame is None:
+            raise APIError(f"Unknown catalog dataset {dataset_id}", status=404)
+        return frame
+
+    @server.errorhandler(APIError)
+    def api_error(e):
+        return jsonify({'error': str(e)}), e.status
+
+    @server.route('/api/audit', methods=['POST'])
+    def audit():
+        as_of, thresholds, fmt = request_options(request.args, request.headers)
+        if fmt == 'arrow':
+            from ingest import import_pyarrow
+            try:
+                import_pyarrow()
+            except ImportError as e:
+                raise APIError(str(e), status=406) from None
+        chunks = processed_chunks(request.stream, thresholds, as_of, catalog())
+        # The first chunk is processed before answering, so bad files get a 400 rather than a broken stream
+        try:
+            first = next(chunks, None)
+        except APIError:
+            raise
+        except Exception as e:
+            raise APIError(str(e)) from e
+        if first is None:
+            raise APIError("No rows found")
+        chunks = itertools.chain([first], chunks)
+        snapshot_id = begin_snapshot(as_of)
+        on_summary = None
+        if snapshot_id is not None:
+            chunks = recorded(chunks, history, snapshot_id)
+            on_summary = lambda summary: finish_snapshot(snapshot_id, summary)
+        body = arrow_body if fmt == 'arrow' else ndjson_body
+        return Response(stream_with_context(body(chunks, as_of, on_summary)), mimetype=ARROW_STREAM if fmt == 'arrow' else NDJSON)
+
+    @server.route('/api/audit/summary', methods=['POST'])
+    def audit_summary():
+        from ingest import iter_stream_chunks, open_stream, process_chunks
+        as_of, thresholds, _ = request_options(request.args, request.headers)
+        summary, _, error = process_chunks(iter_stream_chunks(open_stream(request.stream)), thresholds, as_of=as_of, catalog=catalog())
+        if error:
+            raise APIError(error)
+        snapshot_id = begin_snapshot(as_of)
+        if snapshot_id is not None:
+            finish_snapshot(snapshot_id, summary)
+        return jsonify({'summary': summary_record(summary, as_of)})
@@ -1,20 +1,34 @@
 import dash
-from dash import dcc, html, dash_table, callback_context
+from dash import dcc, html, dash_table, callback_context, Patch
 from dash.dependencies import Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
-import base64
-import io
-from datetime import datetime, timedelta
+import plotly.graph_objects as go  # plotly loads its figure classes on first use
+from datetime import date, datetime, timedelta
+import functools
+import os
 import random
 
+# Only light modules at import time so a cold start can serve the layout quickly.
+# pandas, numpy and the pipeline modules built on them are imported inside the
+# functions that need them, on the first upload or demo load.
+from api import install as install_api
+from cache import cache_from_env
+from datastore import registry_from_env
+from export import install as install_export
+from history import history_from_env
+from jobs import CANCELLED, DONE, jobs_from_env
+from metrics import install as install_metrics, timed
+
 # ============== DATA GENERATOR (EMBEDDED) ==============
 
-def generate_spaza_inventory(num_products=120, seed=42):
+def generate_spaza_inventory(num_products=120, seed=42, thresholds=None):
     """Generate realistic Spaza Shop inventory data for Botswana"""
     
+    import numpy as np
+    import pandas as pd
+    from classification import classify_inventory
+    from forecast import forecast_inventory
+    from schema import apply_schema
+
     np.random.seed(seed)
     random.seed(seed)
     
@@ -226,25 +240,9 @@ def generate_spaza_inventory(num_products=120, seed=42):
     
     df = pd.DataFrame(products)
     
-    df['stock_status'] = df['days_since_last_sale'].apply(
-        lambda x: 'Dead Stock (6+ months)' if x > 180 else
-                  'Slow Moving (3-6 months)' if x > 90 else
-                  'Moderate (1-3 months)' if x > 30 else
-                  'Active (< 1 month)'
-    )
-    
-    df['urgency_score'] = df.apply(lambda row: min(
-        (row['days_since_last_sale'] / 5) +
-        (30 if row['stock_value'] > 500 else 20 if row['stock_value'] > 200 else 10 if row['stock_value'] > 50 else 0) +
-        (30 if row['holding_cost'] > 50 else 20 if row['holding_cost'] > 20 else 10 if row['holding_cost'] > 10 else 0),
-        100
-    ), axis=1)
-    
-    df['action_required'] = df['stock_status'].apply(
-        lambda x: 'Clearance Sale' if x == 'Dead Stock (6+ months)' else
-                  'Discount / Promote' if x == 'Slow Moving (3-6 months)' else
-                  'Monitor' if x == 'Moderate (1-3 months)' else 'Restock'
-    )
+    classify_inventory(df, thresholds)
+    forecast_inventory(df, end_date.date(), thresholds)
+    apply_schema(df)
     
     return df
 
@@ -260,6 +258,9 @@ dash_app = dash.Dash(
 # IMPORTANT: Expose server for Vercel
 server = dash_app.server
 
+# /metrics for Prometheus, plus Server-Timing headers with STOCKAUDIT_SERVER_TIMING=1 (see metrics.py)
+install_metrics(server)
+
 # Colors
 COLORS = {
     'dead': '#dc3545', 'slow': '#fd7e14', 'moderate': '#0dcaf0', 'active': '#198754',
@@ -285,6 +286,27 @@ CARD_STYLE = {
     'overflow': 'hidden'
 }
 
+# Processed uploads, keyed by content hash (see cache.py for STOCKAUDIT_CACHE settings)
+RESULT_CACHE = cache_from_env()
+
+# Processed frames; dcc.Store only carries their dataset ID (see datastore.py for settings)
+DATASETS = registry_from_env()
+
+# Uploads larger than this (base64 characters) are only aggregated, not kept row by row
+MAX_DATASET_UPLOAD_CHARS = 100 * 1024 * 1024
+
+# Background pool for heavy uploads (see jobs.py; STOCKAUDIT_JOB_WORKERS=0 processes everything in the request).
+# Jobs live in the worker process that took the upload, so job mode wants one gunicorn worker with several threads.
+JOBS = jobs_from_env()
+# Uploads larger than this (base64 characters) are processed as a background job
+BACKGROUND_UPLOAD_CHARS = 5 * 1024 * 1024
+
+# Every audit is kept as a dated snapshot for the trend chart (see history.py; STOCKAUDIT_HISTORY=off disables it)
+HISTORY = history_from_env()
+
+# POST /api/audit and /api/audit/summary: the same pipeline without the UI (see api.py)
+install_api(server, DATASETS.get, HISTORY)
+
 SECTION_HEADER_STYLE = {
     'fontSize': '18px', 'fontWeight': '600', 'color': COLORS['text_primary'],
     'marginBottom': '20px', 'display': 'flex', 'alignItems': 'center', 'gap': '10px'
@@ -317,90 +339,92 @@ dash_app.layout = html.Div([
     html.Div([
         html.Div([
             html.H2("Identify Dead Stock Instantly", style={'fontSize': '28px', 'fontWeight': '700', 'color': COLORS['text_primary'], 'marginBottom': '12px', 'textAlign': 'center'}),
-            html.P("Upload your inventory or load demo data to discover trapped cash.", style={'fontSize': '16px', 'color': COLORS['text_secondary'], 'textAlign': 'center', 'marginBottom': '24px'}),
+            html.P("Upload your inventory or a POS sales log, or load demo data to discover trapped cash.", style={'fontSize': '16px', 'color': COLORS['text_secondary'], 'textAlign': 'center', 'marginBottom': '24px'}),
             html.Div([
-                dcc.Upload(id='upload-data', children=html.Div(["📁 Upload CSV File"]), style={'padding': '14px 28px', 'background': COLORS['bg_page'], 'border': f'2px dashed {COLORS["border"]}', 'borderRadius': '10px', 'textAlign': 'center', 'cursor': 'pointer', 'fontSize': '14px', 'fontWeight': '500', 'color': COLORS['text_secondary']}, multiple=False),
+                dcc.Upload(id='upload-data', children=html.Div(["📁 Upload CSV / Parquet"]), style={'padding': '14px 28px', 'background': COLORS['bg_page'], 'border': f'2px dashed {COLORS["border"]}', 'borderRadius': '10px', 'textAlign': 'center', 'cursor': 'pointer', 'fontSize': '14px', 'fontWeight': '500', 'color': COLORS['text_secondary']}, multiple=False),
                 html.Span("or", style={'color': COLORS['text_muted'], 'fontSize': '14px', 'margin': '0 16px'}),
-                html.Button(["▶ Load Demo Data"], id='load-sample', style={'padding': '14px 28px', 'background': 'linear-gradient(135deg, #3b82f6 0%, #2563eb 100%)', 'color': 'white', 'border': 'none', 'borderRadius': '10px', 'fontSize': '14px', 'fontWeight': '600', 'cursor': 'pointer'})
+                html.Button(["▶ Load Demo Data"], id='load-sample', style={'padding': '14px 28px', 'background': 'linear-gradient(135deg, #3b82f6 0%, #2563eb 100%)', 'color': 'white', 'border': 'none', 'borderRadius': '10px', 'fontSize': '14px', 'fontWeight': '600', 'cursor': 'pointer'}),
+                dcc.Upload(id='upload-delta', children=html.Div(["➕ Apply Delta"]), style={'padding': '14px 20px', 'border': f'1px solid {COLORS["border"]}', 'borderRadius': '10px', 'textAlign': 'center', 'cursor': 'pointer', 'fontSize': '13px', 'color': COLORS['text_secondary']}, multiple=False)
             ], style={'display': 'flex', 'alignItems': 'center', 'justifyContent': 'center', 'flexWrap': 'wrap', 'gap': '10px'}),
+            html.Div([
+                html.Span("Age stock as of", style={'color': COLORS['text_muted'], 'fontSize': '13px', 'marginRight': '10px'}),
+                dcc.DatePickerSingle(id='as-of-date', placeholder='Today', display_format='DD/MM/YYYY', clearable=True)
+            ], style={'display': 'flex', 'alignItems': 'center', 'justifyContent': 'center', 'marginTop': '16px'}),
             html.Div(id='upload-status', style={'marginTop': '16px', 'textAlign': 'center'})
         ], style={'maxWidth': '600px', 'margin': '0 auto'})
     ], style={'padding': '48px 24px', 'background': COLORS['white']}),
     
     dcc.Store(id='inventory-data'),
+    dcc.Store(id='job-id'),
+    dcc.Interval(id='job-poll', interval=1000, disabled=True),
     html.Div(id='dashboard-content', style={'display': 'none'})
 ], style={'fontFamily': '-apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif', 'background': COLORS['bg_page'], 'minHeight': '100vh', 'margin': '0'})
 
 
 # ============== HELPERS ==============
 
-def parse_contents(contents, filename):
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    try:
-        return pd.read_csv(io.StringIO(decoded.decode('utf-8'))), None
-    except Exception as e:
-        return None, str(e)
-
-def process_data(df):
-    required = ['sku', 'product_name', 'category', 'unit_cost', 'current_stock']
-    missing = [c for c in required if c not in df.columns]
-    if missing:
-        return None, f"Missing: {', '.join(missing)}"
-    
-    if 'stock_value' not in df.columns:
-        df['stock_value'] = df['current_stock'] * df['unit_cost']
-    if 'days_since_last_sale' not in df.columns:
-        df['days_since_last_sale'] = 0
-    if 'stock_status' not in df.columns:
-        df['stock_status'] = df['days_since_last_sale'].apply(lambda x: 'Dead Stock (6+ months)' if x > 180 else 'Slow Moving (3-6 months)' if x > 90 else 'Moderate (1-3 months)' if x > 30 else 'Active (< 1 month)')
-    if 'urgency_score' not in df.columns:
-        df['urgency_score'] = 50
-    if 'holding_cost' not in df.columns:
-        df['holding_cost'] = 0
-    if 'action_required' not in df.columns:
-        df['action_required'] = 'Review'
-    return df, None
-
-def create_metric_card(icon, title, value, subtitle, color=None):
+def create_metric_card(icon, title, value, subtitle, color=None, card_id=None):
+    """KPI card; with card_id its value and subtitle get the IDs '<card_id>-value' and '<card_id>-subtitle'"""
+    ids = {'value': {'id': f'{card_id}-value'}, 'subtitle': {'id': f'{card_id}-subtitle'}} if card_id else {'value': {}, 'subtitle': {}}
     return html.Div([
         html.Div([html.Span(icon, style={'fontSize': '20px'})], style={'width': '48px', 'height': '48px', 'background': f'{color}15' if color else COLORS['bg_page'], 'borderRadius': '12px', 'display': 'flex', 'alignItems': 'center', 'justifyContent': 'center', 'marginBottom': '12px'}),
         html.P(title, style={'fontSize': '12px', 'color': COLORS['text_muted'], 'margin': '0 0 6px 0', 'fontWeight': '500', 'textTransform': 'uppercase'}),
-        html.H3(value, style={'fontSize': '24px', 'fontWeight': '700', 'color': color if color else COLORS['text_primary'], 'margin': '0 0 4px 0'}),
-        html.Span(subtitle, style={'fontSize': '12px', 'color': COLORS['text_secondary']})
+        html.H3(value, **ids['value'], style={'fontSize': '24px', 'fontWeight': '700', 'color': color if color else COLORS['text_primary'], 'margin': '0 0 4px 0'}),
+        html.Span(subtitle, **ids['subtitle'], style={'fontSize': '12px', 'color': COLORS['text_secondary']})
     ], style={**CARD_STYLE, 'padding': '20px'})
 
-def create_kpi_section(df):
-    dead = df[df['stock_status'] == 'Dead Stock (6+ months)']
-    slow = df[df['stock_status'] == 'Slow Moving (3-6 months)']
-    active = df[df['stock_status'] == 'Active (< 1 month)']
+KPI_CARDS = [
+    ('kpi-dead', "💀", "Dead Stock", COLORS['danger']),
+    ('kpi-slow', "🐌", "Slow Moving", COLORS['warning']),
+    ('kpi-active', "✅", "Active Stock", COLORS['success']),
+    ('kpi-total', "💰", "Total Value", COLORS['accent']),
+]
+
+@timed('kpi_values')
+def kpi_values(summary):
+    """(value, subtitle) text for each of KPI_CARDS"""
+    dead_value, dead_count = summary.status_total('Dead Stock (6+ months)')
+    slow_value, slow_count = summary.status_total('Slow Moving (3-6 months)')
+    active_value, active_count = summary.status_total('Active (< 1 month)')
+    return [
+        (f"P{dead_value:,.0f}", f"{dead_count} items"),
+        (f"P{slow_value:,.0f}", f"{slow_count} items"),
+        (f"P{active_value:,.0f}", f"{active_count} items"),
+        (f"P{summary.total_value:,.0f}", f"{summary.rows} products"),
+    ]
+
+def create_kpi_section(summary=None):
+    values = kpi_values(summary) if summary is not None else [("", "")] * len(KPI_CARDS)
     return html.Div([
-        create_metric_card("💀", "Dead Stock", f"P{dead['stock_value'].sum():,.0f}", f"{len(dead)} items", COLORS['danger']),
-        create_metric_card("🐌", "Slow Moving", f"P{slow['stock_value'].sum():,.0f}", f"{len(slow)} items", COLORS['warning']),
-        create_metric_card("✅", "Active Stock", f"P{active['stock_value'].sum():,.0f}", f"{len(active)} items", COLORS['success']),
-        create_metric_card("💰", "Total Value", f"P{df['stock_value'].sum():,.0f}", f"{len(df)} products", COLORS['accent'])
+        create_metric_card(icon, title, value, subtitle, color, card_id=card_id)
+        for (card_id, icon, title, color), (value, subtitle) in zip(KPI_CARDS, values)
     ], style={'display': 'grid', 'gridTemplateColumns': 'repeat(auto-fit, minmax(180px, 1fr))', 'gap': '16px', 'marginBottom': '24px'})
 
-def create_status_chart(df):
-    summary = df.groupby('stock_status')['stock_value'].sum().reset_index()
-    fig = go.Figure(data=[go.Pie(labels=summary['stock_status'], values=summary['stock_value'], hole=0.6, marker=dict(colors=[STATUS_COLORS.get(s, COLORS['secondary']) for s in summary['stock_status']]), textinfo='percent', hovertemplate="<b>%{label}</b><br>P%{value:,.0f}<extra></extra>")])
-    fig.update_layout(showlegend=True, legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5), margin=dict(t=20, b=60, l=20, r=20), height=300, paper_bgcolor='rgba(0,0,0,0)')
+# The status chart's layout never depends on the data, so updates only patch its traces
+STATUS_CHART_LAYOUT = dict(showlegend=True, legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5), margin=dict(t=20, b=60, l=20, r=20), height=300, paper_bgcolor='rgba(0,0,0,0)')
+
+@timed('create_status_chart')
+def create_status_chart(summary):
+    status = summary.status_totals()
+    fig = go.Figure(data=[go.Pie(labels=status.index, values=status['value'], hole=0.6, marker=dict(colors=[STATUS_COLORS.get(s, COLORS['secondary']) for s in status.index]), textinfo='percent', hovertemplate="<b>%{label}</b><br>P%{value:,.0f}<extra></extra>")])
+    fig.update_layout(**STATUS_CHART_LAYOUT)
     return fig
 
-def create_category_chart(df):
-    problem = df[df['stock_status'].isin(['Dead Stock (6+ months)', 'Slow Moving (3-6 months)'])]
-    if len(problem) == 0:
+@timed('create_category_chart')
+def create_category_chart(summary):
+    if summary.problem_count() == 0:
         fig = go.Figure()
         fig.add_annotation(text="No problem stock! 🎉", x=0.5, y=0.5, showarrow=False, font=dict(size=16))
         fig.update_layout(height=300, paper_bgcolor='rgba(0,0,0,0)')
         return fig
-    cat_summary = problem.groupby('category')['stock_value'].sum().sort_values(ascending=True).reset_index()
-    fig = go.Figure(go.Bar(y=cat_summary['category'], x=cat_summary['stock_value'], orientation='h', marker=dict(color=COLORS['danger'])))
+    cat_summary = summary.category_problem().sort_values(ascending=True)
+    fig = go.Figure(go.Bar(y=cat_summary.index, x=cat_summary.values, orientation='h', marker=dict(color=COLORS['danger'])))
     fig.update_layout(xaxis_title="Stock Value (P)", margin=dict(t=20, b=50, l=100, r=20), height=300, paper_bgcolor='rgba(0,0,0,0)')
     return fig
 
-def create_worst_products_chart(df):
-    dead = df[df['stock_status'] == 'Dead Stock (6+ months)'].nlargest(8, 'stock_value')
+@timed('create_worst_products_chart')
+def create_worst_products_chart(summary):
+    dead = summary.top_dead
     if len(dead) == 0:
         fig = go.Figure()
         fig.add_annotation(text="No dead stock! 🎉", x=0.5, y=0.5, showarrow=False, font=dict(size=16))
@@ -412,53 +436,562 @@ def create_worst_products_chart(df):
     fig.update_layout(xaxis_title="Stock Value (P)", margin=dict(t=20, b=50, l=160, r=60), height=320, paper_bgcolor='rgba(0,0,0,0)', yaxis=dict(autorange='reversed'))
     return fig
 
-def create_priority_table(df):
-    priority = df.nlargest(8, 'urgency_score')[['product_name', 'category', 'current_stock', 'stock_value', 'days_since_last_sale', 'action_required']].copy()
-    return dash_table.DataTable(data=priority.to_dict('records'), columns=[{'name': 'Product', 'id': 'product_name'}, {'name': 'Category', 'id': 'category'}, {'name': 'Stock', 'id': 'current_stock'}, {'name': 'Value (P)', 'id': 'stock_value', 'type': 'numeric', 'format': {'specifier': ',.0f'}}, {'name': 'Days Idle', 'id': 'days_since_last_sale'}, {'name': 'Action', 'id': 'action_required'}], style_table={'overflowX': 'auto'}, style_cell={'textAlign': 'left', 'padding': '12px', 'fontSize': '13px'}, style_header={'backgroundColor': COLORS['bg_page'], 'fontWeight': '600', 'fontSize': '11px', 'textTransform': 'uppercase'}, page_size=8)
+# Up to this many SKUs the scatter draws every point (WebGL); above it, it draws a fixed grid of bins
+SCATTER_MAX_POINTS = int(os.environ.get('STOCKAUDIT_SCATTER_POINTS', 5000))
+SCATTER_BINS = (60, 40)
+
+def _placeholder_figure(text):
+    fig = go.Figure()
+    fig.add_annotation(text=text, x=0.5, y=0.5, showarrow=False, font=dict(size=14))
+    fig.update_layout(height=360, paper_bgcolor='rgba(0,0,0,0)', xaxis=dict(visible=False), yaxis=dict(visible=False))
+    return fig
+
+@timed('create_sku_scatter')
+def create_sku_scatter(df, max_points=SCATTER_MAX_POINTS, bins=SCATTER_BINS):
+    """Days idle vs stock value per SKU; the payload is bounded by max_points or by the bin grid"""
+    import numpy as np
+
+    days = df['days_since_last_sale'].to_numpy(dtype=np.float64, na_value=np.nan)
+    # Log axis for value; stock worth under P1 (mostly sold out) sits on the bottom edge
+    value = np.maximum(df['stock_value'].to_numpy(dtype=np.float64, na_value=np.nan), 1.0)
+    valid = ~(np.isnan(days) | np.isnan(value))
+    layout = dict(xaxis_title="Days Since Last Sale", yaxis=dict(title="Stock Value (P)", type='log'), height=360,
+                  margin=dict(t=20, b=50, l=70, r=20), paper_bgcolor='rgba(0,0,0,0)',
+                  legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+
+    if valid.sum() <= max_points:
+        fig = go.Figure()
+        status = df['stock_status'].astype(str).to_numpy()
+        names = df['product_name'].astype(str).to_numpy()
+        for label, color in STATUS_COLORS.items():
+            rows = valid & (status == label)
+            if rows.any():
+                fig.add_trace(go.Scattergl(x=days[rows], y=value[rows], mode='markers', name=label.split(' (')[0], customdata=names[rows],
+                                           marker=dict(color=color, size=6, opacity=0.7),
+                                           hovertemplate="<b>%{customdata}</b><br>%{x} days idle<br>P%{y:,.0f}<extra></extra>"))
+        fig.update_layout(**layout)
+        return fig
+
+    # Server-side binning: counts on a fixed grid, so the figure is the same size for 10k or 10M SKUs
+    x_edges = np.linspace(0, max(np.nanmax(days[valid]), 1.0), bins[0] + 1)
+    y_edges = np.logspace(0, np.log10(max(np.nanmax(value[valid]), 10.0)), bins[1] + 1)
+    counts, _, _ = np.histogram2d(days[valid], value[valid], bins=(x_edges, y_edges))
+    z = np.where(counts.T > 0, counts.T, np.nan)
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2, y=np.sqrt(y_edges[:-1] * y_edges[1:]), z=z,
+        colorscale='YlOrRd', colorbar=dict(title='SKUs'),
+        hovertemplate="~%{x:.0f} days idle<br>~P%{y:,.0f}<br>%{z:,.0f} SKUs<extra></extra>"))
+    fig.update_layout(**layout)
+    fig.add_annotation(text=f"{int(valid.sum()):,} SKUs, binned", xref='paper', yref='paper', x=1, y=1.08, showarrow=False, font=dict(size=11, color=COLORS['text_muted']))
+    return fig
+
+def sku_scatter_figure(dataset_id):
+    """Scatter figure dict for a stored dataset, or None if it has no stored rows"""
+    try:
+        return _sku_scatter_figure(dataset_id)
+    except _NoRows:
+        return None
+
+@functools.lru_cache(maxsize=8)
+def _sku_scatter_figure(dataset_id):
+    """Built once per dataset ID"""
+    return create_sku_scatter(_stored_rows(dataset_id)).to_dict()
+
+@timed('create_trend_chart')
+def create_trend_chart(trend):
+    """Stacked stock value per status at each snapshot date, from SnapshotStore.status_trend"""
+    from classification import STATUS_LABELS
+    if len(trend) == 0:
+        return _placeholder_figure("No audit history yet: each upload is kept as a snapshot of its day")
+    fig = go.Figure()
+    for status in STATUS_LABELS:
+        rows = trend[trend['status'] == status]
+        fig.add_trace(go.Scatter(x=rows['taken'], y=rows['value'], customdata=rows['count'], name=status, mode='lines+markers', stackgroup='value',
+                                 line=dict(color=STATUS_COLORS[status]), hovertemplate="%{x}<br>P%{y:,.0f} • %{customdata:,} items<extra>" + status + "</extra>"))
+    fig.update_layout(yaxis_title="Stock Value (P)", xaxis=dict(type='date'), legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+                      margin=dict(t=20, b=60, l=60, r=20), height=320, paper_bgcolor='rgba(0,0,0,0)')
+    return fig
+
+# Equal to aggregate.TOP_N: a dataset's first page is its summary's top_priority, served without ranking the rows
+PRIORITY_PAGE_SIZE = 8
+
+PRIORITY_TABLE_COLUMNS = [{'name': 'Product', 'id': 'product_name'}, {'name': 'Category', 'id': 'category'}, {'name': 'Stock', 'id': 'current_stock', 'type': 'numeric'}, {'name': 'Value (P)', 'id': 'stock_value', 'type': 'numeric', 'format': {'specifier': ',.0f'}}, {'name': 'Days Idle', 'id': 'days_since_last_sale', 'type': 'numeric'}, {'name': 'Urgency', 'id': 'urgency_score', 'type': 'numeric', 'format': {'specifier': '.1f'}}, {'name': 'Action', 'id': 'action_required'}, {'name': 'Sells Out', 'id': 'sell_through_date', 'type': 'datetime'}, {'name': 'Dead By', 'id': 'dead_stock_date', 'type': 'datetime'}]
+
+def create_priority_table():
+    """Priority table; rows, paging, sorting and filtering all come from update_priority_table"""
+    return dash_table.DataTable(
+        id='priority-table', data=[], columns=PRIORITY_TABLE_COLUMNS,
+        page_action='custom', page_current=0, page_size=PRIORITY_PAGE_SIZE, page_count=1,
+        sort_action='custom', sort_mode='single', sort_by=[], filter_action='custom', filter_query='',
+        style_table={'overflowX': 'auto'}, style_cell={'textAlign': 'left', 'padding': '12px', 'fontSize': '13px'}, style_header={'backgroundColor': COLORS['bg_page'], 'fontWeight': '600', 'fontSize': '11px', 'textTransform': 'uppercase'})
+
+@timed('build_results')
+def build_results(summary, dataset_id=None, as_of=None, source=None):
+    """Render the figures for one processed inventory; this is what RESULT_CACHE stores.
+
+    Figures are kept as plain dicts so cache hits skip Plotly's validation on unpickle.
+    The rows themselves stay in DATASETS under dataset_id. as_of is the date the
+    rows were aged against, None when they have no dates to age from; source is
+    the dataset a re-aged one was derived from.
+    """
+    return {
+        'summary': summary,
+        'dataset_id': dataset_id,
+        'as_of': as_of.isoformat() if as_of else None,
+        'source': source,
+        'figures': {
+            'status': create_status_chart(summary).to_dict(),
+            'category': create_category_chart(summary).to_dict(),
+            'worst': create_worst_products_chart(summary).to_dict(),
+        },
+    }
+
+def resolve_dataset(dataset_id):
+    """Frame behind the dataset ID held in dcc.Store('inventory-data'), or None"""
+    return DATASETS.get(dataset_id)
+
+class _NoRows(LookupError):
+    """Raised rather than returning None from lru_cached builders, so a dataset stored after a miss is still found"""
+
+def _stored_rows(dataset_id):
+    df = resolve_dataset(dataset_id)
+    if df is None:
+        raise _NoRows(dataset_id)
+    return df
+
+def resolve_results(dataset_id):
+    """Summary and figures for a dataset ID, rebuilt from DATASETS if RESULT_CACHE lost them, else None.
+
+    Widget callbacks may land on a different worker than the upload did, so
+    multi-worker deployments need a shared cache or a write-through registry.
+    """
+    if not dataset_id:
+        return None
+    results = RESULT_CACHE.get(dataset_id)
+    if results is None:
+        df = resolve_dataset(dataset_id)
+        if df is None:
+            return None
+        from aggregate import summarize
+        results = build_results(summarize(df), dataset_id)
+        RESULT_CACHE.set(dataset_id, results)
+    return results
+
+@functools.lru_cache(maxsize=1)
+def demo_inventory(day):
+    """Demo inventory, generated at most once per process and day (stock is aged against datetime.now())"""
+    return generate_spaza_inventory()  # Now uses embedded function
+
+def load_demo_results(day):
+    """Processed demo inventory and figures; RESULT_CACHE lets other workers reuse a demo one of them built"""
+    from aggregate import summarize
+    from cache import cache_key
+    key = cache_key(day.isoformat().encode(), namespace='demo')
+    if key not in DATASETS:
+        DATASETS.put(key, demo_inventory(day))
+    results = RESULT_CACHE.get(key)
+    if results is None:
+        results = build_results(summarize(demo_inventory(day)), key, as_of=day)
+        RESULT_CACHE.set(key, results)
+    return results
+
+def cached_upload_results(key):
+    """Cached results for an upload key, or None if they or their rows are gone"""
+    results = RESULT_CACHE.get(key)
+    if results is not None and results['dataset_id'] and results['dataset_id'] not in DATASETS:
+        return None  # Rows were dropped from the registry; rebuild them
+    return results
+
+def upload_key(contents, dataset_id):
+    """(cache key, catalog dataset ID) of an upload.
+
+    A sales log without product columns is joined onto the loaded inventory,
+    so its key depends on that inventory too.
+    """
+    from cache import cache_key
+    from events import needs_catalog
+    from ingest import upload_columns
+    try:
+        columns = upload_columns(contents) if dataset_id else []
+    except Exception:
+        # Unreadable (empty, not UTF-8, ...): stream_upload reports why through the usual status
+        columns = []
+    if dataset_id and needs_catalog(columns):
+        return cache_key(contents, namespace=f'events:{dataset_id}'), dataset_id
+    return cache_key(contents), None
+
+def load_upload_results(key, contents, filename, progress=None, catalog_id=None):
+    """Process an upload and cache its results under key; returns (results, error)"""
+    from aging import has_dates
+    from ingest import stream_upload
+    day = date.today()
+    catalog = resolve_dataset(catalog_id) if catalog_id else None
+    if catalog_id and catalog is None:
+        return None, "The inventory this sales log applies to is no longer loaded; upload it again"
+    summary, df, error = stream_upload(contents, filename, keep_frame=len(contents) <= MAX_DATASET_UPLOAD_CHARS, progress=progress, as_of=day, catalog=catalog)
+    if error:
+        return None, error
+    if df is None:
+        results = build_results(summary)
+    else:
+        results = build_results(summary, DATASETS.put(key, df), as_of=day if has_dates(df) else None)
+    RESULT_CACHE.set(key, results)
+    record_history(summary, df, day, filename, key)
+    return results, None
+
+def record_history(summary, df, day, label, dataset_id):
+    """Snapshot an audit into HISTORY; best effort, an unwritable store never fails an upload"""
+    import sqlite3
+    if HISTORY is None:
+        return
+    try:
+        HISTORY.record(summary, df, taken=day, label=label, dataset=dataset_id)
+    except sqlite3.Error:
+        pass
+
+def history_label(dataset_id):
+    """Label the dataset's audits are recorded under, None when it was never recorded (demo data)"""
+    import sqlite3
+    if HISTORY is None or not dataset_id:
+        return None
+    try:
+        return HISTORY.label_of(dataset_id)
+    except sqlite3.Error:
+        return None
+
+def upload_job(job, key, contents, filename, catalog_id=None):
+    """Background job body: results are left in RESULT_CACHE, the job's result is the dataset ID"""
+    results, error = load_upload_results(key, contents, filename, progress=job.report, catalog_id=catalog_id)
+    if error:
+        raise ValueError(error)
+    return key
+
+def job_status(job):
+    """upload-status content for a queued or running job, with its cancel button"""
+    text = "⏳ Queued…" if job.started is None else f"⏳ Processing… {job.rows:,} rows ({job.elapsed:.0f}s)"
+    return html.Span([
+        html.Span(text, style={'color': COLORS['text_secondary']}),
+        html.Button("✕ Cancel", id='cancel-job', style={'marginLeft': '12px', 'padding': '4px 12px', 'border': f'1px solid {COLORS["border"]}', 'borderRadius': '8px', 'background': COLORS['white'], 'cursor': 'pointer', 'fontSize': '12px'})
+    ])
+
+@functools.lru_cache(maxsize=4)
+def sku_index(dataset_id):
+    """sku lookup of a stored dataset, built once however many deltas are applied to it"""
+    import pandas as pd
+    return pd.Index(resolve_dataset(dataset_id)['sku'])
+
+def load_delta_results(dataset_id, contents, day):
+    """Merge a delta upload into a stored dataset; returns (new dataset ID, results, error)"""
+    from cache import cache_key
+    from delta import apply_delta, parse_delta
+    key = cache_key(contents, namespace=f'delta:{dataset_id}:{day.isoformat()}')
+    results = RESULT_CACHE.get(key)
+    if results is not None and key in DATASETS:
+        return key, results, None
+    base = resolve_results(dataset_id)
+    df = resolve_dataset(dataset_id)
+    if base is None or df is None:
+        return None, None, "Load a full inventory before applying a delta"
+    delta, error = parse_delta(contents)
+    if error:
+        return None, None, error
+    frame, summary, changed, error = apply_delta(df, base['summary'], delta, as_of=day, sku_index=sku_index(dataset_id))
+    if error:
+        return None, None, error
+    from aging import has_dates
+    results = build_results(summary, DATASETS.put(key, frame), as_of=day if has_dates(frame) else None)
+    RESULT_CACHE.set(key, results)
+    # A delta updates the same store, so it continues the trend of the file it was applied to
+    record_history(summary, frame, day, history_label(dataset_id) or 'delta', key)
+    return key, results, None
 
+def load_aged_results(dataset_id, day):
+    """(dataset ID, results) of a stored dataset aged to day, re-aged from its rows without re-parsing the upload.
 
-# ============== CALLBACK ==============
+    Re-aged datasets are derived from the dataset they came from, so moving
+    the as-of date back and forth never chains copies. Datasets without dates
+    or stored rows are returned as they are.
+    """
+    results = resolve_results(dataset_id)
+    if results is None or results.get('as_of') == day.isoformat():
+        return dataset_id, results
+    source = results.get('source') or dataset_id
+    if source != dataset_id:
+        source_results = resolve_results(source)
+        if source_results is not None and source_results.get('as_of') == day.isoformat():
+            return source, source_results
+    from aging import has_dates
+    df = resolve_dataset(source)
+    if df is None or not has_dates(df):
+        return dataset_id, results
+    from aggregate import summarize
+    from aging import reage
+    from cache import cache_key
+    key = cache_key(source.encode(), namespace=f'asof:{day.isoformat()}')
+    aged = RESULT_CACHE.get(key)
+    if aged is None or key not in DATASETS:
+        frame = reage(df, day)
+        aged = build_results(summarize(frame), DATASETS.put(key, frame), as_of=day, source=source)
+        RESULT_CACHE.set(key, aged)
+    return key, aged
+
+def as_of_day(value):
+    """date picked in the as-of picker, today when it is cleared"""
+    return date.fromisoformat(value[:10]) if value else date.today()
+
+def create_dashboard():
+    """Dashboard skeleton with a stable ID on every widget; the callbacks below fill it per dataset"""
+    return html.Div([
+        html.Div([
+            create_kpi_section(),
+            html.Div([
+                html.Div([html.H3("📈 Stock Distribution", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(id='status-chart', figure={'data': [], 'layout': STATUS_CHART_LAYOUT}, config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px'}),
+                html.Div([html.H3("📦 Problem by Category", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(id='category-chart', config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px'})
+            ], style={'display': 'grid', 'gridTemplateColumns': 'repeat(auto-fit, minmax(350px, 1fr))', 'gap': '20px', 'marginBottom': '20px'}),
+            html.Div([html.H3("🔥 Top Dead Stock Items", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(id='worst-chart', config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px', 'marginBottom': '20px'}),
+            html.Div([html.H3("🔎 Days Idle vs Stock Value", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(id='sku-chart', config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px', 'marginBottom': '20px'}),
+            html.Div([
+                html.Div([
+                    html.H3("📅 Stock Trend", style={'fontSize': '16px', 'margin': '0'}),
+                    dcc.Dropdown(id='trend-category', options=[], placeholder="All categories", clearable=True, style={'width': '240px', 'fontSize': '13px'})
+                ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'marginBottom': '16px'}),
+                dcc.Graph(id='trend-chart', config={'displayModeBar': False})
+            ], style={**CARD_STYLE, 'padding': '20px', 'marginBottom': '20px'}),
+            html.Div([
+                html.Div([
+                    html.H3("🎯 Priority Actions", style={'fontSize': '16px', 'margin': '0'}),
+                    html.Div(id='export-links', style={'display': 'flex', 'alignItems': 'center', 'gap': '8px', 'flexWrap': 'wrap', 'fontSize': '13px'})
+                ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'flexWrap': 'wrap', 'gap': '10px', 'marginBottom': '16px'}),
+                create_priority_table()
+            ], style={**CARD_STYLE, 'padding': '20px', 'marginBottom': '20px'}),
+            html.Div([html.Span("📦 StockAudit • Spaza Shop Edition • Made for Botswana 🇧🇼", style={'color': COLORS['text_muted'], 'fontSize': '13px'})], style={'textAlign': 'center', 'padding': '20px'})
+        ], style={'maxWidth': '1200px', 'margin': '0 auto', 'padding': '24px'})
+    ], style={'background': COLORS['bg_page']})
+
+# Built once; callbacks only ever update the widgets inside it
+dash_app.layout['dashboard-content'].children = create_dashboard()
+
+# ============== CALLBACKS ==============
+# update_dashboard only ingests and publishes a dataset ID; every widget has its
+# own callback keyed off that ID, so each one recomputes and re-sends only itself.
 
 @dash_app.callback(
-    [Output('inventory-data', 'data'), Output('upload-status', 'children'), Output('dashboard-content', 'style'), Output('dashboard-content', 'children')],
-    [Input('upload-data', 'contents'), Input('load-sample', 'n_clicks')],
-    [State('upload-data', 'filename')]
+    [Output('inventory-data', 'data'), Output('upload-status', 'children'), Output('dashboard-content', 'style'), Output('job-id', 'data'), Output('job-poll', 'disabled')],
+    [Input('upload-data', 'contents'), Input('load-sample', 'n_clicks'), Input('upload-delta', 'contents'), Input('as-of-date', 'date')],
+    [State('upload-data', 'filename'), State('inventory-data', 'data')]
 )
-def update_dashboard(contents, n_clicks, filename):
+@timed('update_dashboard')
+def update_dashboard(contents, n_clicks, delta_contents, as_of_date, filename, dataset_id):
     ctx = callback_context
     if not ctx.triggered:
-        return None, "", {'display': 'none'}, None
+        return None, "", {'display': 'none'}, None, True
     
     trigger = ctx.triggered[0]['prop_id'].split('.')[0]
+    day = as_of_day(as_of_date)
     
-    if trigger == 'load-sample' and n_clicks:
-        df = generate_spaza_inventory()  # Now uses embedded function
+    if trigger == 'as-of-date':
+        key, results = load_aged_results(dataset_id, day)
+        if results is None or key == dataset_id:
+            return [dash.no_update] * 5  # Nothing loaded, or nothing to re-age
+        status = html.Span(f"✓ Aged as of {day.strftime('%d/%m/%Y')}", style={'color': COLORS['success']})
+    elif trigger == 'load-sample' and n_clicks:
+        key, results = load_aged_results(load_demo_results(date.today())['dataset_id'], day)
         status = html.Span("✓ Demo data loaded", style={'color': COLORS['success']})
     elif trigger == 'upload-data' and contents:
-        df, error = parse_contents(contents, filename)
+        key, catalog_id = upload_key(contents, dataset_id)
+        results = cached_upload_results(key)
+        if results is None and JOBS is not None and len(contents) > BACKGROUND_UPLOAD_CHARS:
+            # Hand off to the job pool; poll_job publishes the dataset ID when it is done
+            job = JOBS.submit(key, upload_job, key, contents, filename, catalog_id)
+            return dash.no_update, job_status(job), dash.no_update, job.id, False
+        if results is None:
+            results, error = load_upload_results(key, contents, filename, catalog_id=catalog_id)
+            if error:
+                return None, html.Span(f"✗ {error}", style={'color': COLORS['danger']}), {'display': 'none'}, None, True
+        # A cached upload was aged on the day it was processed
+        key, results = load_aged_results(key, day)
+        status = html.Span(f"✓ Loaded {results['summary'].rows} products", style={'color': COLORS['success']})
+    elif trigger == 'upload-delta' and delta_contents:
+        key, results, error = load_delta_results(dataset_id, delta_contents, day)
         if error:
-            return None, html.Span(f"✗ {error}", style={'color': COLORS['danger']}), {'display': 'none'}, None
-        df, error = process_data(df)
-        if error:
-            return None, html.Span(f"✗ {error}", style={'color': COLORS['danger']}), {'display': 'none'}, None
-        status = html.Span(f"✓ Loaded {len(df)} products", style={'color': COLORS['success']})
+            # Keep showing the current audit; the delta was not applied
+            return dash.no_update, html.Span(f"✗ {error}", style={'color': COLORS['danger']}), dash.no_update, dash.no_update, dash.no_update
+        status = html.Span(f"✓ Delta applied • {results['summary'].rows} products", style={'color': COLORS['success']})
     else:
-        return None, "", {'display': 'none'}, None
-    
-    dashboard = html.Div([
-        html.Div([
-            create_kpi_section(df),
-            html.Div([
-                html.Div([html.H3("📈 Stock Distribution", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(figure=create_status_chart(df), config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px'}),
-                html.Div([html.H3("📦 Problem by Category", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(figure=create_category_chart(df), config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px'})
-            ], style={'display': 'grid', 'gridTemplateColumns': 'repeat(auto-fit, minmax(350px, 1fr))', 'gap': '20px', 'marginBottom': '20px'}),
-            html.Div([html.H3("🔥 Top Dead Stock Items", style={'fontSize': '16px', 'marginBottom': '16px'}), dcc.Graph(figure=create_worst_products_chart(df), config={'displayModeBar': False})], style={**CARD_STYLE, 'padding': '20px', 'marginBottom': '20px'}),
-            html.Div([html.H3("🎯 Priority Actions", style={'fontSize': '16px', 'marginBottom': '16px'}), create_priority_table(df)], style={**CARD_STYLE, 'padding': '20px', 'marginBottom': '20px'}),
-            html.Div([html.Span("📦 StockAudit • Spaza Shop Edition • Made for Botswana 🇧🇼", style={'color': COLORS['text_muted'], 'fontSize': '13px'})], style={'textAlign': 'center', 'padding': '20px'})
-        ], style={'maxWidth': '1200px', 'margin': '0 auto', 'padding': '24px'})
-    ], style={'background': COLORS['bg_page']})
+        return None, "", {'display': 'none'}, None, True
     
-    return df.to_json(), status, {'display': 'block'}, dashboard
+    # Summary-only uploads have no rows in DATASETS, but their results are cached under the same key
+    return key, status, {'display': 'block'}, None, True
+
+
+@dash_app.callback(
+    [Output('inventory-data', 'data', allow_duplicate=True), Output('upload-status', 'children', allow_duplicate=True),
+     Output('dashboard-content', 'style', allow_duplicate=True), Output('job-poll', 'disabled', allow_duplicate=True)],
+    [Input('job-poll', 'n_intervals')],
+    [State('job-id', 'data'), State('as-of-date', 'date')],
+    prevent_initial_call=True
+)
+def poll_job(n_intervals, job_id, as_of_date):
+    job = JOBS.get(job_id) if JOBS is not None and job_id else None
+    if job is None:
+        return dash.no_update, html.Span("✗ Upload job was lost; please upload again", style={'color': COLORS['danger']}), dash.no_update, True
+    if job.active:
+        return dash.no_update, job_status(job), dash.no_update, False
+    if job.state == DONE:
+        key, results = load_aged_results(job.result, as_of_day(as_of_date))
+        rows = results['summary'].rows if results is not None else job.rows
+        return key, html.Span(f"✓ Loaded {rows} products in {job.elapsed:.0f}s", style={'color': COLORS['success']}), {'display': 'block'}, True
+    if job.state == CANCELLED:
+        return dash.no_update, html.Span("Upload cancelled", style={'color': COLORS['text_secondary']}), dash.no_update, True
+    return None, html.Span(f"✗ {job.error}", style={'color': COLORS['danger']}), {'display': 'none'}, True
+
+
+@dash_app.callback(
+    Output('upload-status', 'children', allow_duplicate=True),
+    [Input('cancel-job', 'n_clicks')],
+    [State('job-id', 'data')],
+    prevent_initial_call=True
+)
+def cancel_job(n_clicks, job_id):
+    if not n_clicks or JOBS is None or not job_id:
+        return dash.no_update
+    JOBS.cancel(job_id)
+    return html.Span("Cancelling…", style={'color': COLORS['text_secondary']})
+
+
+@dash_app.callback(
+    [Output(f'{card_id}-{part}', 'children') for card_id, *_ in KPI_CARDS for part in ('value', 'subtitle')],
+    [Input('inventory-data', 'data')],
+    prevent_initial_call=True
+)
+def update_kpis(dataset_id):
+    results = resolve_results(dataset_id)
+    if results is None:
+        return [dash.no_update] * (2 * len(KPI_CARDS))
+    return [text for pair in kpi_values(results['summary']) for text in pair]
+
+
+@dash_app.callback(Output('status-chart', 'figure'), [Input('inventory-data', 'data')], prevent_initial_call=True)
+def update_status_chart(dataset_id):
+    results = resolve_results(dataset_id)
+    if results is None:
+        return dash.no_update
+    patch = Patch()
+    patch['data'] = results['figures']['status']['data']
+    return patch
+
+
+@dash_app.callback(Output('category-chart', 'figure'), [Input('inventory-data', 'data')], prevent_initial_call=True)
+def update_category_chart(dataset_id):
+    results = resolve_results(dataset_id)
+    return dash.no_update if results is None else results['figures']['category']
+
+
+@dash_app.callback(Output('worst-chart', 'figure'), [Input('inventory-data', 'data')], prevent_initial_call=True)
+def update_worst_chart(dataset_id):
+    results = resolve_results(dataset_id)
+    return dash.no_update if results is None else results['figures']['worst']
+
+
+@dash_app.callback(Output('sku-chart', 'figure'), [Input('inventory-data', 'data')], prevent_initial_call=True)
+def update_sku_chart(dataset_id):
+    if not dataset_id:
+        return dash.no_update
+    figure = sku_scatter_figure(dataset_id)
+    if figure is None:
+        # Summary-only uploads keep no rows to plot
+        return _placeholder_figure("Per-SKU view is not available for uploads this large")
+    return figure
+
+
+@dash_app.callback([Output('trend-chart', 'figure'), Output('trend-category', 'options')], [Input('inventory-data', 'data'), Input('trend-category', 'value')], prevent_initial_call=True)
+def update_trend_chart(dataset_id, category):
+    # Keyed off the dataset ID too, so a new upload's snapshot shows up as soon as it is loaded.
+    # An uploaded file charts its own label's snapshots; demo data charts every store together.
+    if HISTORY is None:
+        return _placeholder_figure("Audit history is turned off (STOCKAUDIT_HISTORY=off)"), []
+    label = history_label(dataset_id)
+    return create_trend_chart(HISTORY.status_trend(category, label=label)), HISTORY.categories(label)
+
+
+def priority_order(dataset_id, sort_key=(), filter_query=''):
+    """Row positions of a stored dataset for one sort/filter, or None if it has no stored rows"""
+    try:
+        return _priority_order(dataset_id, sort_key, filter_query)
+    except _NoRows:
+        return None
+
+@functools.lru_cache(maxsize=16)
+@timed('priority_order')
+def _priority_order(dataset_id, sort_key, filter_query):
+    """Row positions computed once per sort/filter and then sliced per page.
+
+    Dataset IDs are content hashes, so a cached ordering never goes stale.
+    """
+    df = _stored_rows(dataset_id)
+    from ranking import rank_positions
+    base = _priority_order(dataset_id, (), '') if sort_key or filter_query else None
+    sort_by = [{'column_id': column, 'direction': direction} for column, direction in sort_key]
+    return rank_positions(df, sort_by, filter_query, base_order=base)
+
+# GET /export/<dataset_id>/<view>.<fmt>: streamed CSV, Parquet and Excel downloads (see export.py)
+install_export(server, resolve_dataset, priority_order)
+
+@dash_app.callback(
+    [Output('priority-table', 'data'), Output('priority-table', 'page_count'), Output('priority-table', 'page_current'),
+     Output('priority-table', 'sort_by'), Output('priority-table', 'filter_query')],
+    [Input('inventory-data', 'data'), Input('priority-table', 'page_current'), Input('priority-table', 'page_size'),
+     Input('priority-table', 'sort_by'), Input('priority-table', 'filter_query')],
+    prevent_initial_call=True
+)
+@timed('update_priority_table')
+def update_priority_table(dataset_id, page_current, page_size, sort_by, filter_query):
+    triggered = {t['prop_id'] for t in callback_context.triggered}
+    if 'inventory-data.data' in triggered:
+        # New dataset: its first page is the summary's top_priority, no ordering needed yet
+        results = resolve_results(dataset_id)
+        if results is None:
+            return [], 1, 0, [], ''
+        summary = results['summary']
+        pages = max(1, -(-summary.rows // PRIORITY_PAGE_SIZE)) if results['dataset_id'] else 1
+        from ranking import table_records
+        return table_records(summary.top_priority), pages, 0, [], ''
+
+    sort_key = tuple((s['column_id'], s['direction']) for s in sort_by or [])
+    # A new sort or filter starts again from the first page
+    if triggered & {'priority-table.sort_by', 'priority-table.filter_query'}:
+        page_current = 0
+    try:
+        positions = priority_order(dataset_id, sort_key, (filter_query or '').strip())
+    except ValueError:
+        return [], 1, 0, dash.no_update, dash.no_update  # Unreadable filter: show nothing rather than everything
+    if positions is None:
+        return [dash.no_update] * 5  # Summary-only upload: only the top rows exist
+    from ranking import page_records
+    page_size = page_size or PRIORITY_PAGE_SIZE
+    page_current = page_current or 0
+    return page_records(resolve_dataset(dataset_id), positions, page_current, page_size), max(1, -(-len(positions) // page_size)), page_current, dash.no_update, dash.no_update
+
+
+EXPORT_LABELS = {'audit': "Full audit", 'priority': "Priority list"}
+EXPORT_FORMAT_LABELS = {'csv': "CSV", 'parquet': "Parquet", 'xlsx': "Excel"}
+EXPORT_LINK_STYLE = {'padding': '4px 10px', 'border': f'1px solid {COLORS["border"]}', 'borderRadius': '6px', 'color': COLORS['accent'], 'textDecoration': 'none', 'fontWeight': '500'}
+
+@dash_app.callback(Output('export-links', 'children'), [Input('inventory-data', 'data'), Input('priority-table', 'sort_by'), Input('priority-table', 'filter_query')], prevent_initial_call=True)
+def update_export_links(dataset_id, sort_by, filter_query):
+    # Plain links to the streaming route rather than dcc.Download, which would
+    # send the whole file base64-encoded inside a callback response
+    df = resolve_dataset(dataset_id) if dataset_id else None
+    if df is None:
+        return []  # Summary-only uploads keep no rows to export
+    from export import EXCEL_MAX_ROWS, export_formats, export_url
+    formats = [fmt for fmt in export_formats() if fmt != 'xlsx' or len(df) <= EXCEL_MAX_ROWS]
+    links = []
+    for view, label in EXPORT_LABELS.items():
+        links.append(html.Span(f"⬇ {label}", style={'color': COLORS['text_secondary'], 'marginLeft': '8px' if links else '0'}))
+        links += [html.A(EXPORT_FORMAT_LABELS[fmt], href=export_url(dataset_id, view, fmt, sort_by, (filter_query or '').strip()), download='', style=EXPORT_LINK_STYLE)
+                  for fmt in formats]
+    return links
 
 
 # ============== FOR VERCEL ==============
@@ -0,0 +1,140 @@
+"""
+Multi-store batch audit.
+
+    python batch.py stores/ --out audit/ --workers 8
+
+Every CSV, Parquet or Arrow file in the directory is one store, named after
+the file. Stores are audited in parallel and the consolidated tables are
+written to the output directory.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from aggregate import DEAD_STATUS, InventorySummary
+from ingest import DEFAULT_CHUNKSIZE, iter_file_chunks, process_chunks
+
+STORE_EXTENSIONS = ('.csv', '.parquet', '.arrow', '.feather')
+STORE_TABLE_COLUMNS = ['store', 'products', 'stock_value', 'dead_value', 'dead_count', 'slow_value', 'slow_count', 'dead_share_pct', 'seconds', 'error']
+
+
+def find_store_files(directory):
+    """{store name: path} for the inventory files in directory"""
+    stores = {}
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in STORE_EXTENSIONS:
+            stores[stem] = os.path.join(directory, name)
+    return stores
+
+
+def audit_store(store, path, thresholds=None, out_dir=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Audit one store's file; runs in a worker process
+    - Only the InventorySummary travels back to the parent, so IPC cost does not grow with the file
+    - With out_dir the processed rows are written to <out_dir>/stores/<store>.parquet by the worker itself
+    """
+    start = time.perf_counter()
+    summary, df, error = process_chunks(iter_file_chunks(path, chunksize), thresholds, keep_frame=out_dir is not None)
+    if df is not None:
+        os.makedirs(os.path.join(out_dir, 'stores'), exist_ok=True)
+        df.to_parquet(os.path.join(out_dir, 'stores', f"{store}.parquet"), index=False)
+    return {'store': store, 'summary': summary, 'error': error, 'seconds': time.perf_counter() - start}
+
+
+def audit_stores(directory, workers=None, thresholds=None, out_dir=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Audit every store file in directory with a process pool; returns the per-store results by store name"""
+    stores = find_store_files(directory)
+    # Largest files first so one big store does not start last and hold up the batch
+    order = sorted(stores, key=lambda s: os.path.getsize(stores[s]), reverse=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(audit_store, store, stores[store], thresholds, out_dir, chunksize) for store in order]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['store']] = result
+    return {store: results[store] for store in stores}
+
+
+def store_table(results):
+    """One row per store: products, total value, dead and slow-moving stock, audit time"""
+    rows = []
+    for store, result in results.items():
+        summary = result['summary']
+        if summary is None:
+            rows.append({'store': store, 'error': result['error']})
+            continue
+        dead_value, dead_count = summary.status_total(DEAD_STATUS)
+        slow_value, slow_count = summary.status_total('Slow Moving (3-6 months)')
+        rows.append({
+            'store': store, 'products': summary.rows, 'stock_value': summary.total_value,
+            'dead_value': dead_value, 'dead_count': dead_count, 'slow_value': slow_value, 'slow_count': slow_count,
+            'dead_share_pct': 100 * dead_value / summary.total_value if summary.total_value else 0.0,
+            'seconds': result['seconds'], 'error': None,
+        })
+    return pd.DataFrame(rows, columns=STORE_TABLE_COLUMNS).set_index('store')
+
+
+def store_category_matrix(results, status=DEAD_STATUS, measure='value'):
+    """Stores x categories table of one status's stock value (or count, with measure='count')"""
+    columns = {}
+    for store, result in results.items():
+        summary = result['summary']
+        if summary is None:
+            continue
+        if status not in summary.status_labels:
+            columns[store] = pd.Series(dtype=np.float64)
+            continue
+        row = getattr(summary, measure)[summary.status_labels.index(status)]
+        series = pd.Series(row, index=summary.category_labels)
+        columns[store] = series[series.index.notna()]
+    matrix = pd.DataFrame(columns).T.fillna(0)
+    matrix = matrix[sorted(matrix.columns)]
+    return matrix.astype(np.int64) if measure == 'count' else matrix
+
+
+def consolidated_summary(results):
+    """All stores' summaries merged into one InventorySummary"""
+    summary = InventorySummary.empty()
+    for result in results.values():
+        if result['summary'] is not None:
+            summary = summary.merge(result['summary'])
+    return summary
+
+
+def write_report(results, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    store_table(results).to_csv(os.path.join(out_dir, 'stores.csv'))
+    store_category_matrix(results).to_csv(os.path.join(out_dir, 'dead_stock_value_by_store_category.csv'))
+    store_category_matrix(results, measure='count').to_csv(os.path.join(out_dir, 'dead_stock_count_by_store_category.csv'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help="directory of per-store inventory files")
+    parser.add_argument('--out', default='audit', help="where the consolidated tables and per-store rows go")
+    parser.add_argument('--workers', type=int, help="worker processes, defaults to the CPU count")
+    parser.add_argument('--no-rows', action='store_true', help="skip writing each store's processed rows")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = audit_stores(args.directory, args.workers, out_dir=None if args.no_rows else args.out)
+    write_report(results, args.out)
+    elapsed = time.perf_counter() - start
+
+    table = store_table(results)
+    failed = table['error'].notna()
+    total = consolidated_summary(results)
+    print(f"✅ Audited {len(table) - failed.sum()} stores, {total.rows:,} products in {elapsed:.1f}s ({total.rows / elapsed:,.0f} rows/s)")
+    print(f"💀 Dead stock across stores: P{total.status_total(DEAD_STATUS)[0]:,.2f}")
+    for store, error in table.loc[failed, 'error'].items():
+        print(f"✗ {store}: {error}")
+    print(f"📁 Reports in {args.out}")
+
+
+if __name__ == '__main__':
+    main()
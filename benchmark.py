@@ -0,0 +1,745 @@
+"""
+Throughput benchmarks for the Dead Stock Audit pipeline.
+
+    python benchmark.py classification --sizes 1e3 1e4 1e5 1e6 1e7
+    python benchmark.py schema --sizes 5e5
+    python benchmark.py aggregation --sizes 1e4 1e5 1e6
+    python benchmark.py batch --sizes 1e5 --stores 16 --workers 1 2 4 8
+    python benchmark.py events --sizes 1e4 1e5 1e6
+    python benchmark.py delta --sizes 1e4 1e5 1e6
+    python benchmark.py forecast --sizes 1e3 1e4 1e5 1e6
+    python benchmark.py pipeline --sizes 1e3 1e4 1e5 1e6 --save baseline.json
+    python benchmark.py pipeline --sizes 1e3 1e4 1e5 --compare baseline.json
+    python benchmark.py coldstart --repeat 5 --save coldstart.json
+    python benchmark.py api --sizes 1e3 1e4 1e5 1e6 --save api.json
+    python benchmark.py history --sizes 1e5 --snapshots 52
+    python benchmark.py export --sizes 1e4 1e5 1e6 --save export.json
+"""
+import argparse
+import atexit
+import base64
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregate import summarize
+from batch import audit_stores
+from cache import cache_key
+from classification import classify_inventory
+from events import reduce_events
+from forecast import DEMAND_TOLERANCE, HISTORY_DAYS, HORIZON_DAYS, forecast_inventory, season_table
+from generate_data import generate_spaza_inventory, simulate_inventory, simulate_sales_log
+from ingest import iter_file_chunks, parse_contents, process_chunks, process_data
+from schema import apply_schema, memory_report
+
+
+def synthetic_frame(rows, seed=0):
+    """Random inventory columns with the same ranges as the demo data"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'days_since_last_sale': rng.integers(0, 365, rows),
+        'stock_value': np.round(rng.gamma(1.5, 150, rows), 2),
+        'holding_cost': np.round(rng.gamma(1.2, 15, rows), 2),
+    })
+
+
+def legacy_classify(df):
+    """The original per-row apply implementation, kept as a baseline"""
+    df['stock_status'] = df['days_since_last_sale'].apply(
+        lambda x: 'Dead Stock (6+ months)' if x > 180 else
+                  'Slow Moving (3-6 months)' if x > 90 else
+                  'Moderate (1-3 months)' if x > 30 else
+                  'Active (< 1 month)'
+    )
+    df['urgency_score'] = df.apply(lambda row: min(round(
+        min(row['days_since_last_sale'] / 5, 40) +
+        (30 if row['stock_value'] > 500 else 20 if row['stock_value'] > 200 else 10 if row['stock_value'] > 50 else 0) +
+        (30 if row['holding_cost'] > 50 else 20 if row['holding_cost'] > 20 else 10 if row['holding_cost'] > 10 else 0),
+        1), 100), axis=1)
+    df['action_required'] = df['stock_status'].map({
+        'Dead Stock (6+ months)': 'Clearance Sale / Bundle',
+        'Slow Moving (3-6 months)': 'Discount / Promote',
+        'Moderate (1-3 months)': 'Monitor Weekly',
+        'Active (< 1 month)': 'Restock When Low',
+    })
+    return df
+
+
+def best_of(func, make_input, repeat):
+    timings = []
+    for _ in range(repeat):
+        data = make_input()
+        start = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_classification(sizes, repeat, legacy_max):
+    print(f"{'rows':>12} {'vectorized s':>14} {'rows/s':>14} {'legacy s':>12} {'speedup':>9}")
+    for rows in sizes:
+        base = synthetic_frame(rows)
+        fast = best_of(classify_inventory, base.copy, repeat)
+        line = f"{rows:>12,} {fast:>14.4f} {rows / fast:>14,.0f}"
+        if rows <= legacy_max:
+            slow = best_of(legacy_classify, base.copy, 1)
+            line += f" {slow:>12.4f} {slow / fast:>8.1f}x"
+        print(line)
+
+
+def bench_schema(sizes, repeat):
+    for rows in sizes:
+        # "Before" is what a plain read_csv of an export gives us
+        buffer = io.StringIO()
+        simulate_inventory(rows, seed=0).to_csv(buffer, index=False)
+        buffer.seek(0)
+        before = pd.read_csv(buffer)
+        start = time.perf_counter()
+        after = apply_schema(before.copy())
+        convert = time.perf_counter() - start
+
+        report = memory_report(before, after)
+        print(f"\n{rows:,} rows, apply_schema {convert:.3f}s")
+        print((report[['before', 'after']] / 2 ** 20).round(2).join(report[['dtype_before', 'dtype_after', 'ratio']]).to_string())
+
+        for name, df in (('before', before), ('after', after)):
+            seconds = best_of(lambda d: d.groupby('category', observed=True)['stock_value'].sum(), lambda: df, repeat)
+            print(f"groupby(category) {name}: {seconds * 1000:.2f} ms")
+
+
+def legacy_widget_scans(df):
+    """What the chart builders computed separately before the summary kernel"""
+    dead = df[df['stock_status'] == 'Dead Stock (6+ months)']
+    slow = df[df['stock_status'] == 'Slow Moving (3-6 months)']
+    active = df[df['stock_status'] == 'Active (< 1 month)']
+    kpis = [dead['stock_value'].sum(), slow['stock_value'].sum(), active['stock_value'].sum(), df['stock_value'].sum()]
+    status = df.groupby('stock_status', observed=True)['stock_value'].sum()
+    problem = df[df['stock_status'].isin(['Dead Stock (6+ months)', 'Slow Moving (3-6 months)'])]
+    category = problem.groupby('category', observed=True)['stock_value'].sum()
+    return kpis, status, category, dead.nlargest(8, 'stock_value'), df.nlargest(8, 'urgency_score')
+
+
+def bench_aggregation(sizes, repeat):
+    print(f"{'rows':>12} {'summarize s':>12} {'per-widget s':>13} {'speedup':>9}")
+    for rows in sizes:
+        df = simulate_inventory(rows, seed=0)
+        fast = best_of(summarize, lambda: df, repeat)
+        slow = best_of(legacy_widget_scans, lambda: df, repeat)
+        print(f"{rows:>12,} {fast:>12.4f} {slow:>13.4f} {slow / fast:>8.1f}x")
+
+
+def bench_batch(sizes, stores, workers):
+    """Multi-store audit throughput per worker count, stores of sizes[0] rows each"""
+    rows = sizes[0]
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(stores):
+            simulate_inventory(rows, seed=i).to_csv(os.path.join(directory, f"store-{i:03d}.csv"), index=False)
+        print(f"{stores} stores x {rows:,} rows")
+        print(f"{'workers':>8} {'seconds':>9} {'rows/s':>14} {'speedup':>9}")
+        base = None
+        for count in workers:
+            start = time.perf_counter()
+            audit_stores(directory, workers=count)
+            seconds = time.perf_counter() - start
+            base = base or seconds
+            print(f"{count:>8} {seconds:>9.2f} {stores * rows / seconds:>14,.0f} {base / seconds:>8.2f}x")
+
+
+def peak_memory(func, data):
+    """Peak traced allocation (bytes) of one call, measured apart from the timed runs"""
+    tracemalloc.start()
+    try:
+        func(data)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_forecast(df, as_of):
+    """Per-row reference for forecast_inventory: walks each SKU forward a day at a time"""
+    as_of = np.datetime64(as_of, 'D')
+    labels = [str(c) for c in df['category'].cat.categories]
+    factors = season_table(labels, as_of)
+    sell_through, dead = [], []
+    for row in df.itertuples(index=False):
+        f = factors[labels.index(str(row.category))]
+        held = min(max(row.days_in_stock, 1), HISTORY_DAYS)
+        past = f[HISTORY_DAYS - held:HISTORY_DAYS].mean()
+        base = min(row.total_sold / max(row.days_in_stock, 1) / past, 1 / (max(row.days_since_last_sale, 0) + 1))
+        sold, sell_day, next_day = 0.0, None, None
+        for d in range(1, HORIZON_DAYS + 1):
+            sold += base * f[HISTORY_DAYS + d - 1]
+            if next_day is None and sold >= 1 - DEMAND_TOLERANCE:
+                next_day = d
+            if sold >= row.current_stock * (1 - DEMAND_TOLERANCE):
+                sell_day = d
+                break
+        dead_at = as_of + (180 + 1 - row.days_since_last_sale)
+        sells = row.current_stock > 0 and sell_day is not None
+        late = next_day is None or as_of + next_day > dead_at
+        goes_dead = row.current_stock > 0 and (row.days_since_last_sale > 180 or late) and not (sells and as_of + sell_day <= dead_at)
+        sell_through.append(as_of + sell_day if sells else np.datetime64('NaT'))
+        dead.append(dead_at if goes_dead else np.datetime64('NaT'))
+    return np.array(sell_through, dtype='datetime64[D]'), np.array(dead, dtype='datetime64[D]')
+
+
+def bench_forecast(sizes, repeat, legacy_max):
+    """forecast_inventory over whole inventories, which must match the per-row reference to the day where it is affordable"""
+    print(f"{'rows':>12} {'vectorized s':>14} {'rows/s':>14} {'per-row s':>12} {'speedup':>9} {'mismatches':>11}")
+    as_of = datetime.now().date()
+    total = 0
+    for rows in sizes:
+        df = simulate_inventory(rows, seed=0, end_date=datetime.combine(as_of, datetime.min.time()))
+        fast = best_of(lambda d: forecast_inventory(d, as_of), df.copy, repeat)
+        line = f"{rows:>12,} {fast:>14.4f} {rows / fast:>14,.0f}"
+        if rows <= legacy_max:
+            start = time.perf_counter()
+            sell_through, dead = legacy_forecast(df, as_of)
+            slow = time.perf_counter() - start
+            mismatches = sum(int((~((got == want) | (np.isnat(got) & np.isnat(want)))).sum())
+                             for got, want in ((df['sell_through_date'].to_numpy().astype('datetime64[D]'), sell_through),
+                                               (df['dead_stock_date'].to_numpy().astype('datetime64[D]'), dead)))
+            line += f" {slow:>12.4f} {slow / fast:>8.1f}x {mismatches:>11,}"
+            total += mismatches
+        print(line)
+    if total:
+        print(f"\n✗ {total} forecast date(s) differ from the per-row reference")
+    return 1 if total else 0
+
+
+def legacy_event_reduce(path):
+    """Read the whole log, then a pandas groupby: what the streaming reducer replaces"""
+    log = pd.read_csv(path)
+    log = log[log['qty'].notna()]
+    log['date'] = pd.to_datetime(log['date'], format='%Y-%m-%d')
+    log['sale_date'] = log['date'].where(log['qty'] > 0)
+    return log.groupby('sku').agg(total_sold=('qty', 'sum'), first_event_date=('date', 'min'), last_sale_date=('sale_date', 'max'))
+
+
+def bench_events(sizes, repeat):
+    """Sales log ingestion for sizes SKUs: streaming reduction and full audit, against a groupby over the whole log"""
+    print(f"{'skus':>10} {'events':>12} {'reduce s':>9} {'events/s':>12} {'peak MiB':>9} {'audit s':>8} {'whole-log s':>12} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for skus in sizes:
+            inventory, log = simulate_sales_log(skus, seed=0)
+            path = os.path.join(directory, f"log-{skus}.csv")
+            log.to_csv(path, index=False)
+            events = len(log)
+            del log
+            reduce = lambda p: reduce_events(iter_file_chunks(p))
+            fast = best_of(reduce, lambda: path, repeat)
+            audit = best_of(lambda p: process_chunks(iter_file_chunks(p), catalog=inventory), lambda: path, repeat)
+            slow = best_of(legacy_event_reduce, lambda: path, 1)
+            print(f"{skus:>10,} {events:>12,} {fast:>9.3f} {events / fast:>12,.0f} {peak_memory(reduce, path) / 2 ** 20:>9.1f}"
+                  f" {audit:>8.3f} {slow:>12.3f} {peak_memory(legacy_event_reduce, path) / 2 ** 20:>9.1f}")
+
+
+def undated_inventory(rows, undated=0.05, seed=0):
+    """Processed demo inventory in which a share of SKUs has no dates, so their day counts are NaN"""
+    raw = generate_spaza_inventory(rows, seed=seed, vectorized=True).drop(columns=['days_since_last_sale', 'days_in_stock'])
+    blank = np.random.default_rng(seed).random(rows) < undated
+    raw.loc[blank, ['last_sale_date', 'stock_received_date']] = None
+    df, error = process_data(raw)
+    if error:
+        raise RuntimeError(error)
+    return df
+
+
+def bench_delta(sizes, repeat, touched=0.01):
+    """apply_delta merging a delta on a share of SKUs, dated and undated alike, checked against a full recount"""
+    from delta import apply_delta
+    print(f"{'rows':>12} {'delta rows':>11} {'apply s':>9} {'undated':>8} {'bad days':>9} {'bad scores':>11} {'summary ok':>11}")
+    rng = np.random.default_rng(0)
+    for rows in sizes:
+        df = undated_inventory(rows)
+        summary = summarize(df)
+        undated = df['days_since_last_sale'].isna().to_numpy()
+        picked = rng.choice(rows, max(1, int(rows * touched)), replace=False)
+        # Half the touched SKUs only take stock in, so undated ones among them must stay undated;
+        # some sales are dated after today, which must count as 0 days idle and not negative
+        step = np.arange(len(picked))
+        future = (datetime.now().date() + pd.Timedelta(days=30)).isoformat()
+        delta = pd.DataFrame({'sku': df['sku'].to_numpy()[picked], 'received': 5, 'sold': np.where(step % 2, 1, 0),
+                              'last_sale_date': np.where(step % 4 == 1, future, None)})
+        seconds = best_of(lambda d: apply_delta(df, summary, d), lambda: delta, repeat)
+        frame, merged, _, error = apply_delta(df, summary, delta)
+        if error:
+            raise RuntimeError(error)
+        days = frame['days_since_last_sale'].to_numpy(dtype=np.float64, na_value=np.nan)
+        scores = frame['urgency_score'].to_numpy(dtype=np.float64, na_value=np.nan)
+        kept = picked[(delta['sold'].to_numpy() == 0) & undated[picked]]
+        bad_days = int((days < 0).sum() + (~np.isnan(days[kept])).sum())
+        bad_scores = int(((scores < 0) | (scores > 100) | np.isnan(scores)).sum())
+        recount = summarize(frame)
+        ok = np.array_equal(merged.count, recount.count) and np.allclose(merged.value, recount.value, rtol=1e-6)
+        print(f"{rows:>12,} {len(delta):>11,} {seconds:>9.4f} {int(undated.sum()):>8,} {bad_days:>9,} {bad_scores:>11,} {str(ok):>11}")
+
+
+def dash_request(client, output, inputs, state=(), changed=None):
+    """POST one callback the way the browser does; output is its dash_app.callback_map key"""
+    outputs = [{'id': spec.split('.')[0], 'property': spec.split('.')[1]} for spec in output.strip('.').split('...')]
+    body = {
+        'output': output,
+        'outputs': outputs if len(outputs) > 1 else outputs[0],
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'state': [{'id': i, 'property': p, 'value': v} for i, p, v in state],
+        'changedPropIds': [changed or f"{inputs[0][0]}.{inputs[0][1]}"],
+    }
+    response = client.post('/_dash-update-component', json=body)
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"{output}: HTTP {response.status_code}")
+    return response
+
+
+def dashboard_roundtrip(client, contents):
+    """The upload callback plus every widget callback it triggers, over HTTP"""
+    callbacks = app_module().dash_app.callback_map
+    first_input = lambda output: (callbacks[output]['inputs'][0]['id'], callbacks[output]['inputs'][0]['property'])
+    upload = next(output for output in callbacks if first_input(output) == ('upload-data', 'contents'))
+    response = dash_request(client, upload,
+                            [('upload-data', 'contents', contents), ('load-sample', 'n_clicks', None), ('upload-delta', 'contents', None), ('as-of-date', 'date', None)],
+                            [('upload-data', 'filename', 'bench.csv'), ('inventory-data', 'data', None)])
+    dataset_id = response.json['response']['inventory-data']['data']
+    # What the browser sends for each widget's other inputs right after an upload
+    values = {('inventory-data', 'data'): dataset_id, ('priority-table', 'page_current'): 0, ('priority-table', 'page_size'): 8,
+              ('priority-table', 'sort_by'): [], ('priority-table', 'filter_query'): ''}
+    for output in callbacks:
+        if first_input(output) != ('inventory-data', 'data'):
+            continue
+        dash_request(client, output, [(i['id'], i['property'], values.get((i['id'], i['property']))) for i in callbacks[output]['inputs']])
+
+
+def app_module():
+    if 'app' not in sys.modules:
+        # HISTORY and the API's store are bound on import: point them at a throwaway
+        # file first, so benchmark audits never reach the dashboard's trend chart
+        directory = tempfile.mkdtemp(prefix='stockaudit-bench-')
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        os.environ['STOCKAUDIT_HISTORY'] = os.path.join(directory, 'history.sqlite')
+    import app
+    # Measure the synchronous path: no background jobs, no result cache hits between runs
+    app.JOBS = None
+    return app
+
+
+def file_state(path):
+    """(size, mtime) of a file, None if there is none: enough to tell whether a run wrote to it"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def check_history_untouched(before):
+    """Exit status for the default history store against its file_state before the run"""
+    from history import DEFAULT_PATH
+    if file_state(DEFAULT_PATH) != before:
+        print(f"\n✗ Benchmark audits were written to the default history store {DEFAULT_PATH}")
+        return 1
+    return 0
+
+
+def table_filter_misses(df, rows=32):
+    """Values on the priority table's first rows, as the table and exports show them, that do not match.
+
+    Counts table cells sent with more digits than shown, and shown numbers an
+    '=' filter on them does not find in their own row.
+    """
+    from ranking import filter_mask, rank_positions, table_records
+    from schema import rounded_floats
+    positions = rank_positions(df)[:rows]
+    shown = rounded_floats(df.iloc[positions]).reset_index(drop=True)
+    misses = sum(value != shown.at[i, column] for i, record in enumerate(table_records(df.iloc[positions]))
+                 for column, value in record.items() if isinstance(value, float))
+    for column in shown.columns:
+        if shown[column].dtype.kind not in 'iuf':
+            continue
+        for i, position in enumerate(positions):
+            value = shown.at[i, column]
+            if pd.notna(value) and not filter_mask(df, f"{{{column}}} = {value}")[position]:
+                misses += 1
+    return misses
+
+
+def bench_pipeline(sizes, repeat, save=None, compare=None, tolerance=1.25, noise=0.005):
+    """Time and memory of each pipeline stage at each size; optionally save or check a baseline"""
+    from history import DEFAULT_PATH
+    history_before = file_state(DEFAULT_PATH)
+    app = app_module()
+    misses = 0
+    client = app.server.test_client()
+    results = []
+    print(f"{'rows':>10} {'stage':<28} {'seconds':>9} {'rows/s':>13} {'peak MiB':>9}")
+    for rows in sizes:
+        raw = generate_spaza_inventory(rows, seed=0, vectorized=True)
+        contents = 'data:text/csv;base64,' + base64.b64encode(raw.to_csv(index=False).encode()).decode()
+        parsed, _ = parse_contents(contents, 'bench.csv')
+        processed, _ = process_data(parsed.copy())
+        summary = summarize(processed)
+
+        def reset_caches():
+            app.RESULT_CACHE.clear()
+            app.DATASETS.discard(cache_key(contents))
+            # Per-dataset figures and orderings are cached too, under the same ID every repeat
+            app._sku_scatter_figure.cache_clear()
+            app._priority_order.cache_clear()
+            return contents
+
+        stages = [
+            ('parse_contents', lambda c: parse_contents(c, 'bench.csv'), lambda: contents),
+            ('process_data', process_data, parsed.copy),
+            ('summarize', summarize, lambda: processed),
+            ('create_status_chart', app.create_status_chart, lambda: summary),
+            ('create_category_chart', app.create_category_chart, lambda: summary),
+            ('create_worst_products_chart', app.create_worst_products_chart, lambda: summary),
+            ('create_sku_scatter', app.create_sku_scatter, lambda: processed),
+            ('kpi_values', app.kpi_values, lambda: summary),
+            ('build_results', app.build_results, lambda: summary),
+            ('update_dashboard', lambda c: dashboard_roundtrip(client, c), reset_caches),
+        ]
+        for name, func, make_input in stages:
+            seconds = best_of(func, make_input, repeat)
+            peak = peak_memory(func, make_input())
+            results.append({'stage': name, 'rows': rows, 'seconds': seconds, 'peak_bytes': peak})
+            print(f"{rows:>10,} {name:<28} {seconds:>9.4f} {rows / seconds:>13,.0f} {peak / 2 ** 20:>9.1f}")
+        misses += table_filter_misses(processed)
+
+    status = check_history_untouched(history_before)
+    if misses:
+        print(f"\n✗ {misses} table value(s) not found by filtering on them")
+        status = 1
+    if save:
+        write_baseline(results, save, repeat)
+    if compare:
+        return max(status, compare_baseline(results, compare, tolerance, noise))
+    return status
+
+
+def write_baseline(results, path, repeat):
+    """Save results with enough context to tell whether a later comparison is fair"""
+    baseline = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    print(f"\nBaseline written to {path}")
+
+
+def compare_baseline(results, path, tolerance, noise):
+    """Print stages slower than the baseline allows; returns the exit status"""
+    with open(path) as f:
+        baseline = {(r['stage'], r['rows']): r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        base = baseline.get((result['stage'], result['rows']))
+        # Millisecond stages jitter by more than any sensible tolerance, so also require an absolute slowdown
+        if base and result['seconds'] > base['seconds'] * tolerance and result['seconds'] - base['seconds'] > noise:
+            regressions.append(f"{result['stage']} @ {result['rows']:,} rows: {base['seconds']:.4f}s -> {result['seconds']:.4f}s")
+    if regressions:
+        print(f"\n✗ {len(regressions)} stage(s) slower than {tolerance:.2f}x baseline:")
+        print('\n'.join(regressions))
+        return 1
+    print(f"\n✓ No stage slower than {tolerance:.2f}x baseline")
+    return 0
+
+
+def timed_request(client, path, body=None):
+    """(seconds to the first response bytes, total seconds, response bytes) of one streamed GET, or POST of body"""
+    start = time.perf_counter()
+    response = client.get(path, buffered=False) if body is None else client.post(path, data=body, buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+    first, size = None, 0
+    for part in response.response:
+        first = first or time.perf_counter() - start
+        size += len(part)
+    response.close()
+    return first, time.perf_counter() - start, size
+
+
+def bench_api(sizes, repeat, save=None, compare=None, tolerance=1.25, noise=0.005):
+    """Latency and throughput of the headless API, CSV and Parquet bodies, apart from the Dash UI"""
+    from history import DEFAULT_PATH
+    history_before = file_state(DEFAULT_PATH)
+    client = app_module().server.test_client()
+    endpoints = [
+        ('api_ndjson', '/api/audit', 'csv'),
+        ('api_arrow', '/api/audit?format=arrow', 'csv'),
+        ('api_summary', '/api/audit/summary', 'csv'),
+        ('api_parquet_ndjson', '/api/audit', 'parquet'),
+        ('api_parquet_summary', '/api/audit/summary', 'parquet'),
+    ]
+    results = []
+    print(f"{'rows':>10} {'endpoint':<22} {'first byte s':>12} {'total s':>9} {'rows/s':>13} {'MiB in':>8} {'MiB out':>8}")
+    for rows in sizes:
+        raw = generate_spaza_inventory(rows, seed=0, vectorized=True)
+        buffer = io.BytesIO()
+        raw.to_parquet(buffer, index=False)
+        bodies = {'csv': raw.to_csv(index=False).encode(), 'parquet': buffer.getvalue()}
+        del raw
+        for name, path, fmt in endpoints:
+            first, seconds, size = min((timed_request(client, path, bodies[fmt]) for _ in range(repeat)), key=lambda run: run[1])
+            results.append({'stage': name, 'rows': rows, 'seconds': seconds, 'first_byte': first, 'peak_bytes': None})
+            print(f"{rows:>10,} {name:<22} {first:>12.4f} {seconds:>9.4f} {rows / seconds:>13,.0f}"
+                  f" {len(bodies[fmt]) / 2 ** 20:>8.1f} {size / 2 ** 20:>8.1f}")
+
+    status = check_history_untouched(history_before)
+    if save:
+        write_baseline(results, save, repeat)
+    if compare:
+        return max(status, compare_baseline(results, compare, tolerance, noise))
+    return status
+
+
+def legacy_excel(df):
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer
+
+
+def read_xlsx(data):
+    """Rows of an xlsx's first sheet as lists of cell text, the header first; empty cells read as ''"""
+    import zipfile
+    from xml.etree import ElementTree
+    ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    rows = []
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook, workbook.open('xl/worksheets/sheet1.xml') as sheet:
+        for _, element in ElementTree.iterparse(sheet):
+            if element.tag == ns + 'row':
+                rows.append([''.join(cell.itertext()) for cell in element])
+                element.clear()
+    return rows
+
+
+def read_export(data, fmt):
+    """A downloaded export read back as a frame: Parquet typed, CSV and xlsx as text"""
+    if fmt == 'parquet':
+        return pd.read_parquet(io.BytesIO(data))
+    if fmt == 'csv':
+        return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    rows = read_xlsx(data)
+    return pd.DataFrame(rows[1:], columns=rows[0])
+
+
+def export_mismatches(expected, got, fmt):
+    """Cells of an export read back that differ from the frame it was written from; money need only match to the cent"""
+    from export import EXCEL_EPOCH_OFFSET
+    if list(got.columns) != list(expected.columns) or len(got) != len(expected):
+        return expected.size
+    bad = 0
+    for col in expected.columns:
+        want, have = expected[col], got[col]
+        if want.dtype.kind == 'M':
+            if fmt == 'xlsx':
+                have = pd.to_datetime(pd.to_numeric(have, errors='coerce') - EXCEL_EPOCH_OFFSET, unit='D')
+            have = pd.to_datetime(have, errors='coerce')
+            same = (have.to_numpy() == want.to_numpy()) | (have.isna().to_numpy() & want.isna().to_numpy())
+        elif want.dtype.kind in 'iuf':
+            have = pd.to_numeric(have, errors='coerce').to_numpy(dtype=np.float64)
+            same = np.isclose(have, want.to_numpy(dtype=np.float64), rtol=1e-6, atol=0.005, equal_nan=True)
+        else:
+            text = lambda values: values.astype(object).where(values.notna(), '').astype(str).to_numpy()
+            same = text(have) == text(want)
+        bad += int((~same).sum())
+    return bad
+
+
+def bench_export(sizes, repeat, legacy_max, save=None, compare=None, tolerance=1.25, noise=0.005):
+    """Streamed exports through /export against building the whole file in memory first"""
+    from export import audit_blocks, export_formats, priority_blocks
+    from ranking import rank_positions
+    app = app_module()
+    client = app.server.test_client()
+    legacy = {
+        'csv': lambda df: df.to_csv(index=False),
+        'parquet': lambda df: df.to_parquet(io.BytesIO(), index=False),
+        'xlsx': legacy_excel,
+    }
+    results = []
+    print(f"{'rows':>10} {'export':<24} {'first byte s':>12} {'total s':>9} {'rows/s':>13} {'MiB out':>8} {'peak MiB':>9} {'bad cells':>10}")
+    for rows in sizes:
+        df, _ = process_data(generate_spaza_inventory(rows, seed=0, vectorized=True))
+        dataset_id = app.DATASETS.put(cache_key(str(rows).encode(), namespace='bench-export'), df)
+        # Every download is read back and checked cell by cell against the rows it was written from
+        for view in ('audit', 'priority'):
+            blocks = audit_blocks(df) if view == 'audit' else priority_blocks(df, rank_positions(df))
+            expected = pd.concat(list(blocks), ignore_index=True)
+            for fmt in export_formats():
+                path = f"/export/{dataset_id}/{view}.{fmt}"
+                first, seconds, size = min((timed_request(client, path) for _ in range(repeat)), key=lambda run: run[1])
+                peak = peak_memory(lambda p: timed_request(client, p), path)
+                name = f"export_{view}_{fmt}"
+                bad = export_mismatches(expected, read_export(client.get(path).get_data(), fmt), fmt)
+                results.append({'stage': name, 'rows': rows, 'seconds': seconds, 'first_byte': first, 'peak_bytes': peak})
+                print(f"{rows:>10,} {name:<24} {first:>12.4f} {seconds:>9.4f} {rows / seconds:>13,.0f} {size / 2 ** 20:>8.1f} {peak / 2 ** 20:>9.1f} {bad:>10,}")
+            del expected
+        # Whole-file baselines: nothing can be sent until these return
+        for fmt in export_formats():
+            if fmt == 'xlsx' and rows > legacy_max:
+                continue
+            try:
+                seconds = best_of(legacy[fmt], lambda frame=df: frame, repeat)
+            except ImportError:
+                continue  # No Excel engine for pandas
+            peak = peak_memory(legacy[fmt], df)
+            print(f"{rows:>10,} {'legacy audit ' + fmt:<24} {seconds:>12.4f} {seconds:>9.4f} {rows / seconds:>13,.0f} {'':>8} {peak / 2 ** 20:>9.1f}")
+        del df
+
+    if save:
+        write_baseline(results, save, repeat)
+    if compare:
+        return compare_baseline(results, compare, tolerance, noise)
+    return 0
+
+
+def rows_status_trend(store):
+    """The status trend aggregated from every snapshot row: what the snapshot_totals table saves"""
+    return store._query("""
+        SELECT s.taken, r.status, COUNT(*) AS count, SUM(r.stock_value) AS value
+        FROM snapshot_rows r JOIN snapshots s ON s.id = r.snapshot_id
+        GROUP BY s.taken, r.status ORDER BY s.taken""")
+
+
+def bench_history(sizes, snapshots, repeat):
+    """Recording a year of weekly snapshots of sizes SKUs, then the trend queries over them"""
+    from datetime import timedelta
+    from aging import reage
+    from classification import STATUS_LABELS
+    from history import SnapshotStore
+    print(f"{'skus':>10} {'snapshots':>9} {'totals ms':>10} {'rows s':>8} {'MiB':>7}  query latency (best of {repeat})")
+    with tempfile.TemporaryDirectory() as directory:
+        for skus in sizes:
+            store = SnapshotStore(os.path.join(directory, f"history-{skus}.sqlite"))
+            base = simulate_inventory(skus, seed=0)
+            today = datetime.now().date()
+            totals_seconds, rows_seconds = [], []
+            for week in range(snapshots):
+                taken = today - timedelta(weeks=snapshots - 1 - week)
+                frame = reage(base, taken)
+                summary = summarize(frame)
+                start = time.perf_counter()
+                snapshot_id = store.begin(taken, 'bench')
+                store.finish(snapshot_id, summary)
+                totals_seconds.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                store.add_rows(snapshot_id, frame)
+                rows_seconds.append(time.perf_counter() - start)
+            size = os.path.getsize(store.path) / 2 ** 20
+            print(f"{skus:>10,} {snapshots:>9} {1000 * np.mean(totals_seconds):>10.2f} {np.mean(rows_seconds):>8.3f} {size:>7.0f}")
+
+            category = base['category'].iloc[0]
+            sku = base['sku'].iloc[len(base) // 2]
+            queries = [
+                ('status_trend', lambda: store.status_trend()),
+                ('status_trend(category)', lambda: store.status_trend(category)),
+                ('category_trend(dead)', lambda: store.category_trend(STATUS_LABELS[-1])),
+                ('sku_history', lambda: store.sku_history(sku)),
+                ('new_dead_stock', lambda: store.new_dead_stock(today, 'bench')),
+                ('status_trend from rows', lambda: rows_status_trend(store)),
+            ]
+            for name, query in queries:
+                print(f"{'':>40}  {name:<24} {best_of(lambda _: query(), lambda: None, repeat) * 1000:>9.2f} ms")
+
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.server.test_client()
+for path in ('/', '/_dash-layout', '/_dash-dependencies'):
+    assert client.get(path).status_code == 200, path
+served = time.perf_counter()
+heavy = [name for name in ('pandas', 'numpy', 'pyarrow', 'plotly.express') if name in sys.modules]
+print(json.dumps({'import': imported - start, 'first_response': served - imported, 'loaded': heavy}))
+"""
+
+
+def bench_coldstart(repeat, save=None, compare=None, tolerance=1.25, noise=0.005):
+    """Import-to-first-response time of app.py in fresh interpreters, as on a serverless cold start"""
+    import subprocess
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    imported = min(run['import'] for run in runs)
+    served = min(run['first_response'] for run in runs)
+    print(f"import app          {imported:.3f}s")
+    print(f"first response      {served:.3f}s  (/, /_dash-layout, /_dash-dependencies)")
+    print(f"import to response  {imported + served:.3f}s")
+    print(f"heavy modules loaded: {', '.join(runs[0]['loaded']) or 'none'}")
+    results = [
+        {'stage': 'cold_import', 'rows': 0, 'seconds': imported, 'peak_bytes': None},
+        {'stage': 'cold_first_response', 'rows': 0, 'seconds': served, 'peak_bytes': None},
+        {'stage': 'cold_import_to_response', 'rows': 0, 'seconds': imported + served, 'peak_bytes': None},
+    ]
+    if save:
+        write_baseline(results, save, repeat)
+    if compare:
+        return compare_baseline(results, compare, tolerance, noise)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('suite', choices=['classification', 'schema', 'aggregation', 'batch', 'events', 'delta', 'forecast', 'pipeline', 'coldstart', 'api', 'history', 'export'])
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e3, 1e4, 1e5, 1e6, 1e7])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--legacy-max', type=float, default=1e5, help="largest size to also time the per-row baseline on")
+    parser.add_argument('--stores', type=int, default=16, help="store files for the batch suite")
+    parser.add_argument('--snapshots', type=int, default=52, help="weekly snapshots for the history suite")
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4, os.cpu_count()], help="worker counts for the batch suite")
+    parser.add_argument('--save', help="pipeline/coldstart/api/export suites: write results to this JSON baseline file")
+    parser.add_argument('--compare', help="pipeline/coldstart/api/export suites: fail if any stage is slower than this baseline file allows")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="allowed slowdown factor for --compare")
+    parser.add_argument('--noise', type=float, default=0.005, help="slowdowns under this many seconds never count as regressions")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes]
+
+    if args.suite == 'classification':
+        bench_classification(sizes, args.repeat, args.legacy_max)
+    elif args.suite == 'schema':
+        bench_schema(sizes, args.repeat)
+    elif args.suite == 'aggregation':
+        bench_aggregation(sizes, args.repeat)
+    elif args.suite == 'batch':
+        bench_batch(sizes, args.stores, args.workers)
+    elif args.suite == 'events':
+        bench_events(sizes, args.repeat)
+    elif args.suite == 'delta':
+        bench_delta(sizes, args.repeat)
+    elif args.suite == 'forecast':
+        sys.exit(bench_forecast(sizes, args.repeat, min(args.legacy_max, 2e4)))
+    elif args.suite == 'pipeline':
+        sys.exit(bench_pipeline(sizes, args.repeat, args.save, args.compare, args.tolerance, args.noise))
+    elif args.suite == 'coldstart':
+        sys.exit(bench_coldstart(args.repeat, args.save, args.compare, args.tolerance, args.noise))
+    elif args.suite == 'api':
+        sys.exit(bench_api(sizes, args.repeat, args.save, args.compare, args.tolerance, args.noise))
+    elif args.suite == 'history':
+        bench_history(sizes, args.snapshots, args.repeat)
+    elif args.suite == 'export':
+        sys.exit(bench_export(sizes, args.repeat, args.legacy_max, args.save, args.compare, args.tolerance, args.noise))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# ============== RESULT CACHE ==============
+# Processed uploads keyed by a hash of their content and the classification
+# thresholds. MemoryCache is per process; DiskCache keeps pickles in a local
+# directory so every gunicorn worker on the machine shares the same entries.
+
+DEFAULT_MAX_ENTRIES = 16
+DEFAULT_TTL = 3600
+HASH_BLOCK_SIZE = 1 << 20
+# What cache_key returns, and so the only names DiskCache and DatasetRegistry turn into file paths
+KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+def private_directory(path):
+    """Create path readable only by this user, or check that an existing one is safe to unpickle from.
+
+    The default directories sit in the shared temp dir, where another local user
+    could create them first and plant pickles, which run code when loaded. A
+    directory owned by someone else or writable by group or others is refused.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    stat = os.stat(path)
+    if hasattr(os, 'getuid') and (stat.st_uid != os.getuid() or stat.st_mode & 0o022):
+        raise PermissionError(f"{path} must be owned by this user and writable by it alone; choose another directory or fix its permissions")
+    return path
+
+
+def cache_key(payload, thresholds=None, namespace='upload'):
+    """SHA-256 of the upload payload plus the resolved thresholds.
+
+    payload is a dcc.Upload data URL, a base64 str or raw bytes. Only the part
+    after the data URL header is hashed, so the same file maps to the same key
+    whatever MIME type the browser reported.
+    """
+    from classification import resolve_thresholds  # pandas-backed; keeps cache.py cheap to import
+
+    digest = hashlib.sha256(namespace.encode())
+    digest.update(repr(sorted(resolve_thresholds(thresholds).items())).encode())
+    if isinstance(payload, str):
+        start = payload.find(',') + 1
+        for pos in range(start, len(payload), HASH_BLOCK_SIZE):
+            digest.update(payload[pos:pos + HASH_BLOCK_SIZE].encode('ascii'))
+    else:
+        digest.update(payload)
+    return digest.hexdigest()
+
+
+def is_key(value):
+    """Whether value has the form of a cache_key; IDs sent back by the browser are checked with it before any file is opened"""
+    return isinstance(value, str) and KEY_PATTERN.fullmatch(value) is not None
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry time to live"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskCache:
+    """LRU cache of pickle files in a local directory.
+
+    File mtime doubles as the last-access time for LRU eviction; the write
+    time stored inside each file drives the TTL. Writes go through a temp file
+    and os.replace so concurrent workers never read a partial entry.
+    """
+
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        private_directory(directory)
+
+    def _path(self, key):
+        if not is_key(key):
+            raise ValueError(f"Not a cache key: {key!r}")
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        if not is_key(key):
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                written, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if written + self.ttl < time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time(), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def clear(self):
+        for path in self._entry_paths():
+            self._remove(path)
+
+    def _entry_paths(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.pkl')]
+
+    def _evict(self):
+        entries = []
+        for path in self._entry_paths():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cache_from_env():
+    """Build the result cache selected by the STOCKAUDIT_CACHE* environment variables"""
+    backend = os.environ.get('STOCKAUDIT_CACHE', 'memory').lower()
+    max_entries = int(os.environ.get('STOCKAUDIT_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+    ttl = float(os.environ.get('STOCKAUDIT_CACHE_TTL', DEFAULT_TTL))
+    if backend == 'disk':
+        directory = os.environ.get('STOCKAUDIT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'stockaudit-cache'))
+        return DiskCache(directory, max_entries, ttl)
+    if backend == 'memory':
+        return MemoryCache(max_entries, ttl)
+    raise ValueError(f"Unknown STOCKAUDIT_CACHE backend: {backend}")
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+# ============== CLASSIFICATION ENGINE ==============
+# Shared by app.py and generate_data.py. Every function works on whole
+# columns at once (np.select / categorical codes) instead of per-row apply.
+
+STATUS_LABELS = [
+    'Active (< 1 month)',
+    'Moderate (1-3 months)',
+    'Slow Moving (3-6 months)',
+    'Dead Stock (6+ months)',
+]
+
+ACTION_LABELS = [
+    'Restock When Low',
+    'Monitor Weekly',
+    'Discount / Promote',
+    'Clearance Sale / Bundle',
+]
+
+STATUS_DTYPE = pd.CategoricalDtype(STATUS_LABELS, ordered=True)
+ACTION_DTYPE = pd.CategoricalDtype(ACTION_LABELS, ordered=True)
+
+# Day cut-offs are "strictly greater than" bounds, value and holding-cost
+# bands pair each lower bound with the points awarded above it (in Pula).
+DEFAULT_THRESHOLDS = {
+    'moderate_days': 30,
+    'slow_days': 90,
+    'dead_days': 180,
+    'days_divisor': 5,
+    'days_max_points': 40,
+    'value_bands': ((500, 30), (200, 20), (50, 10)),
+    'holding_bands': ((50, 30), (20, 20), (10, 10)),
+    'max_score': 100,
+}
+
+
+def resolve_thresholds(thresholds=None):
+    """Merge user overrides onto DEFAULT_THRESHOLDS"""
+    merged = dict(DEFAULT_THRESHOLDS)
+    if thresholds:
+        unknown = set(thresholds) - set(DEFAULT_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Unknown thresholds: {', '.join(sorted(unknown))}")
+        merged.update(thresholds)
+    return merged
+
+
+def status_codes(days, thresholds=None):
+    """Return int8 status codes (0=Active .. 3=Dead) for days since last sale"""
+    t = resolve_thresholds(thresholds)
+    days = np.asarray(days, dtype='float64')
+    # NaN compares False everywhere, so unknown ages fall back to Active
+    codes = (days > t['moderate_days']).astype('int8')
+    codes += days > t['slow_days']
+    codes += days > t['dead_days']
+    return codes
+
+
+def classify_stock(days, thresholds=None):
+    """Classify stock based on days since last sale"""
+    index = days.index if isinstance(days, pd.Series) else None
+    codes = status_codes(days, thresholds)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=STATUS_DTYPE), index=index, name='stock_status')
+
+
+def _band_points(values, bands):
+    values = np.asarray(values, dtype='float64')
+    bands = sorted(bands, reverse=True)
+    return np.select([values > bound for bound, _ in bands], [points for _, points in bands], default=0)
+
+
+def calculate_urgency(df, thresholds=None):
+    """Calculate urgency score 0-100 for every row of df"""
+    t = resolve_thresholds(thresholds)
+    days = df['days_since_last_sale'].to_numpy(dtype='float64', na_value=0)
+    score = np.minimum(days / t['days_divisor'], t['days_max_points'])
+    score = score + _band_points(df['stock_value'].to_numpy(dtype='float64', na_value=0), t['value_bands'])
+    score = score + _band_points(df['holding_cost'].to_numpy(dtype='float64', na_value=0), t['holding_bands'])
+    return pd.Series(np.minimum(np.round(score, 1), t['max_score']), index=df.index, name='urgency_score')
+
+
+def suggest_action(status):
+    """Suggest action based on stock status"""
+    status = status.astype(STATUS_DTYPE)
+    return pd.Series(pd.Categorical.from_codes(status.cat.codes.to_numpy(), dtype=ACTION_DTYPE), index=status.index, name='action_required')
+
+
+@timed('classify')
+def classify_inventory(df, thresholds=None, overwrite=True):
+    """Add stock_status, urgency_score and action_required columns to df in place.
+
+    With overwrite=False, columns already present in df are kept as-is.
+    """
+    if overwrite or 'stock_status' not in df.columns:
+        df['stock_status'] = classify_stock(df['days_since_last_sale'], thresholds)
+    if overwrite or 'urgency_score' not in df.columns:
+        df['urgency_score'] = calculate_urgency(df, thresholds)
+    if overwrite or 'action_required' not in df.columns:
+        df['action_required'] = suggest_action(df['stock_status'])
+    return df
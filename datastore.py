@@ -0,0 +1,157 @@
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from cache import is_key, private_directory
+
+# ============== DATASET REGISTRY ==============
+# Processed inventory frames live on the server; the browser's dcc.Store only
+# holds the dataset ID. Frames stay in memory up to a byte budget and the
+# least recently used ones spill to pickle files in a local directory.
+# Dataset IDs are cache keys (SHA-256 hex digests); anything else the browser
+# or an API caller sends is an unknown dataset and never reaches the disk, and
+# the directory must be private to this user (see cache.private_directory).
+
+DEFAULT_MEMORY_BYTES = 512 * 1024 ** 2
+DEFAULT_DISK_BYTES = 4 * 1024 ** 3
+
+
+class DatasetRegistry:
+    """Frames by dataset ID, in memory with spill to local disk.
+
+    With write_through=True every frame is also written to disk on put, so
+    other worker processes pointed at the same directory can resolve it.
+    """
+
+    def __init__(self, directory, memory_bytes=DEFAULT_MEMORY_BYTES, disk_bytes=DEFAULT_DISK_BYTES, write_through=False):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.write_through = write_through
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        private_directory(directory)
+
+    def _path(self, dataset_id):
+        if not is_key(dataset_id):
+            raise ValueError(f"Not a dataset ID: {dataset_id!r}")
+        return os.path.join(self.directory, f"{dataset_id}.pkl")
+
+    def put(self, dataset_id, df):
+        self._path(dataset_id)  # Only cache keys are stored
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._frames[dataset_id] = df
+            self._frames.move_to_end(dataset_id)
+            self._sizes[dataset_id] = size
+            spill = self._evict_locked()
+        if self.write_through:
+            spill.append((dataset_id, df))
+        for spilled_id, frame in spill:
+            self._write(spilled_id, frame)
+        if spill:
+            self._trim_disk()
+        return dataset_id
+
+    def get(self, dataset_id):
+        """Return the frame for dataset_id, loading it back from disk if it was spilled, else None"""
+        if not is_key(dataset_id):
+            return None
+        with self._lock:
+            df = self._frames.get(dataset_id)
+            if df is not None:
+                self._frames.move_to_end(dataset_id)
+                return df
+        try:
+            with open(self._path(dataset_id), 'rb') as f:
+                df = pickle.load(f)
+            os.utime(self._path(dataset_id))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        with self._lock:
+            self._frames[dataset_id] = df
+            self._sizes[dataset_id] = int(df.memory_usage(deep=True).sum())
+            spill = self._evict_locked(keep=dataset_id)
+        for spilled_id, frame in spill:
+            self._write(spilled_id, frame)
+        return df
+
+    def __contains__(self, dataset_id):
+        if not is_key(dataset_id):
+            return False
+        with self._lock:
+            if dataset_id in self._frames:
+                return True
+        return os.path.exists(self._path(dataset_id))
+
+    def discard(self, dataset_id):
+        if not is_key(dataset_id):
+            return
+        with self._lock:
+            self._frames.pop(dataset_id, None)
+            self._sizes.pop(dataset_id, None)
+        try:
+            os.remove(self._path(dataset_id))
+        except OSError:
+            pass
+
+    def _evict_locked(self, keep=None):
+        spill = []
+        while sum(self._sizes.values()) > self.memory_bytes and len(self._frames) > 1:
+            oldest = next(iter(self._frames))
+            if oldest == keep:
+                self._frames.move_to_end(oldest)
+                oldest = next(iter(self._frames))
+            spill.append((oldest, self._frames.pop(oldest)))
+            self._sizes.pop(oldest)
+        return spill
+
+    def _write(self, dataset_id, df):
+        path = self._path(dataset_id)
+        if os.path.exists(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _trim_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def registry_from_env():
+    """Build the dataset registry configured by the STOCKAUDIT_DATASETS* environment variables"""
+    return DatasetRegistry(
+        os.environ.get('STOCKAUDIT_DATASETS_DIR', os.path.join(tempfile.gettempdir(), 'stockaudit-datasets')),
+        memory_bytes=int(os.environ.get('STOCKAUDIT_DATASETS_MEMORY', DEFAULT_MEMORY_BYTES)),
+        disk_bytes=int(os.environ.get('STOCKAUDIT_DATASETS_DISK', DEFAULT_DISK_BYTES)),
+        write_through=os.environ.get('STOCKAUDIT_DATASETS_SHARED', '') == '1',
+    )
@@ -0,0 +1,149 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from aging import days_since, parse_dates
+from classification import classify_inventory
+from forecast import forecast_inventory
+from ingest import REQUIRED_COLUMNS, iter_upload_chunks, process_data
+from metrics import timed
+from schema import concat_frames
+
+# ============== DELTA UPLOADS ==============
+# A delta is a small file of changed SKUs merged into a processed frame by
+# sku. Only the touched rows are re-aged and reclassified, and the dashboard
+# summary is updated by swapping those rows' contributions.
+#
+# Delta columns (all but sku optional):
+#   sold            units sold since the last upload; a sale resets days idle
+#   received        units received since the last upload
+#   current_stock   counted stock, applied after sold and received
+#   last_sale_date  YYYY-MM-DD or dd/mm/YYYY; days idle are taken against as_of
+#   unit_cost, holding_cost
+# SKUs not in the frame are added as new products and need REQUIRED_COLUMNS.
+
+# Movements add up when a sku appears more than once; other columns take the last row
+SUM_COLUMNS = ['sold', 'received']
+
+
+def parse_delta(contents):
+    """Read a delta upload (CSV, Parquet or Arrow), returning (delta, error)"""
+    try:
+        delta = concat_frames(iter_upload_chunks(contents))
+    except Exception as e:
+        return None, str(e)
+    if 'sku' not in delta.columns:
+        return None, "Missing: sku"
+    return delta, None
+
+
+def _collapse(delta):
+    """One row per sku: movements summed, absolute values from the last row"""
+    if not delta['sku'].duplicated().any():
+        return delta.reset_index(drop=True)
+    how = {col: ('sum' if col in SUM_COLUMNS else 'last') for col in delta.columns if col != 'sku'}
+    return delta.groupby('sku', sort=False, observed=True).agg(how).reset_index()
+
+
+def _update_rows(rows, changes, as_of):
+    """Apply changes (aligned to rows) to a copy of existing rows, in place"""
+    stock = rows['current_stock'].to_numpy(dtype=np.int64)
+    if 'received' in changes.columns:
+        received = changes['received'].fillna(0).to_numpy(dtype=np.int64)
+        stock = stock + received
+        if 'initial_quantity' in rows.columns:
+            rows['initial_quantity'] = rows['initial_quantity'].to_numpy(dtype=np.int64) + received
+    sold = changes['sold'].fillna(0).to_numpy(dtype=np.int64) if 'sold' in changes.columns else np.zeros(len(rows), dtype=np.int64)
+    stock = stock - sold
+    if 'total_sold' in rows.columns:
+        rows['total_sold'] = rows['total_sold'].to_numpy(dtype=np.int64) + sold
+    if 'current_stock' in changes.columns:
+        stock = np.where(changes['current_stock'].notna(), changes['current_stock'].to_numpy(dtype=np.float64, na_value=0), stock).astype(np.int64)
+    rows['current_stock'] = np.maximum(stock, 0)
+
+    for col in ('unit_cost', 'holding_cost'):
+        if col in changes.columns:
+            rows[col] = changes[col].where(changes[col].notna(), rows[col]).to_numpy()
+    rows['stock_value'] = rows['current_stock'] * rows['unit_cost'].to_numpy(dtype=np.float64)
+
+    # NaN for rows with no date to age from, as age_inventory leaves them; a sale dates them
+    days = rows['days_since_last_sale'].to_numpy(dtype=np.float64, na_value=np.nan)
+    days = np.where(sold > 0, 0, days)
+    sale_dates = pd.Series(pd.NaT, index=rows.index)
+    if 'last_sale_date' in changes.columns:
+        sale_dates = pd.Series(parse_dates(changes['last_sale_date']).to_numpy(), index=rows.index)
+        # As age_inventory counts them: a sale dated after as_of is 0 days ago
+        since = days_since(sale_dates, as_of)
+        days = np.where(np.isnan(since), days, since)
+    rows['days_since_last_sale'] = days.astype(np.int64) if not np.isnan(days).any() else days
+    if 'last_sale_date' in rows.columns:
+        new_date = sale_dates.dt.strftime('%Y-%m-%d').where(sale_dates.notna(), np.where(sold > 0, as_of.isoformat(), None))
+        rows['last_sale_date'] = new_date.where(new_date.notna(), rows['last_sale_date'].astype(object))
+    return rows
+
+
+def _write_back(frame, positions, rows):
+    """Store rows at positions of frame, in place, keeping frame's dtypes"""
+    for col in rows.columns:
+        if col not in frame.columns:
+            continue
+        target = frame[col].dtype
+        values = rows[col]
+        if isinstance(target, pd.CategoricalDtype):
+            extra = pd.Index(values.dropna().astype(object).unique()).difference(target.categories)
+            if len(extra):
+                frame[col] = frame[col].cat.add_categories(extra)
+            values = values.astype(object)
+        elif values.dtype != target and target.kind in 'iu':
+            info = np.iinfo(target)
+            if len(values) and (values.min() < info.min or values.max() > info.max):
+                frame[col] = frame[col].astype(np.int64)
+            else:
+                values = values.astype(target)
+        elif values.dtype != target:
+            values = values.astype(target)
+        frame.iloc[positions, frame.columns.get_loc(col)] = values.to_numpy()
+
+
+@timed('apply_delta')
+def apply_delta(df, summary, delta, as_of=None, thresholds=None, sku_index=None):
+    """Merge a delta into a processed frame and its summary.
+
+    df must have a RangeIndex with summary computed from it; neither is
+    modified. Building the sku lookup is the only full pass over df, so
+    callers applying several deltas to one frame can pass
+    sku_index=pd.Index(df['sku']) built once. Returns (frame, summary,
+    changed, error) where changed counts updated plus added SKUs.
+    """
+    as_of = as_of or date.today()
+    delta = _collapse(delta)
+    sku_index = pd.Index(df['sku']) if sku_index is None else sku_index
+    if not sku_index.is_unique:
+        return None, None, 0, "Dataset has duplicate SKUs; upload a full file instead"
+    positions = sku_index.get_indexer(delta['sku'])
+    known = positions >= 0
+
+    before = df.iloc[positions[known]]
+    rows = _update_rows(before.copy(), delta[known].set_index(before.index), as_of)
+    classify_inventory(rows, thresholds)
+    forecast_inventory(rows, as_of, thresholds)
+
+    added = delta[~known].reset_index(drop=True)
+    if len(added):
+        missing = [c for c in REQUIRED_COLUMNS if c not in added.columns or added[c].isna().any()]
+        if missing:
+            return None, None, 0, f"New SKUs need: {', '.join(missing)}"
+        added = added.drop(columns=[c for c in SUM_COLUMNS if c in added.columns])
+        added, error = process_data(added, thresholds, as_of)
+        if error:
+            return None, None, 0, error
+        added = added[[c for c in df.columns if c in added.columns]]
+
+    frame = df.copy()
+    _write_back(frame, positions[known], rows)
+    if len(added):
+        frame = concat_frames([frame, added])
+    # Re-read the changed rows so the summary sees exactly the stored (downcast) values
+    after = frame.iloc[np.concatenate([positions[known], np.arange(len(df), len(frame))])]
+    return frame, summary.replace_rows(before, after, frame), len(delta), None
@@ -0,0 +1,200 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from aging import days_since, parse_dates
+from metrics import timed
+
+# ============== SALES EVENT LOGS ==============
+# A POS export of individual sales (sku, date, qty; one row per line item)
+# reduced to the per-SKU frame process_data expects. Chunks are reduced as
+# they arrive: each one is grouped by sku over sorted arrays (argsort of a
+# sku hash, ufunc.reduceat) and merged into running per-SKU arrays kept in
+# the same order, so only one chunk and one row per SKU are ever held.
+#
+# Event columns:
+#   sku, date   YYYY-MM-DD or dd/mm/YYYY
+#   qty         units sold; negative for returns
+# Product columns (product_name, category, unit_cost, current_stock, ...) may
+# ride along on each line, the last value per SKU wins. Without them the log
+# is joined onto a catalog, usually the inventory already loaded.
+
+EVENT_COLUMNS = ['sku', 'date', 'qty']
+CATALOG_COLUMNS = ['product_name', 'category', 'unit_cost', 'unit_price', 'current_stock', 'holding_cost', 'stock_received_date']
+# Catalog columns a log derives afresh, so stale copies are dropped before the join
+SALES_COLUMNS = ['total_sold', 'last_sale_date', 'days_since_last_sale', 'monthly_velocity', 'movement_category',
+                 'stock_status', 'urgency_score', 'action_required']
+
+NO_DAY = np.iinfo(np.int64).min
+NEVER_DAY = np.iinfo(np.int64).max
+
+
+def is_event_log(columns):
+    """Whether a file with these columns is a sales event log rather than an inventory"""
+    return set(EVENT_COLUMNS) <= set(columns)
+
+
+def needs_catalog(columns):
+    """Whether an event log with these columns must be joined onto a catalog for its product columns"""
+    from ingest import REQUIRED_COLUMNS
+    return is_event_log(columns) and not set(REQUIRED_COLUMNS) <= set(columns)
+
+
+def _group_reduce(keys, sold, last_day, first_day):
+    """Per-key sum of sold, max of last_day and min of first_day over arrays sorted by key.
+
+    Returns the sorted distinct keys, the position of each one's first row
+    in sort order, the sort order and the three reductions.
+    """
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return (keys[starts], order[starts], np.add.reduceat(sold[order], starts),
+            np.maximum.reduceat(last_day[order], starts), np.minimum.reduceat(first_day[order], starts))
+
+
+def _iso(days):
+    """YYYY-MM-DD strings for day numbers, None where there is no day; each distinct day is formatted once"""
+    unique, inverse = np.unique(days, return_inverse=True)
+    missing = (unique == NO_DAY) | (unique == NEVER_DAY)
+    labels = np.datetime_as_string(np.where(missing, 0, unique).astype('datetime64[D]')).astype(object)
+    labels[missing] = None
+    return labels[inverse]
+
+
+class EventReducer:
+    """Running per-SKU totals of a sales event log, fed one chunk at a time.
+
+    SKUs are keyed by a 64-bit hash and the running totals are kept sorted
+    by it: a chunk is reduced on its own, then merged in with searchsorted,
+    updating SKUs seen before in place and inserting new ones.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.skipped = 0
+        self._hash = np.zeros(0, dtype=np.uint64)
+        self._sku = np.zeros(0, dtype=object)
+        self._sold = np.zeros(0, dtype=np.int64)
+        self._last = np.zeros(0, dtype=np.int64)
+        self._first = np.zeros(0, dtype=np.int64)
+        self._catalog = []
+
+    @timed('reduce_events')
+    def add(self, chunk):
+        missing = [c for c in EVENT_COLUMNS if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing: {', '.join(missing)}")
+        day = parse_dates(chunk['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        qty = chunk['qty'].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = (day != NO_DAY) & ~np.isnan(qty) & chunk['sku'].notna().to_numpy()
+        self.events += int(valid.sum())
+        self.skipped += int(len(chunk) - valid.sum())
+        if not valid.any():
+            return self
+
+        day, qty = day[valid], qty[valid].astype(np.int64)
+        sku = chunk['sku'].to_numpy(dtype=object)[valid]
+        # Returns count against units sold but are not a sale
+        sale_day = np.where(qty > 0, day, NO_DAY)
+        keys, rows, sold, last, first = _group_reduce(pd.util.hash_array(sku), qty, sale_day, day)
+
+        pos = np.searchsorted(self._hash, keys)
+        seen = pos < len(self._hash)
+        seen[seen] = self._hash[pos[seen]] == keys[seen]
+        at = pos[seen]
+        self._sold[at] += sold[seen]
+        self._last[at] = np.maximum(self._last[at], last[seen])
+        self._first[at] = np.minimum(self._first[at], first[seen])
+        new = ~seen
+        if new.any():
+            at = pos[new]
+            self._hash = np.insert(self._hash, at, keys[new])
+            self._sku = np.insert(self._sku, at, sku[rows[new]])
+            self._sold = np.insert(self._sold, at, sold[new])
+            self._last = np.insert(self._last, at, last[new])
+            self._first = np.insert(self._first, at, first[new])
+
+        present = [c for c in CATALOG_COLUMNS if c in chunk.columns]
+        if present:
+            self._catalog.append(chunk.loc[valid, ['sku'] + present].drop_duplicates('sku', keep='last'))
+            # Compact once the kept rows outgrow the SKUs, so this stays linear in the log
+            if sum(len(part) for part in self._catalog) > 4 * len(self._hash):
+                self.catalog()
+        return self
+
+    def sales(self):
+        """One row per SKU: total_sold, last_sale_date and first_event_date"""
+        return pd.DataFrame({
+            'sku': self._sku,
+            'total_sold': self._sold,
+            'last_sale_date': _iso(self._last),
+            'first_event_date': _iso(self._first),
+        })
+
+    def catalog(self):
+        """Last product columns seen per SKU, or None if the log carried none"""
+        if not self._catalog:
+            return None
+        if len(self._catalog) > 1:
+            self._catalog = [pd.concat(self._catalog, ignore_index=True).drop_duplicates('sku', keep='last')]
+        return self._catalog[0].reset_index(drop=True)
+
+
+def reduce_events(chunks, progress=None):
+    """Fold an iterable of event log chunks into an EventReducer.
+
+    progress(events) is called after each chunk; returning False stops and
+    returns None.
+    """
+    reducer = EventReducer()
+    for chunk in chunks:
+        reducer.add(chunk)
+        if progress is not None and progress(reducer.events) is False:
+            return None
+    if reducer.events == 0:
+        raise ValueError("No sales events found")
+    return reducer
+
+
+def _column(frame, name):
+    return frame[name].astype(object).to_numpy() if name in frame.columns else np.full(len(frame), None, dtype=object)
+
+
+@timed('event_inventory')
+def event_inventory(reducer, catalog=None, as_of=None):
+    """Per-SKU inventory frame for process_data from a reduced log.
+
+    Product columns come from the log itself when it carries all of
+    product_name, category, unit_cost and current_stock, otherwise from
+    catalog; SKUs the catalog does not list are dropped. Catalog SKUs with no
+    events sold nothing and keep their previous last sale, or count as idle
+    since they were received.
+    """
+    from ingest import REQUIRED_COLUMNS
+
+    own = reducer.catalog()
+    if own is not None and all(c in own.columns for c in REQUIRED_COLUMNS if c != 'sku'):
+        catalog = own
+    elif catalog is None:
+        raise ValueError("This sales log has no product columns; load an inventory first, then upload the log")
+    sales = reducer.sales()
+    frame = catalog.drop(columns=[c for c in SALES_COLUMNS if c in catalog.columns]).reset_index(drop=True)
+    positions = pd.Index(sales['sku']).get_indexer(frame['sku'])
+    matched = positions >= 0
+    take = np.where(matched, positions, 0)
+
+    frame['total_sold'] = np.where(matched, sales['total_sold'].to_numpy()[take], 0)
+    first_event = np.where(matched, sales['first_event_date'].to_numpy()[take], None)
+    received = _column(frame, 'stock_received_date')
+    received = np.where(pd.isna(received), first_event, received)
+    last_sale = np.where(matched, sales['last_sale_date'].to_numpy()[take], None)
+    for fallback in (_column(catalog.reset_index(drop=True), 'last_sale_date'), received):
+        last_sale = np.where(pd.isna(last_sale), fallback, last_sale)
+    frame['stock_received_date'] = received
+    frame['last_sale_date'] = last_sale
+
+    held = days_since(frame['stock_received_date'], as_of or date.today())
+    frame['monthly_velocity'] = np.round(frame['total_sold'] / np.maximum(np.nan_to_num(held), 1) * 30, 2)
+    return frame
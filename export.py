@@ -0,0 +1,353 @@
+import io
+from urllib.parse import urlencode
+
+from metrics import stage
+
+# ============== EXPORTS ==============
+# Stored datasets as downloadable files, encoded EXPORT_CHUNK_ROWS rows at a
+# time and streamed block by block, so an export never holds more than one
+# block's output however large the store is:
+#
+#   GET /export/<dataset_id>/<view>.<fmt>
+#
+#   view     audit      every row and column of the processed frame
+#            priority   the priority ranking: rank, sku, status and the table's columns
+#   fmt      csv, parquet or xlsx
+#   sort     priority only: column:asc or column:desc, as the table is sorted
+#   filter   priority only: the table's filter query
+#
+# CSV is written by pyarrow when it is installed (several times faster than
+# pandas) and by DataFrame.to_csv otherwise. Parquet needs pyarrow and gets
+# one row group per block. xlsx is written here rather than by an Excel
+# library: a one-sheet workbook is a zip of a few fixed XML parts plus the
+# sheet, whose XML is built a column at a time per block and compressed into
+# a zip entry as it goes, so rows go out as they are encoded; cell-by-cell
+# writers take minutes for a million rows. Larger exports than EXCEL_MAX_ROWS
+# rows are refused with a 413.
+
+EXPORT_CHUNK_ROWS = 100_000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+EXPORT_VIEWS = ['audit', 'priority']
+
+# After the rank column each block gets
+PRIORITY_EXPORT_COLUMNS = ['sku', 'stock_status', 'product_name', 'category', 'current_stock', 'stock_value', 'days_since_last_sale',
+                           'action_required', 'urgency_score', 'sell_through_date', 'dead_stock_date']
+
+# A worksheet holds 1,048,576 rows, one of them the header
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def export_formats():
+    """Formats this install can write: Parquet needs pyarrow"""
+    from ingest import import_pyarrow
+    try:
+        import_pyarrow()
+    except ImportError:
+        return ['csv', 'xlsx']
+    return list(EXPORT_FORMATS)
+
+
+def export_url(dataset_id, view, fmt, sort_by=None, filter_query=''):
+    """Download link for a dataset; sort_by and filter_query are the priority table's own"""
+    params = {}
+    if view == 'priority':
+        if sort_by:
+            params['sort'] = f"{sort_by[0]['column_id']}:{sort_by[0]['direction']}"
+        if filter_query:
+            params['filter'] = filter_query
+    return f"/export/{dataset_id}/{view}.{fmt}" + (f"?{urlencode(params)}" if params else '')
+
+
+def parse_sort(value, columns):
+    """sort_key tuple for priority_order from a sort parameter; raises ValueError if it is unusable"""
+    if not value:
+        return ()
+    column, _, direction = value.partition(':')
+    if column not in columns or direction not in ('asc', 'desc'):
+        raise ValueError("sort must be column:asc or column:desc for a column of the dataset")
+    return ((column, direction),)
+
+
+def audit_blocks(df, chunksize=EXPORT_CHUNK_ROWS):
+    """Yield df in row blocks; an empty df is one empty block, so the file still gets its header"""
+    for start in range(0, max(len(df), 1), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def priority_blocks(df, positions, chunksize=EXPORT_CHUNK_ROWS):
+    """Yield the priority ranking in row blocks: the rows at positions, in order, with a 1-based rank"""
+    import numpy as np
+    columns = [col for col in PRIORITY_EXPORT_COLUMNS if col in df.columns]
+    indexer = [df.columns.get_loc(col) for col in columns]
+    for start in range(0, max(len(positions), 1), chunksize):
+        block = df.iloc[positions[start:start + chunksize], indexer]
+        block.insert(0, 'rank', np.arange(start + 1, start + len(block) + 1))
+        yield block
+
+
+class _Sink(io.BytesIO):
+    """BytesIO whose contents are handed out and cleared as they are written"""
+
+    def take(self):
+        data = self.getvalue()
+        self.seek(0)
+        self.truncate()
+        return data
+
+
+class _Pipe:
+    """Write-only, unseekable sink, so zipfile streams its entries (sizes follow each entry) instead of seeking back"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def csv_body(blocks):
+    """CSV bytes per block, dates as YYYY-MM-DD"""
+    from ingest import import_pyarrow
+    try:
+        pa = import_pyarrow()
+    except ImportError:
+        yield from _pandas_csv_body(blocks)
+        return
+    import pyarrow.csv as pacsv
+    from api import arrow_table
+    sink = _Sink()
+    writer = schema = None
+    for block in blocks:
+        with stage('export_csv', len(block)):
+            table = arrow_table(pa, block, schema)
+            if writer is None:
+                schema = table.schema
+                writer = pacsv.CSVWriter(sink, schema)
+            writer.write_table(table)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+
+def _pandas_csv_body(blocks):
+    from schema import rounded_floats
+    header = True
+    for block in blocks:
+        with stage('export_csv', len(block)):
+            text = rounded_floats(block).to_csv(index=False, header=header, date_format='%Y-%m-%d')
+        header = False
+        yield text.encode()
+
+
+def parquet_body(blocks):
+    """Parquet bytes, one row group per block; the footer comes with the last piece"""
+    from ingest import import_pyarrow
+    pa = import_pyarrow()
+    import pyarrow.parquet as pq
+    from api import arrow_table
+    sink = _Sink()
+    writer = schema = None
+    for block in blocks:
+        with stage('export_parquet', len(block)):
+            table = arrow_table(pa, block, schema)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(sink, schema, compression='snappy')
+            writer.write_table(table, row_group_size=len(table))
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # Cell styles: 0 plain, 1 date, 2 bold header
+    'xl/styles.xml': (
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+SHEET_HEAD = ('<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetViews><sheetView workbookViewId="0">'
+              '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/></sheetView></sheetViews><sheetData>')
+SHEET_TAIL = '</sheetData></worksheet>'
+EMPTY_CELL = '<c/>'
+# Rows of cell XML built at once
+XLSX_WRITE_ROWS = 20_000
+# Day 0 of Excel's date serials, as it counts them
+EXCEL_EPOCH_OFFSET = 25569
+
+# Characters XML 1.0 cannot carry at all
+_XML_ILLEGAL = '[\x00-\x08\x0b\x0c\x0e-\x1f]'
+
+
+def _header_cell(name):
+    from xml.sax.saxutils import escape
+    return f'<c t="inlineStr" s="2"><is><t>{escape(str(name))}</t></is></c>'
+
+
+def _text_cells(values):
+    """Inline-string cell XML for an object array of text"""
+    import pandas as pd
+    text = pd.Series(values, dtype=object)
+    missing = text.isna().to_numpy()
+    text = text.where(~missing, '').astype(str)
+    text = (text.str.replace('&', '&amp;', regex=False).str.replace('<', '&lt;', regex=False)
+            .str.replace('>', '&gt;', regex=False).str.replace(_XML_ILLEGAL, '', regex=True))
+    cells = ('<c t="inlineStr"><is><t xml:space="preserve">' + text + '</t></is></c>').to_numpy(dtype=object)
+    cells[missing] = EMPTY_CELL
+    return cells
+
+
+def _value_cells(values):
+    """Cell XML for an Index of distinct values"""
+    import numpy as np
+    kind = values.dtype.kind
+    if kind == 'M':
+        days = values.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64) + EXCEL_EPOCH_OFFSET
+        return '<c s="1"><v>' + days.astype(str).astype(object) + '</v></c>'
+    if kind in 'iub':
+        return ('<c t="b"><v>' if kind == 'b' else '<c><v>') + values.to_numpy().astype(np.int64).astype(str).astype(object) + '</v></c>'
+    if kind == 'f':
+        numbers = values.to_numpy(dtype=np.float64)
+        cells = '<c><v>' + numbers.astype(str).astype(object) + '</v></c>'
+        cells[~np.isfinite(numbers)] = EMPTY_CELL
+        return cells
+    return _text_cells(values.to_numpy(dtype=object))
+
+
+def _column_cells(series):
+    """Cell XML for one column of a block, without cell references (cells are placed in order).
+
+    Each distinct value is formatted once; code -1 (missing) picks the trailing empty cell.
+    """
+    import numpy as np
+    import pandas as pd
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, values = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, values = pd.factorize(series)
+        values = pd.Index(values)
+    return np.append(_value_cells(values), EMPTY_CELL)[codes]
+
+
+def xlsx_body(blocks, sheet_name='Stock Audit'):
+    """xlsx bytes: a one-sheet workbook whose rows are compressed and sent a block at a time.
+
+    Sheets stop at EXCEL_MAX_ROWS rows.
+    """
+    import zipfile
+    from schema import rounded_floats
+    sink = _Pipe()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as workbook:
+        for name, xml in XLSX_PARTS.items():
+            workbook.writestr(name, XML_DECLARATION + xml.replace('{sheet}', sheet_name))
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            row = 0
+            for block in blocks:
+                block = rounded_floats(block.iloc[:EXCEL_MAX_ROWS - row])
+                with stage('export_xlsx', len(block)):
+                    if not row:
+                        sheet.write(''.join([XML_DECLARATION, SHEET_HEAD, '<row>', *map(_header_cell, block.columns), '</row>']).encode())
+                    # Cell XML is several times the size of the values, so it is built a slice at a time
+                    for start in range(0, len(block), XLSX_WRITE_ROWS):
+                        columns = [_column_cells(block[col].iloc[start:start + XLSX_WRITE_ROWS]) for col in block.columns]
+                        sheet.write(('<row>' + '</row><row>'.join(map(''.join, zip(*columns))) + '</row>').encode())
+                row += len(block)
+                yield sink.take()
+                if row >= EXCEL_MAX_ROWS:
+                    break
+            sheet.write(SHEET_TAIL.encode())
+    yield sink.take()
+
+
+EXPORT_BODIES = {'csv': csv_body, 'parquet': parquet_body, 'xlsx': xlsx_body}
+
+
+def install(server, datasets, priority=None):
+    """Add the /export route to a Flask server.
+
+    datasets(dataset_id) looks up a stored frame and priority(dataset_id,
+    sort_key, filter_query) its row positions in priority order, by default
+    ranked afresh on every request.
+    """
+    from flask import Response, request, stream_with_context
+    from api import APIError
+
+    def ranking(dataset_id, sort_key, filter_query):
+        from ranking import rank_positions
+        sort_by = [{'column_id': column, 'direction': direction} for column, direction in sort_key]
+        return rank_positions(datasets(dataset_id), sort_by, filter_query)
+
+    priority = priority or ranking
+
+    @server.route('/export/<dataset_id>/<view>.<fmt>')
+    def export(dataset_id, view, fmt):
+        if view not in EXPORT_VIEWS or fmt not in EXPORT_FORMATS:
+            raise APIError(f"Exports are {', '.join(EXPORT_VIEWS)} as {', '.join(EXPORT_FORMATS)}", status=404)
+        if fmt == 'parquet':
+            from ingest import import_pyarrow
+            try:
+                import_pyarrow()
+            except ImportError as e:
+                raise APIError(str(e), status=406) from None
+        df = datasets(dataset_id)
+        if df is None:
+            raise APIError(f"Unknown dataset {dataset_id}; summary-only uploads keep no rows to export", status=404)
+        if view == 'priority':
+            try:
+                sort_key = parse_sort(request.args.get('sort'), df.columns)
+                positions = priority(dataset_id, sort_key, request.args.get('filter', '').strip())
+            except ValueError as e:
+                raise APIError(str(e)) from None
+            rows, blocks = len(positions), priority_blocks(df, positions)
+        else:
+            rows, blocks = len(df), audit_blocks(df)
+        if fmt == 'xlsx' and rows > EXCEL_MAX_ROWS:
+            raise APIError(f"{rows:,} rows do not fit in an Excel sheet; export csv or parquet instead", status=413)
+        headers = {'Content-Disposition': f'attachment; filename="stock-{view}-{dataset_id[:8]}.{fmt}"'}
+        return Response(stream_with_context(EXPORT_BODIES[fmt](blocks)), mimetype=EXPORT_FORMATS[fmt], headers=headers)
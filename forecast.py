@@ -0,0 +1,123 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from classification import resolve_thresholds
+from metrics import timed
+
+# ============== DEMAND FORECAST ==============
+# Projects each SKU's sales forward from its observed rate, shaped by its
+# category's selling season, to give a sell-through date and the date the
+# stock on hand is projected to go dead. Every SKU is solved at once: a
+# (category x day) table of cumulative seasonal demand is built once, and one
+# searchsorted over the flattened table answers "on which day does demand
+# reach this many units" for all rows.
+
+HORIZON_DAYS = 730
+# Furthest back an observed rate is deseasonalized over
+HISTORY_DAYS = 730
+
+FORECAST_COLUMNS = ['sell_through_date', 'dead_stock_date']
+# Demand within this fraction of a target counts as reaching it: a sell-through
+# that lands exactly on a day (4 units at 1/7 a day) must not slip to the next
+# one because a sum of floats came out a hair short
+DEMAND_TOLERANCE = 1e-9
+
+# Months (1-12) each category sells faster in, and by how much: sales in
+# season run SEASON_UPLIFT times the usual rate. generate_data simulates
+# sales from the same table.
+SEASON_MONTHS = {
+    'Groceries': [12, 1, 4],  # Holidays, back to school
+    'Beverages': [10, 11, 12, 1, 2],  # Hot season
+    'Snacks': [3, 4, 6, 7, 12],  # School holidays
+    'Personal Care': [1, 2, 9],  # New year, back to school
+    'Household': [1, 4, 12],
+    'Airtime & Essentials': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],  # Always needed
+    'Bread & Bakery': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],  # Daily staple
+    'Tobacco & Extras': [12, 1, 6],
+}
+SEASON_UPLIFT = (1.3, 2.0)
+
+
+def season_table(categories, as_of):
+    """Daily demand factor per category from HISTORY_DAYS before as_of to HORIZON_DAYS after it.
+
+    In-season months sell at the mean SEASON_UPLIFT; categories not in
+    SEASON_MONTHS sell evenly all year.
+    """
+    days = np.datetime64(as_of, 'D') + np.arange(-HISTORY_DAYS, HORIZON_DAYS + 1)
+    month = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    factors = np.ones((len(categories), len(days)))
+    for i, category in enumerate(categories):
+        months = SEASON_MONTHS.get(category)
+        if months and len(months) < 12:
+            factors[i, np.isin(month, months)] = sum(SEASON_UPLIFT) / 2
+    return factors
+
+
+def _observed_rate(df):
+    """Units sold per day over the time each SKU has been held"""
+    if 'total_sold' in df.columns and 'days_in_stock' in df.columns:
+        sold = df['total_sold'].to_numpy(dtype=np.float64, na_value=0)
+        held = df['days_in_stock'].to_numpy(dtype=np.float64, na_value=np.nan)
+        return sold / np.maximum(np.nan_to_num(held, nan=30), 1), np.nan_to_num(held, nan=30)
+    if 'monthly_velocity' in df.columns:
+        return df['monthly_velocity'].to_numpy(dtype=np.float64, na_value=0) / 30, np.full(len(df), 30.0)
+    return np.zeros(len(df)), np.full(len(df), 30.0)
+
+
+@timed('forecast')
+def forecast_inventory(df, as_of=None, thresholds=None):
+    """Add sell_through_date and dead_stock_date to df in place.
+
+    - The observed rate is deseasonalized over the days the SKU was held and
+      capped at one unit per day idle, so a SKU that sold well once but has
+      gone quiet is not projected to sell at its old pace.
+    - sell_through_date: the day projected demand clears current_stock; NaT
+      when nothing is left or it would take longer than HORIZON_DAYS.
+    - dead_stock_date: for stock still on hand, the day it passes the dead
+      stock cut-off when the next sale is projected to come too late for it
+      (in the past for stock that is already dead); NaT when it keeps selling
+      or sells out first.
+    """
+    t = resolve_thresholds(thresholds)
+    as_of = np.datetime64(as_of or date.today(), 'D')
+    n = len(df)
+    category = df['category'] if isinstance(df['category'].dtype, pd.CategoricalDtype) else df['category'].astype('category')
+    cat = category.cat.codes.to_numpy().astype(np.intp)
+    labels = list(category.cat.categories.astype(str)) + [None]
+    cat[cat < 0] = len(labels) - 1
+
+    # Cumulative demand per category; column HISTORY_DAYS is as_of
+    cumulative = np.concatenate([np.zeros((len(labels), 1)), np.cumsum(season_table(labels, as_of), axis=1)], axis=1)
+    rate, held = _observed_rate(df)
+    held = np.clip(held, 1, HISTORY_DAYS).astype(np.intp)
+    past = (cumulative[cat, HISTORY_DAYS] - cumulative[cat, HISTORY_DAYS - held]) / held
+    idle = df['days_since_last_sale'].to_numpy(dtype=np.float64, na_value=0)
+    base = np.minimum(rate / past, 1 / (np.maximum(idle, 0) + 1))
+
+    # Forward demand per unit of base rate, offset per category so one sorted array covers every category
+    forward = cumulative[:, HISTORY_DAYS:HISTORY_DAYS + HORIZON_DAYS + 1] - cumulative[:, [HISTORY_DAYS]]
+    span = forward[:, -1].max() + 1
+    flat = (forward + np.arange(len(labels))[:, None] * span).ravel()
+
+    def days_until(units):
+        """Days from as_of until projected demand reaches units, HORIZON_DAYS + 1 when it never does"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            need = np.where(base > 0, units / base, np.inf)
+        need = np.minimum(need * (1 - DEMAND_TOLERANCE), span - 0.5)
+        return np.searchsorted(flat, need + cat * span) - cat * (HORIZON_DAYS + 1)
+
+    stock = df['current_stock'].to_numpy(dtype=np.float64, na_value=0)
+    on_hand = stock > 0
+    sell_days = days_until(stock)
+    sells = on_hand & (sell_days <= HORIZON_DAYS)
+
+    dead_at = as_of + (t['dead_days'] + 1 - idle.astype(np.int64))
+    next_sale = as_of + days_until(np.ones(n))
+    goes_dead = on_hand & ((idle > t['dead_days']) | (next_sale > dead_at)) & ~(sells & (as_of + sell_days <= dead_at))
+
+    df['sell_through_date'] = np.where(sells, as_of + sell_days, np.datetime64('NaT')).astype('datetime64[ns]')
+    df['dead_stock_date'] = np.where(goes_dead, dead_at, np.datetime64('NaT')).astype('datetime64[ns]')
+    return df
@@ -2,192 +2,199 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import random
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-def generate_spaza_inventory(num_products=120, seed=42):
+from classification import classify_inventory
+from forecast import SEASON_MONTHS, SEASON_UPLIFT, forecast_inventory
+from schema import apply_schema
+
+# Spaza shop categories with BWP price ranges and characteristics; their
+# selling seasons are forecast.SEASON_MONTHS
+CATEGORIES = {
+    'Groceries': {
+        'price_range': (8, 120),
+        'holding_cost_pct': 0.02,
+        'products': [
+            ('Maize Meal 2.5kg', 'White Star'),
+            ('Maize Meal 5kg', 'White Star'),
+            ('Maize Meal 1kg', 'Iwisa'),
+            ('Cooking Oil 750ml', 'Sunfoil'),
+            ('Cooking Oil 2L', 'Golden Fry'),
+            ('Sugar 2kg', 'White'),
+            ('Sugar 1kg', 'Brown'),
+            ('Rice 2kg', 'Tastic'),
+            ('Rice 1kg', 'Spekko'),
+            ('Flour 2.5kg', 'Snowflake'),
+            ('Salt 500g', 'Cerebos'),
+            ('Tea 100 bags', 'Five Roses'),
+            ('Tea 50 bags', 'Joko'),
+            ('Coffee 200g', 'Ricoffy'),
+            ('Beans 410g', 'KOO'),
+            ('Pilchards 400g', 'Lucky Star'),
+            ('Chakalaka 410g', 'KOO'),
+            ('Tomato Sauce 700ml', 'All Gold'),
+            ('Peanut Butter 400g', 'Black Cat'),
+            ('Jam 450g', 'Fynbos'),
+            ('Milk Powder 400g', 'Nespray'),
+            ('Custard 500g', 'Ultramel'),
+        ]
+    },
+    'Beverages': {
+        'price_range': (5, 35),
+        'holding_cost_pct': 0.015,
+        'products': [
+            ('Coca Cola 2L', 'Coke'),
+            ('Coca Cola 500ml', 'Coke'),
+            ('Fanta Orange 2L', 'Fanta'),
+            ('Sprite 500ml', 'Sprite'),
+            ('Oros 2L', 'Orange'),
+            ('Oros 2L', 'Tropical'),
+            ('Mazoe 2L', 'Orange'),
+            ('Juice 1L', 'Ceres Apple'),
+            ('Juice 1L', 'Liqui Fruit'),
+            ('Water 500ml', 'Bonaqua'),
+            ('Water 5L', 'Aquartz'),
+            ('Energy Drink', 'Score'),
+            ('Energy Drink', 'Red Bull'),
+            ('Milk 1L', 'Clover Fresh'),
+            ('Milk 1L', 'Steri Stumpie'),
+            ('Yoghurt 1kg', 'Danone'),
+        ]
+    },
+    'Snacks': {
+        'price_range': (3, 25),
+        'holding_cost_pct': 0.01,
+        'products': [
+            ('Chips 125g', 'Simba Chutney'),
+            ('Chips 125g', 'Lays Salt'),
+            ('Chips 36g', 'Nik Naks'),
+            ('Chips 125g', 'Doritos'),
+            ('Biscuits', 'Marie'),
+            ('Biscuits', 'Tennis'),
+            ('Biscuits', 'Romany Creams'),
+            ('Biscuits', 'Oreos'),
+            ('Chocolate', 'Cadbury Dairy Milk'),
+            ('Chocolate', 'Bar One'),
+            ('Chocolate', 'KitKat'),
+            ('Sweets', 'Jelly Babies'),
+            ('Sweets', 'Wine Gums'),
+            ('Sweets', 'Chappies'),
+            ('Popcorn', 'Act II'),
+            ('Nuts 100g', 'Peanuts Salted'),
+            ('Dried Fruit', 'Safari Mix'),
+        ]
+    },
+    'Personal Care': {
+        'price_range': (12, 85),
+        'holding_cost_pct': 0.012,
+        'products': [
+            ('Soap', 'Sunlight Bar'),
+            ('Soap', 'Lux'),
+            ('Soap', 'Dettol'),
+            ('Toothpaste 100ml', 'Colgate'),
+            ('Toothpaste 50ml', 'Aquafresh'),
+            ('Lotion 400ml', 'Vaseline'),
+            ('Lotion 200ml', 'Dawn'),
+            ('Petroleum Jelly 250ml', 'Vaseline'),
+            ('Deodorant', 'Shield'),
+            ('Deodorant', 'Axe'),
+            ('Shampoo 400ml', 'Sunsilk'),
+            ('Body Wash 400ml', 'Dettol'),
+            ('Roll-on', 'Nivea'),
+            ('Face Cream', 'Pond\'s'),
+            ('Hair Food', 'Sta Sof Fro'),
+            ('Sanitary Pads', 'Always'),
+        ]
+    },
+    'Household': {
+        'price_range': (8, 65),
+        'holding_cost_pct': 0.008,
+        'products': [
+            ('Candles 6 pack', 'White'),
+            ('Matches Box', 'Lion'),
+            ('Washing Powder 1kg', 'Omo'),
+            ('Washing Powder 2kg', 'Sunlight'),
+            ('Dish Soap 750ml', 'Sunlight'),
+            ('Bleach 750ml', 'Jik'),
+            ('Floor Polish 750ml', 'Cobra'),
+            ('Air Freshener', 'Airoma'),
+            ('Toilet Paper 2pk', 'Twinsaver'),
+            ('Paper Towels', 'Checkers'),
+            ('Refuse Bags 20s', 'Black'),
+            ('Sponge Scourers', 'Scrub'),
+            ('Steel Wool', 'Brillo'),
+            ('Insect Spray', 'Doom'),
+            ('Batteries AA 4pk', 'Eveready'),
+        ]
+    },
+    'Airtime & Essentials': {
+        'price_range': (5, 100),
+        'holding_cost_pct': 0.005,
+        'products': [
+            ('Airtime P5', 'Mascom'),
+            ('Airtime P10', 'Mascom'),
+            ('Airtime P25', 'Mascom'),
+            ('Airtime P50', 'Mascom'),
+            ('Airtime P5', 'Orange'),
+            ('Airtime P10', 'Orange'),
+            ('Airtime P25', 'Orange'),
+            ('Airtime P10', 'BTC'),
+            ('Data Bundle P20', 'Mascom'),
+            ('Data Bundle P50', 'Mascom'),
+            ('Electricity Voucher', 'BPC'),
+            ('Prepaid Water', 'WUC'),
+        ]
+    },
+    'Bread & Bakery': {
+        'price_range': (8, 35),
+        'holding_cost_pct': 0.04,  # Higher due to perishability
+        'products': [
+            ('Bread White', 'Albany'),
+            ('Bread Brown', 'Albany'),
+            ('Bread White', 'Blue Ribbon'),
+            ('Bread Whole Wheat', 'Sasko'),
+            ('Rolls 6 pack', 'Hot Dog'),
+            ('Scones 6 pack', 'Fresh'),
+            ('Vetkoek 4 pack', 'Fresh'),
+            ('Fat Cakes 6 pack', 'Homemade'),
+        ]
+    },
+    'Tobacco & Extras': {
+        'price_range': (25, 80),
+        'holding_cost_pct': 0.008,
+        'products': [
+            ('Cigarettes', 'Peter Stuyvesant'),
+            ('Cigarettes', 'Dunhill'),
+            ('Cigarettes', 'Rothmans'),
+            ('Cigarettes', 'Pacific'),
+            ('Loose Tobacco', 'Boxer'),
+            ('Rolling Paper', 'Rizla'),
+            ('Lighters 3pk', 'Bic'),
+        ]
+    }
+}
+
+
+def generate_spaza_inventory(num_products=120, seed=42, thresholds=None, vectorized=False):
     """
     Generate realistic Spaza Shop inventory data for Botswana
     - Prices in BWP (Botswana Pula)
     - Products typical of spaza shops
     - Seasonal patterns (holidays, school terms, weather)
     - Correlations between product types and movement
+    - vectorized=True delegates to simulate_inventory, which honors num_products
     """
     
+    if vectorized:
+        return simulate_inventory(num_products, seed, thresholds=thresholds)
+    
     np.random.seed(seed)
     random.seed(seed)
     
-    # Spaza shop categories with BWP price ranges and characteristics
-    categories = {
-        'Groceries': {
-            'price_range': (8, 120),
-            'holding_cost_pct': 0.02,
-            'seasonality': [12, 1, 4],  # Holidays, back to school
-            'products': [
-                ('Maize Meal 2.5kg', 'White Star'),
-                ('Maize Meal 5kg', 'White Star'),
-                ('Maize Meal 1kg', 'Iwisa'),
-                ('Cooking Oil 750ml', 'Sunfoil'),
-                ('Cooking Oil 2L', 'Golden Fry'),
-                ('Sugar 2kg', 'White'),
-                ('Sugar 1kg', 'Brown'),
-                ('Rice 2kg', 'Tastic'),
-                ('Rice 1kg', 'Spekko'),
-                ('Flour 2.5kg', 'Snowflake'),
-                ('Salt 500g', 'Cerebos'),
-                ('Tea 100 bags', 'Five Roses'),
-                ('Tea 50 bags', 'Joko'),
-                ('Coffee 200g', 'Ricoffy'),
-                ('Beans 410g', 'KOO'),
-                ('Pilchards 400g', 'Lucky Star'),
-                ('Chakalaka 410g', 'KOO'),
-                ('Tomato Sauce 700ml', 'All Gold'),
-                ('Peanut Butter 400g', 'Black Cat'),
-                ('Jam 450g', 'Fynbos'),
-                ('Milk Powder 400g', 'Nespray'),
-                ('Custard 500g', 'Ultramel'),
-            ]
-        },
-        'Beverages': {
-            'price_range': (5, 35),
-            'holding_cost_pct': 0.015,
-            'seasonality': [10, 11, 12, 1, 2],  # Hot season
-            'products': [
-                ('Coca Cola 2L', 'Coke'),
-                ('Coca Cola 500ml', 'Coke'),
-                ('Fanta Orange 2L', 'Fanta'),
-                ('Sprite 500ml', 'Sprite'),
-                ('Oros 2L', 'Orange'),
-                ('Oros 2L', 'Tropical'),
-                ('Mazoe 2L', 'Orange'),
-                ('Juice 1L', 'Ceres Apple'),
-                ('Juice 1L', 'Liqui Fruit'),
-                ('Water 500ml', 'Bonaqua'),
-                ('Water 5L', 'Aquartz'),
-                ('Energy Drink', 'Score'),
-                ('Energy Drink', 'Red Bull'),
-                ('Milk 1L', 'Clover Fresh'),
-                ('Milk 1L', 'Steri Stumpie'),
-                ('Yoghurt 1kg', 'Danone'),
-            ]
-        },
-        'Snacks': {
-            'price_range': (3, 25),
-            'holding_cost_pct': 0.01,
-            'seasonality': [3, 4, 6, 7, 12],  # School holidays
-            'products': [
-                ('Chips 125g', 'Simba Chutney'),
-                ('Chips 125g', 'Lays Salt'),
-                ('Chips 36g', 'Nik Naks'),
-                ('Chips 125g', 'Doritos'),
-                ('Biscuits', 'Marie'),
-                ('Biscuits', 'Tennis'),
-                ('Biscuits', 'Romany Creams'),
-                ('Biscuits', 'Oreos'),
-                ('Chocolate', 'Cadbury Dairy Milk'),
-                ('Chocolate', 'Bar One'),
-                ('Chocolate', 'KitKat'),
-                ('Sweets', 'Jelly Babies'),
-                ('Sweets', 'Wine Gums'),
-                ('Sweets', 'Chappies'),
-                ('Popcorn', 'Act II'),
-                ('Nuts 100g', 'Peanuts Salted'),
-                ('Dried Fruit', 'Safari Mix'),
-            ]
-        },
-        'Personal Care': {
-            'price_range': (12, 85),
-            'holding_cost_pct': 0.012,
-            'seasonality': [1, 2, 9],  # New year, back to school
-            'products': [
-                ('Soap', 'Sunlight Bar'),
-                ('Soap', 'Lux'),
-                ('Soap', 'Dettol'),
-                ('Toothpaste 100ml', 'Colgate'),
-                ('Toothpaste 50ml', 'Aquafresh'),
-                ('Lotion 400ml', 'Vaseline'),
-                ('Lotion 200ml', 'Dawn'),
-                ('Petroleum Jelly 250ml', 'Vaseline'),
-                ('Deodorant', 'Shield'),
-                ('Deodorant', 'Axe'),
-                ('Shampoo 400ml', 'Sunsilk'),
-                ('Body Wash 400ml', 'Dettol'),
-                ('Roll-on', 'Nivea'),
-                ('Face Cream', 'Pond\'s'),
-                ('Hair Food', 'Sta Sof Fro'),
-                ('Sanitary Pads', 'Always'),
-            ]
-        },
-        'Household': {
-            'price_range': (8, 65),
-            'holding_cost_pct': 0.008,
-            'seasonality': [1, 4, 12],
-            'products': [
-                ('Candles 6 pack', 'White'),
-                ('Matches Box', 'Lion'),
-                ('Washing Powder 1kg', 'Omo'),
-                ('Washing Powder 2kg', 'Sunlight'),
-                ('Dish Soap 750ml', 'Sunlight'),
-                ('Bleach 750ml', 'Jik'),
-                ('Floor Polish 750ml', 'Cobra'),
-                ('Air Freshener', 'Airoma'),
-                ('Toilet Paper 2pk', 'Twinsaver'),
-                ('Paper Towels', 'Checkers'),
-                ('Refuse Bags 20s', 'Black'),
-                ('Sponge Scourers', 'Scrub'),
-                ('Steel Wool', 'Brillo'),
-                ('Insect Spray', 'Doom'),
-                ('Batteries AA 4pk', 'Eveready'),
-            ]
-        },
-        'Airtime & Essentials': {
-            'price_range': (5, 100),
-            'holding_cost_pct': 0.005,
-            'seasonality': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],  # Always needed
-            'products': [
-                ('Airtime P5', 'Mascom'),
-                ('Airtime P10', 'Mascom'),
-                ('Airtime P25', 'Mascom'),
-                ('Airtime P50', 'Mascom'),
-                ('Airtime P5', 'Orange'),
-                ('Airtime P10', 'Orange'),
-                ('Airtime P25', 'Orange'),
-                ('Airtime P10', 'BTC'),
-                ('Data Bundle P20', 'Mascom'),
-                ('Data Bundle P50', 'Mascom'),
-                ('Electricity Voucher', 'BPC'),
-                ('Prepaid Water', 'WUC'),
-            ]
-        },
-        'Bread & Bakery': {
-            'price_range': (8, 35),
-            'holding_cost_pct': 0.04,  # Higher due to perishability
-            'seasonality': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],  # Daily staple
-            'products': [
-                ('Bread White', 'Albany'),
-                ('Bread Brown', 'Albany'),
-                ('Bread White', 'Blue Ribbon'),
-                ('Bread Whole Wheat', 'Sasko'),
-                ('Rolls 6 pack', 'Hot Dog'),
-                ('Scones 6 pack', 'Fresh'),
-                ('Vetkoek 4 pack', 'Fresh'),
-                ('Fat Cakes 6 pack', 'Homemade'),
-            ]
-        },
-        'Tobacco & Extras': {
-            'price_range': (25, 80),
-            'holding_cost_pct': 0.008,
-            'seasonality': [12, 1, 6],
-            'products': [
-                ('Cigarettes', 'Peter Stuyvesant'),
-                ('Cigarettes', 'Dunhill'),
-                ('Cigarettes', 'Rothmans'),
-                ('Cigarettes', 'Pacific'),
-                ('Loose Tobacco', 'Boxer'),
-                ('Rolling Paper', 'Rizla'),
-                ('Lighters 3pk', 'Bic'),
-            ]
-        }
-    }
-    
     # Movement patterns
     movement_types = ['fast', 'medium', 'slow', 'dead']
     movement_weights = [0.30, 0.35, 0.20, 0.15]
@@ -199,7 +206,7 @@ def generate_spaza_inventory(num_products=120, seed=42):
     products = []
     sku_counter = 1
     
-    for category, cat_info in categories.items():
+    for category, cat_info in CATEGORIES.items():
         for product_name, variant in cat_info['products']:
             # Generate SKU
             sku = f"SPZ-{category[:3].upper()}-{str(sku_counter).zfill(4)}"
@@ -265,8 +272,8 @@ def generate_spaza_inventory(num_products=120, seed=42):
                 current_date += timedelta(days=days_gap)
                 
                 # Seasonality boost
-                if current_date.month in cat_info['seasonality']:
-                    sale_qty = int(sale_qty * random.uniform(1.3, 2.0))
+                if current_date.month in SEASON_MONTHS[category]:
+                    sale_qty = int(sale_qty * random.uniform(*SEASON_UPLIFT))
                 
                 sale_qty = min(sale_qty, remaining_qty)
                 
@@ -316,66 +323,281 @@ def generate_spaza_inventory(num_products=120, seed=42):
     
     df = pd.DataFrame(products)
     
-    # Add classifications
-    df['stock_status'] = df['days_since_last_sale'].apply(classify_stock)
-    df['urgency_score'] = df.apply(calculate_urgency, axis=1)
-    df['action_required'] = df.apply(suggest_action, axis=1)
+    # Add classifications and the demand forecast
+    classify_inventory(df, thresholds)
+    forecast_inventory(df, end_date.date(), thresholds)
+    apply_schema(df)
     
     return df
 
 
-def classify_stock(days):
-    """Classify stock based on days since last sale"""
-    if days > 180:
-        return 'Dead Stock (6+ months)'
-    elif days > 90:
-        return 'Slow Moving (3-6 months)'
-    elif days > 30:
-        return 'Moderate (1-3 months)'
+# ============== VECTORIZED SIMULATION ==============
+# Same movement mix, quantities and seasonality uplift as the loop above, but
+# every sale event for a block of SKUs is drawn at once with numpy.random.Generator.
+
+MOVEMENT_TYPES = ['fast', 'medium', 'slow', 'dead']
+
+# Probability of fast / medium / slow / dead per category
+DEFAULT_MOVEMENT_MIX = [0.30, 0.35, 0.20, 0.15]
+MOVEMENT_MIX = {
+    'Airtime & Essentials': [0.7, 0.3, 0.0, 0.0],
+    'Bread & Bakery': [0.7, 0.3, 0.0, 0.0],
+    'Tobacco & Extras': [0.4, 0.4, 0.2, 0.0],
+}
+
+# Inclusive ranges per movement type, as drawn by random.randint in the loop
+SALE_PATTERNS = {
+    'fast': {'stock_offset': (0, 300), 'initial': (30, 100), 'gap': (1, 4), 'qty': (3, 15)},
+    'medium': {'stock_offset': (0, 300), 'initial': (20, 60), 'gap': (3, 14), 'qty': (2, 8)},
+    'slow': {'stock_offset': (0, 300), 'initial': (10, 40), 'gap': (10, 35), 'qty': (1, 4)},
+    'dead': {'stock_offset': (0, 180), 'initial': (10, 50), 'gap': (45, 100), 'qty': (1, 2), 'sale_prob': 0.15},
+}
+FAST_AIRTIME_INITIAL = (50, 200)
+SIMULATION_DAYS = 365
+DEFAULT_BLOCK_SIZE = 100_000
+
+
+def _catalog():
+    """Flatten CATEGORIES into per-product and per-category lookup arrays"""
+    names = list(CATEGORIES)
+    product_cat, product_name = [], []
+    for cat_idx, (category, cat_info) in enumerate(CATEGORIES.items()):
+        for name, variant in cat_info['products']:
+            product_cat.append(cat_idx)
+            product_name.append(f"{name} ({variant})")
+    season = np.zeros((len(names), 12), dtype=bool)
+    for cat_idx, category in enumerate(names):
+        season[cat_idx, np.asarray(SEASON_MONTHS[category]) - 1] = True
+    return {
+        'names': np.array(names, dtype=object),
+        'prefix': np.array([f"SPZ-{c[:3].upper()}" for c in names], dtype=object),
+        'price_lo': np.array([c['price_range'][0] for c in CATEGORIES.values()], dtype=float),
+        'price_hi': np.array([c['price_range'][1] for c in CATEGORIES.values()], dtype=float),
+        'holding_pct': np.array([c['holding_cost_pct'] for c in CATEGORIES.values()]),
+        'mix_cum': np.cumsum([MOVEMENT_MIX.get(c, DEFAULT_MOVEMENT_MIX) for c in names], axis=1),
+        'season': season,
+        'airtime': names.index('Airtime & Essentials'),
+        'product_cat': np.array(product_cat),
+        'product_name': np.array(product_name, dtype=object),
+    }
+
+
+def _simulate_sales(rng, movement, cat_idx, stock_offset, initial, day_month, season, events=None):
+    """Run every sale event for SKUs sharing one movement type.
+
+    day_month maps a day offset from the simulation start to its month (0-11).
+    Returns (total_sold, last_sale_offset). With an events list, the sales
+    themselves are appended to it as (row, day offset, qty) arrays.
+    """
+    pattern = SALE_PATTERNS[movement]
+    n = len(cat_idx)
+    # Upper bound on events: stock runs out or the year ends, whichever is first
+    max_events = int(min(np.ceil(initial.max(initial=1) / pattern['qty'][0]), np.ceil(SIMULATION_DAYS / pattern['gap'][0])))
+
+    # Event matrices are (SKUs x events); int16/float32 keep them small
+    gaps = rng.integers(pattern['gap'][0], pattern['gap'][1] + 1, size=(n, max_events), dtype=np.int16)
+    qty = rng.integers(pattern['qty'][0], pattern['qty'][1] + 1, size=(n, max_events), dtype=np.int16)
+    uplift = SEASON_UPLIFT[0] + (SEASON_UPLIFT[1] - SEASON_UPLIFT[0]) * rng.random((n, max_events), dtype=np.float32)
+
+    day = stock_offset.astype(np.int16)[:, None] + np.cumsum(gaps, axis=1, dtype=np.int16)
+    valid = day < SIMULATION_DAYS
+    if 'sale_prob' in pattern:
+        # Dead stock only keeps selling while every draw stays under sale_prob
+        valid &= np.cumprod(rng.random((n, max_events)) < pattern['sale_prob'], axis=1).astype(bool)
+
+    in_season = season[cat_idx[:, None], day_month[np.minimum(day, SIMULATION_DAYS)]]
+    qty = np.where(in_season, (qty * uplift).astype(np.int16), qty)
+
+    sold = np.cumsum(np.where(valid, qty, 0), axis=1, dtype=np.int32)
+    exhausted = sold >= initial[:, None]
+    first_exhausted = np.where(exhausted.any(axis=1), exhausted.argmax(axis=1), max_events)
+    last = np.minimum(valid.sum(axis=1), first_exhausted + 1) - 1
+    has_sale = last >= 0
+    rows = np.arange(n)
+    last = np.maximum(last, 0)
+    total_sold = np.where(has_sale, np.minimum(sold[rows, last], initial), 0)
+    last_sale = np.where(has_sale, day[rows, last], stock_offset)
+    if events is not None:
+        kept = (np.arange(max_events) <= last[:, None]) & has_sale[:, None]
+        # The sale that empties the shelf only takes what was left
+        qty = np.where(np.arange(max_events) == last[:, None], total_sold[:, None] - (sold - qty), qty)
+        row, col = np.nonzero(kept)
+        events.append((row, day[row, col], qty[row, col]))
+    return total_sold, last_sale
+
+
+def _simulate_block(rng, catalog, sku_index, start_day, events=None):
+    days = start_day + np.arange(SIMULATION_DAYS + 1)
+    day_month = days.astype('datetime64[M]').astype(np.int64) % 12
+    # One str object per calendar day, shared by every SKU that lands on it
+    day_label = np.datetime_as_string(days, unit='D').astype(object)
+    n = len(sku_index)
+    n_catalog = len(catalog['product_cat'])
+    product = sku_index % n_catalog
+    variant = sku_index // n_catalog
+    cat_idx = catalog['product_cat'][product]
+
+    unit_cost = np.round(rng.uniform(catalog['price_lo'][cat_idx], catalog['price_hi'][cat_idx]), 2)
+    unit_price = np.round(unit_cost * rng.uniform(1.15, 1.45, n), 2)
+
+    movement = (rng.random(n)[:, None] >= catalog['mix_cum'][cat_idx, :-1]).sum(axis=1)
+
+    stock_offset = np.empty(n, dtype=np.int64)
+    initial = np.empty(n, dtype=np.int64)
+    total_sold = np.zeros(n, dtype=np.int64)
+    last_sale = np.empty(n, dtype=np.int64)
+    sales = []
+    for code, movement_name in enumerate(MOVEMENT_TYPES):
+        idx = np.flatnonzero(movement == code)
+        if len(idx) == 0:
+            continue
+        pattern = SALE_PATTERNS[movement_name]
+        stock_offset[idx] = rng.integers(pattern['stock_offset'][0], pattern['stock_offset'][1] + 1, len(idx))
+        lo, hi = np.full(len(idx), pattern['initial'][0]), np.full(len(idx), pattern['initial'][1])
+        if movement_name == 'fast':
+            airtime = cat_idx[idx] == catalog['airtime']
+            lo[airtime], hi[airtime] = FAST_AIRTIME_INITIAL
+        initial[idx] = rng.integers(lo, hi + 1)
+        found = [] if events is not None else None
+        total_sold[idx], last_sale[idx] = _simulate_sales(rng, movement_name, cat_idx[idx], stock_offset[idx], initial[idx], day_month, catalog['season'], found)
+        if found:
+            row, day, qty = found[0]
+            sales.append((idx[row], day, qty))
+
+    remaining = initial - total_sold
+    days_in_stock = SIMULATION_DAYS - stock_offset
+    stock_value = np.round(remaining * unit_cost, 2)
+
+    base_name = catalog['product_name'][product]
+    block = {
+        'sku': np.array([f"{prefix}-{i + 1:04d}" for prefix, i in zip(catalog['prefix'][cat_idx], sku_index)], dtype=object),
+        'product_name': np.array([name if v == 0 else f"{name} #{v + 1}" for name, v in zip(base_name, variant)], dtype=object),
+        'category': catalog['names'][cat_idx],
+        'unit_cost': unit_cost,
+        'unit_price': unit_price,
+        'profit_margin_pct': np.round((unit_price - unit_cost) / unit_price * 100, 1),
+        'initial_quantity': initial,
+        'current_stock': remaining,
+        'total_sold': total_sold,
+        'stock_received_date': day_label[stock_offset],
+        'last_sale_date': day_label[last_sale],
+        'days_since_last_sale': SIMULATION_DAYS - last_sale,
+        'days_in_stock': days_in_stock,
+        'monthly_velocity': np.round(total_sold / np.maximum(days_in_stock, 1) * 30, 2),
+        'stock_value': stock_value,
+        'potential_revenue': np.round(remaining * unit_price, 2),
+        'holding_cost': np.round(remaining * unit_cost * catalog['holding_pct'][cat_idx] * (days_in_stock / 30), 2),
+        'movement_category': np.array(MOVEMENT_TYPES, dtype=object)[movement],
+    }
+    if events is not None:
+        row, day, qty = (np.concatenate(parts) for parts in zip(*sales)) if sales else (np.zeros(0, dtype=np.int64),) * 3
+        # In sale order, like a POS export
+        order = np.argsort(day, kind='stable')
+        events.append(pd.DataFrame({'sku': block['sku'][row[order]], 'date': day_label[day[order].astype(np.int64)], 'qty': qty[order].astype(np.int32)}))
+    return block
+
+
+def simulate_inventory(num_products=120, seed=42, end_date=None, thresholds=None, first_sku=0, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Vectorized counterpart of generate_spaza_inventory for large fixtures
+    - Honors num_products: SKUs cycle through the catalog, repeats get a " #n" variant suffix
+    - seed is anything numpy.random.default_rng accepts (int, SeedSequence, Generator)
+    - first_sku offsets SKU numbering so separately generated shards do not collide
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.now()
+    start_day = np.datetime64((end_date - timedelta(days=SIMULATION_DAYS)).date(), 'D')
+    catalog = _catalog()
+
+    blocks = []
+    for start in range(first_sku, first_sku + num_products, block_size):
+        sku_index = np.arange(start, min(start + block_size, first_sku + num_products))
+        blocks.append(_simulate_block(rng, catalog, sku_index, start_day))
+
+    if not blocks:
+        df = pd.DataFrame(columns=list(_simulate_block(rng, catalog, np.arange(0), start_day)))
     else:
-        return 'Active (< 1 month)'
+        df = pd.DataFrame({col: np.concatenate([b[col] for b in blocks]) for col in blocks[0]})
+    classify_inventory(df, thresholds)
+    forecast_inventory(df, end_date.date(), thresholds)
+    apply_schema(df)
+    return df
 
 
-def calculate_urgency(row):
-    """Calculate urgency score 0-100"""
-    score = 0
-    
-    # Days since last sale (max 40 points)
-    score += min(row['days_since_last_sale'] / 5, 40)
-    
-    # Stock value tied up (max 30 points) - adjusted for Pula
-    if row['stock_value'] > 500:
-        score += 30
-    elif row['stock_value'] > 200:
-        score += 20
-    elif row['stock_value'] > 50:
-        score += 10
-    
-    # Holding cost (max 30 points)
-    if row['holding_cost'] > 50:
-        score += 30
-    elif row['holding_cost'] > 20:
-        score += 20
-    elif row['holding_cost'] > 10:
-        score += 10
-    
-    return min(round(score, 1), 100)
+def simulate_sales_log(num_products=120, seed=42, end_date=None, thresholds=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    simulate_inventory plus the individual sales behind it
+    - Returns (inventory, log); log has one sku, date, qty row per sale event, in date order within each block
+    - Reducing the log with events.py gives back the inventory's total_sold and last_sale_date
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.now()
+    start_day = np.datetime64((end_date - timedelta(days=SIMULATION_DAYS)).date(), 'D')
+    catalog = _catalog()
+
+    blocks, events = [], []
+    for start in range(0, num_products, block_size):
+        blocks.append(_simulate_block(rng, catalog, np.arange(start, min(start + block_size, num_products)), start_day, events))
+    df = pd.DataFrame({col: np.concatenate([b[col] for b in blocks]) for col in blocks[0]}) if blocks else pd.DataFrame()
+    classify_inventory(df, thresholds)
+    forecast_inventory(df, end_date.date(), thresholds)
+    apply_schema(df)
+    log = pd.concat(events, ignore_index=True) if events else pd.DataFrame(columns=['sku', 'date', 'qty'])
+    return df, log
+
+
+# ============== SHARDED GENERATION ==============
+# Fixtures are split into fixed-size shards of the SKU space. Shard i always
+# gets SeedSequence(seed, spawn_key=(i,)) and the same end date, so its file is
+# identical no matter how many worker processes produce it.
 
+SHARD_FORMATS = {'csv': '.csv', 'parquet': '.parquet'}
 
-def suggest_action(row):
-    """Suggest action based on stock status"""
-    if row['stock_status'] == 'Dead Stock (6+ months)':
-        return 'Clearance Sale / Bundle'
-    elif row['stock_status'] == 'Slow Moving (3-6 months)':
-        return 'Discount / Promote'
-    elif row['stock_status'] == 'Moderate (1-3 months)':
-        return 'Monitor Weekly'
+
+def _write_shard(out_dir, index, first_sku, rows, seed, end_date, fmt):
+    df = simulate_inventory(rows, seed=np.random.SeedSequence(seed, spawn_key=(index,)), end_date=end_date, first_sku=first_sku)
+    path = os.path.join(out_dir, f"shard-{index:05d}{SHARD_FORMATS[fmt]}")
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
     else:
-        return 'Restock When Low'
+        df.to_csv(path, index=False)
+    with open(path, 'rb') as f:
+        digest = hashlib.file_digest(f, 'sha256').hexdigest()
+    return {'index': index, 'path': os.path.basename(path), 'first_sku': first_sku, 'rows': rows, 'sha256': digest}
 
 
-if __name__ == "__main__":
-    import os
+def generate_shards(out_dir, total_rows, shard_size=1_000_000, seed=42, end_date=None, fmt='csv', workers=None):
+    """
+    Generate total_rows SKUs as shard files plus manifest.json in out_dir
+    - Shards run in a ProcessPoolExecutor with `workers` processes
+    - Output is reproducible bit-for-bit for a given seed, shard_size and end_date
+    """
+    if fmt not in SHARD_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    end_date = end_date or datetime.combine(datetime.now().date(), datetime.min.time())
+    os.makedirs(out_dir, exist_ok=True)
+
+    jobs = [(index, first_sku, min(shard_size, total_rows - first_sku))
+            for index, first_sku in enumerate(range(0, total_rows, shard_size))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_write_shard, out_dir, index, first_sku, rows, seed, end_date, fmt) for index, first_sku, rows in jobs]
+        shards = [future.result() for future in futures]
+
+    manifest = {
+        'generator': 'simulate_inventory',
+        'seed': seed,
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'format': fmt,
+        'total_rows': total_rows,
+        'shard_size': shard_size,
+        'shards': shards,
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def write_sample_data():
     os.makedirs('sample_data', exist_ok=True)
     
     df = generate_spaza_inventory(num_products=120)
@@ -385,4 +607,24 @@ if __name__ == "__main__":
     print(f"\n📊 Stock Status Distribution:")
     print(df['stock_status'].value_counts())
     print(f"\n💰 Total Dead Stock Value: P{df[df['stock_status'] == 'Dead Stock (6+ months)']['stock_value'].sum():,.2f}")
-    print(f"📦 Categories: {df['category'].nunique()}")
\ No newline at end of file
+    print(f"📦 Categories: {df['category'].nunique()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Spaza Shop inventory data. With no command, rewrites sample_data/inventory_records.csv.")
+    commands = parser.add_subparsers(dest='command')
+    shards = commands.add_parser('shards', help="write a large sharded fixture with a manifest")
+    shards.add_argument('--rows', type=int, required=True)
+    shards.add_argument('--out', default='fixtures')
+    shards.add_argument('--shard-size', type=int, default=1_000_000)
+    shards.add_argument('--seed', type=int, default=42)
+    shards.add_argument('--end-date', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help="YYYY-MM-DD, defaults to today")
+    shards.add_argument('--format', choices=sorted(SHARD_FORMATS), default='csv')
+    shards.add_argument('--workers', type=int, help="worker processes, defaults to the CPU count")
+    args = parser.parse_args()
+
+    if args.command == 'shards':
+        manifest = generate_shards(args.out, args.rows, args.shard_size, args.seed, args.end_date, args.format, args.workers)
+        print(f"✅ Wrote {manifest['total_rows']:,} products in {len(manifest['shards'])} shards to {args.out}")
+    else:
+        write_sample_data()
@@ -0,0 +1,312 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import date, datetime
+
+from metrics import timed
+
+# ============== AUDIT HISTORY ==============
+# Every processed audit is kept as a dated snapshot in a local SQLite file, so
+# dead stock can be followed week over week without the raw files:
+#
+#   snapshots         one row per recorded audit, with its date and label (the
+#                     uploaded file's name, or the API's label parameter)
+#   snapshot_totals   the InventorySummary count/value per status x category,
+#                     which every trend query reads: a year of weekly snapshots
+#                     is a few thousand rows whatever the SKU count
+#   snapshot_rows     per-SKU status, stock and value, partitioned by snapshot
+#                     (the primary key starts with it) and indexed by sku and
+#                     by category
+#
+# Audits of different files or stores never replace each other. A later audit
+# with the same date and label supersedes the earlier one, but only once its
+# own totals are written, so a failed audit leaves the previous one in place.
+# Queries read latest_snapshots, the newest finished snapshot per date and
+# label, so they never depend on the superseded rows being gone.
+#
+# A snapshot's totals are written as soon as it is recorded. Its rows are
+# written by one background thread, so recording never holds up an upload;
+# a snapshot without totals (an API stream that failed) is left out of
+# every query and cleared by the next audit of its date and label.
+
+SCHEMA_VERSION = 2
+
+# Where snapshots go when STOCKAUDIT_HISTORY is unset
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'stockaudit-history.sqlite')
+
+SNAPSHOTS_TABLE = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken TEXT NOT NULL,
+    label TEXT NOT NULL DEFAULT '',
+    dataset TEXT,
+    rows INTEGER,
+    total_value REAL,
+    recorded TEXT NOT NULL
+);
+"""
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+""" + SNAPSHOTS_TABLE + """
+CREATE INDEX IF NOT EXISTS snapshots_key ON snapshots (label, taken, id);
+CREATE INDEX IF NOT EXISTS snapshots_dataset ON snapshots (dataset);
+CREATE VIEW IF NOT EXISTS latest_snapshots AS
+    SELECT * FROM snapshots s
+    WHERE s.rows IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM snapshots n WHERE n.label = s.label AND n.taken = s.taken AND n.rows IS NOT NULL AND n.id > s.id);
+CREATE TABLE IF NOT EXISTS snapshot_totals (
+    snapshot_id INTEGER NOT NULL,
+    status TEXT,
+    category TEXT,
+    count INTEGER NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshot_totals_snapshot ON snapshot_totals (snapshot_id);
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    snapshot_id INTEGER NOT NULL,
+    sku TEXT NOT NULL,
+    category TEXT,
+    status INTEGER,
+    days_since_last_sale INTEGER,
+    current_stock INTEGER,
+    stock_value REAL,
+    urgency_score REAL,
+    PRIMARY KEY (snapshot_id, sku)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshot_rows_sku ON snapshot_rows (sku, snapshot_id);
+CREATE INDEX IF NOT EXISTS snapshot_rows_category ON snapshot_rows (category, snapshot_id);
+"""
+
+# Version 1 kept one snapshot per date (taken was UNIQUE); SQLite can only drop that by rebuilding the table
+MIGRATE_V1 = """
+BEGIN IMMEDIATE;
+ALTER TABLE snapshots RENAME TO snapshots_v1;
+""" + SNAPSHOTS_TABLE + """
+INSERT INTO snapshots (id, taken, label, rows, total_value, recorded)
+    SELECT id, taken, COALESCE(label, ''), rows, total_value, recorded FROM snapshots_v1;
+DROP TABLE snapshots_v1;
+COMMIT;
+"""
+
+ROW_COLUMNS = ['snapshot_id', 'sku', 'category', 'status', 'days_since_last_sale', 'current_stock', 'stock_value', 'urgency_score']
+
+
+def _rows(frame, snapshot_id):
+    """snapshot_rows tuples for a processed frame in sku order; status is its index in STATUS_LABELS, None if unknown"""
+    import numpy as np
+    from classification import STATUS_DTYPE
+    # In key order the inserts append to the snapshot's partition
+    frame = frame.drop_duplicates('sku', keep='last').sort_values('sku')
+    status = frame['stock_status'].astype(STATUS_DTYPE).cat.codes.tolist()
+
+    def column(name, places=0):
+        # Rounded back from float32 storage; SQLite stores NaN as NULL
+        if name not in frame.columns:
+            return [None] * len(frame)
+        return np.round(frame[name].to_numpy(dtype=np.float64, na_value=np.nan), places).tolist()
+
+    category = frame['category'].astype(object).where(frame['category'].notna(), None).tolist()
+    return zip([snapshot_id] * len(frame), frame['sku'].astype(str).tolist(), category, [code if code >= 0 else None for code in status],
+               column('days_since_last_sale'), column('current_stock'), column('stock_value', 2), column('urgency_score', 4))
+
+
+class SnapshotStore:
+    """Dated audit snapshots in a SQLite file, plus the trend queries over them"""
+
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def connect(self):
+        """New autocommit connection, creating the file and tables on first use"""
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        if not self._ready:
+            with self._lock:
+                version = connection.execute('PRAGMA user_version').fetchone()[0]
+                if version < SCHEMA_VERSION:
+                    if version < 2 and connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snapshots'").fetchone():
+                        connection.executescript(MIGRATE_V1)
+                    connection.executescript(SCHEMA)
+                    connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                self._ready = True
+        return connection
+
+    def _transaction(self, func, *args):
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            result = func(connection, *args)
+            connection.execute('COMMIT')
+            return result
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def begin(self, taken=None, label=None, dataset=None):
+        """Start a snapshot of date taken (default today) and label; returns its ID.
+
+        It stays invisible, and any earlier snapshot of that date and label
+        stays current, until finish writes its totals.
+        """
+        taken = taken or date.today()
+        return self._transaction(lambda connection: connection.execute(
+            'INSERT INTO snapshots (taken, label, dataset, recorded) VALUES (?, ?, ?, ?)',
+            (taken.isoformat(), label or '', dataset, datetime.now().isoformat(timespec='seconds'))).lastrowid)
+
+    def finish(self, snapshot_id, summary):
+        """Write a snapshot's totals from its InventorySummary, making it the current one for its date and label.
+
+        Earlier snapshots of the same date and label, finished or not, are
+        dropped in the same transaction.
+        """
+        def write(connection):
+            totals = [(snapshot_id, status, category, int(summary.count[i, j]), float(summary.value[i, j]))
+                      for i, status in enumerate(summary.status_labels)
+                      for j, category in enumerate(summary.category_labels) if summary.count[i, j]]
+            connection.executemany('INSERT INTO snapshot_totals VALUES (?, ?, ?, ?, ?)', totals)
+            connection.execute('UPDATE snapshots SET rows = ?, total_value = ? WHERE id = ?', (summary.rows, summary.total_value, snapshot_id))
+            superseded = connection.execute("""
+                SELECT o.id FROM snapshots o JOIN snapshots s ON s.id = ?
+                WHERE o.taken = s.taken AND o.label = s.label AND o.id < s.id""", (snapshot_id,)).fetchall()
+            for table, column in (('snapshot_rows', 'snapshot_id'), ('snapshot_totals', 'snapshot_id'), ('snapshots', 'id')):
+                connection.executemany(f'DELETE FROM {table} WHERE {column} = ?', superseded)
+        self._transaction(write)
+
+    @timed('snapshot_rows')
+    def add_rows(self, snapshot_id, frame):
+        """Write a processed frame's rows to a snapshot, unless it was replaced meanwhile"""
+        def write(connection):
+            if connection.execute('SELECT 1 FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone():
+                connection.executemany(f"INSERT OR REPLACE INTO snapshot_rows VALUES ({', '.join('?' * len(ROW_COLUMNS))})", _rows(frame, snapshot_id))
+        self._transaction(write)
+
+    def add_rows_later(self, snapshot_id, frame):
+        """add_rows on the background writer thread; writes keep the order they were queued in"""
+        with self._lock:
+            if self._writer is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        return self._writer.submit(self.add_rows, snapshot_id, frame)
+
+    def flush(self):
+        """Wait for queued rows to be written"""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    @timed('record_snapshot')
+    def record(self, summary, frame=None, taken=None, label=None, dataset=None, wait=False):
+        """Record a whole audit; its rows, when frame is given, are written in the background unless wait is set"""
+        snapshot_id = self.begin(taken, label, dataset)
+        self.finish(snapshot_id, summary)
+        if frame is not None:
+            if wait:
+                self.add_rows(snapshot_id, frame)
+            else:
+                self.add_rows_later(snapshot_id, frame)
+        return snapshot_id
+
+    def _query(self, sql, params=()):
+        import pandas as pd
+        connection = self.connect()
+        try:
+            return pd.read_sql_query(sql, connection, params=params)
+        finally:
+            connection.close()
+
+    def snapshots(self, label=None):
+        """id, taken, label, rows and total_value of the current snapshots, optionally of one label, oldest first"""
+        where, params = ('WHERE label = ?', (label,)) if label is not None else ('', ())
+        return self._query(f'SELECT id, taken, label, rows, total_value FROM latest_snapshots {where} ORDER BY taken, label', params)
+
+    def labels(self):
+        return self._query('SELECT DISTINCT label FROM latest_snapshots ORDER BY label')['label'].tolist()
+
+    def label_of(self, dataset):
+        """Label of the latest snapshot recorded from a dataset ID, None if it was never recorded"""
+        connection = self.connect()
+        try:
+            row = connection.execute('SELECT label FROM snapshots WHERE dataset = ? ORDER BY id DESC LIMIT 1', (dataset,)).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+
+    def categories(self, label=None):
+        where, params = ('WHERE s.label = ?', (label,)) if label is not None else ('', ())
+        return self._query(f"""
+            SELECT DISTINCT t.category FROM snapshot_totals t JOIN latest_snapshots s ON s.id = t.snapshot_id
+            {where} {'AND' if where else 'WHERE'} t.category IS NOT NULL ORDER BY t.category""", params)['category'].tolist()
+
+    @staticmethod
+    def _filters(label=None, since=None, **columns):
+        """WHERE clause and parameters over latest_snapshots s and snapshot_totals t"""
+        where, params = [], []
+        for clause, value in (('s.label = ?', label), ('s.taken >= ?', since.isoformat() if since is not None else None),
+                              *((f't.{column} = ?', value) for column, value in columns.items())):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        return ('WHERE ' + ' AND '.join(where) if where else ''), params
+
+    @timed('status_trend')
+    def status_trend(self, category=None, since=None, label=None):
+        """count and value per snapshot date and stock status, optionally for one category and one label.
+
+        Without a label, each date sums the current snapshot of every label.
+        """
+        where, params = self._filters(label, since, category=category)
+        return self._query(f"""
+            SELECT s.taken, t.status, SUM(t.count) AS count, SUM(t.value) AS value
+            FROM snapshot_totals t JOIN latest_snapshots s ON s.id = t.snapshot_id
+            {where}
+            GROUP BY s.taken, t.status ORDER BY s.taken""", params)
+
+    @timed('category_trend')
+    def category_trend(self, status, since=None, label=None):
+        """count and value per snapshot date and category for one stock status, optionally for one label"""
+        where, params = self._filters(label, since, status=status)
+        return self._query(f"""
+            SELECT s.taken, t.category, SUM(t.count) AS count, SUM(t.value) AS value
+            FROM snapshot_totals t JOIN latest_snapshots s ON s.id = t.snapshot_id
+            {where}
+            GROUP BY s.taken, t.category ORDER BY s.taken""", params)
+
+    @timed('sku_history')
+    def sku_history(self, sku, label=None):
+        """One SKU's status, stock and value in every current snapshot that had it, optionally of one label"""
+        from classification import STATUS_LABELS
+        history = self._query(f"""
+            SELECT s.taken, s.label, r.category, r.status, r.days_since_last_sale, r.current_stock, r.stock_value, r.urgency_score
+            FROM snapshot_rows r JOIN latest_snapshots s ON s.id = r.snapshot_id
+            WHERE r.sku = ? {'AND s.label = ?' if label is not None else ''} ORDER BY s.taken, s.label""",
+            (str(sku),) + ((label,) if label is not None else ()))
+        history['status'] = [STATUS_LABELS[int(code)] if code == code and code is not None else None for code in history['status']]
+        return history
+
+    @timed('new_dead_stock')
+    def new_dead_stock(self, taken, label=''):
+        """SKUs dead in the snapshot of date taken and label that were not dead in that label's snapshot before it"""
+        from classification import STATUS_LABELS
+        dead = STATUS_LABELS.index('Dead Stock (6+ months)')
+        return self._query("""
+            SELECT r.sku, r.category, r.days_since_last_sale, r.current_stock, r.stock_value
+            FROM snapshot_rows r
+            WHERE r.snapshot_id = (SELECT id FROM latest_snapshots WHERE taken = ? AND label = ?) AND r.status = ?
+              AND NOT EXISTS (SELECT 1 FROM snapshot_rows p
+                              WHERE p.sku = r.sku AND p.status = ? AND p.snapshot_id =
+                                    (SELECT id FROM latest_snapshots WHERE taken < ? AND label = ? ORDER BY taken DESC LIMIT 1))
+            ORDER BY r.stock_value DESC""", (taken.isoformat(), label, dead, dead, taken.isoformat(), label))
+
+
+def history_from_env():
+    """Snapshot store at STOCKAUDIT_HISTORY (a SQLite file path), or None when it is set to 'off'"""
+    path = os.environ.get('STOCKAUDIT_HISTORY', DEFAULT_PATH)
+    if path.lower() == 'off':
+        return None
+    return SnapshotStore(path)
@@ -0,0 +1,290 @@
+import base64
+import io
+import itertools
+
+import pandas as pd
+
+from aggregate import InventorySummary, summarize
+from aging import age_inventory
+from classification import classify_inventory
+from events import CATALOG_COLUMNS, EVENT_COLUMNS, event_inventory, is_event_log, reduce_events
+from forecast import forecast_inventory
+from metrics import timed, timed_chunks
+from schema import apply_schema, concat_frames, csv_dtypes
+
+# ============== UPLOAD INGESTION ==============
+
+DEFAULT_CHUNKSIZE = 50_000
+DECODE_BLOCK_SIZE = 1 << 20
+
+REQUIRED_COLUMNS = ['sku', 'product_name', 'category', 'unit_cost', 'current_stock']
+OPTIONAL_COLUMNS = ['stock_value', 'days_since_last_sale', 'holding_cost', 'stock_status', 'urgency_score', 'action_required',
+                    # Aged from and forecast with
+                    'last_sale_date', 'stock_received_date', 'days_in_stock', 'total_sold', 'monthly_velocity']
+# Low-cardinality text columns read dictionary-encoded from columnar uploads
+DICTIONARY_COLUMNS = ['category', 'stock_status', 'action_required']
+
+# Leading bytes of the columnar formats we accept; anything else is read as CSV
+MAGIC_BYTES = [
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'arrow'),  # Arrow IPC file, which is also Feather v2
+    (b'\xff\xff\xff\xff', 'arrow_stream'),
+]
+
+
+class Base64Reader(io.RawIOBase):
+    """Read-only byte stream that base64-decodes a payload one block at a time.
+
+    Lets pandas read a dcc.Upload payload without materialising the decoded
+    bytes, the decoded text and a StringIO copy of the whole file.
+    """
+
+    def __init__(self, encoded, block_size=DECODE_BLOCK_SIZE):
+        self._encoded = encoded
+        self._block_size = max(4, block_size - block_size % 4)
+        self._pos = 0
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and self._pos < len(self._encoded):
+            block = self._encoded[self._pos:self._pos + self._block_size]
+            self._pos += len(block)
+            self._buffer = memoryview(base64.b64decode(block))
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class StreamReader(io.RawIOBase):
+    """Raw byte stream over anything with read(n), such as a WSGI request body"""
+
+    def __init__(self, source):
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._source.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def open_upload(contents):
+    """Return a buffered binary stream over a dcc.Upload data URL"""
+    content_type, content_string = contents.split(',', 1)
+    return io.BufferedReader(Base64Reader(content_string), buffer_size=DECODE_BLOCK_SIZE)
+
+
+def open_stream(source):
+    """Return a buffered binary stream over a raw file body, e.g. an HTTP request's"""
+    raw = source if isinstance(source, io.RawIOBase) else StreamReader(source)
+    return io.BufferedReader(raw, buffer_size=DECODE_BLOCK_SIZE)
+
+
+def detect_format(contents):
+    """Sniff the upload's leading bytes: 'parquet', 'arrow', 'arrow_stream' or 'csv'"""
+    return _sniff(open_upload(contents).read(8))
+
+
+def _sniff(head):
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    return 'csv'
+
+
+def import_pyarrow():
+    """pyarrow with the submodules uploads, the API and exports use; ImportError with an install hint if it is missing"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet and Arrow need pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def _projection(names):
+    """Columns the dashboard or a sales log uses, in file order; missing required ones are reported by process_data"""
+    wanted = set(REQUIRED_COLUMNS + OPTIONAL_COLUMNS + EVENT_COLUMNS + CATALOG_COLUMNS)
+    return [name for name in names if name in wanted]
+
+
+def _batch_to_frame(pa, batch):
+    table = pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch
+    for name in DICTIONARY_COLUMNS:
+        index = table.schema.get_field_index(name)
+        if index >= 0 and pa.types.is_string(table.schema.field(index).type):
+            table = table.set_column(index, name, pa.compute.dictionary_encode(table.column(index)))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _iter_columnar_chunks(stream, fmt, chunksize):
+    pa = import_pyarrow()
+    # Parquet and Arrow files keep their footer at the end, so they need random access;
+    # an Arrow stream can be read straight off the decoder
+    if fmt == 'arrow_stream':
+        source = pa.PythonFile(stream, mode='r')
+    elif hasattr(stream, 'name') and isinstance(stream.name, str):
+        source = pa.memory_map(stream.name)
+    else:
+        source = pa.BufferReader(stream.read())
+    if fmt == 'parquet':
+        parquet = pa.parquet.ParquetFile(source)
+        columns = _projection(parquet.schema_arrow.names)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield _batch_to_frame(pa, batch)
+    elif fmt == 'arrow':
+        reader = pa.ipc.open_file(source)
+        columns = _projection(reader.schema.names)
+        for i in range(reader.num_record_batches):
+            yield _batch_to_frame(pa, reader.get_batch(i).select(columns))
+    else:
+        reader = pa.ipc.open_stream(source)
+        columns = _projection(reader.schema.names)
+        for batch in reader:
+            yield _batch_to_frame(pa, batch.select(columns))
+
+
+def _numbered(chunks):
+    """Number rows across chunks like read_csv does, so labels are positions in the whole file"""
+    start = 0
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+def iter_upload_chunks(contents, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield the upload as DataFrames of at most chunksize rows, whatever its format.
+
+    Columnar uploads are projected to the columns the pipeline reads (see _projection).
+    """
+    yield from iter_stream_chunks(open_upload(contents), chunksize)
+
+
+def iter_stream_chunks(stream, chunksize=DEFAULT_CHUNKSIZE):
+    """iter_upload_chunks for a buffered binary stream (see open_stream), read as it arrives.
+
+    The format is sniffed with peek, so nothing has to be re-read; CSV and
+    Arrow streams are parsed a chunk at a time, Parquet and Arrow files are
+    read whole first because their footer comes last.
+    """
+    fmt = _sniff(stream.peek(8)[:8])
+    if fmt == 'csv':
+        yield from pd.read_csv(stream, encoding='utf-8', dtype=csv_dtypes(), chunksize=chunksize)
+    else:
+        yield from _numbered(_iter_columnar_chunks(stream, fmt, chunksize))
+
+
+def iter_file_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """iter_upload_chunks for a CSV, Parquet or Arrow file on disk"""
+    with open(path, 'rb') as f:
+        fmt = _sniff(f.read(8))
+    if fmt == 'csv':
+        yield from pd.read_csv(path, encoding='utf-8', dtype=csv_dtypes(), chunksize=chunksize)
+    else:
+        with open(path, 'rb') as f:
+            yield from _numbered(_iter_columnar_chunks(f, fmt, chunksize))
+
+
+@timed('parse_contents')
+def parse_contents(contents, filename):
+    try:
+        if detect_format(contents) == 'csv':
+            return pd.read_csv(open_upload(contents), encoding='utf-8', dtype=csv_dtypes()), None
+        return concat_frames(iter_upload_chunks(contents)), None
+    except Exception as e:
+        return None, str(e)
+
+
+@timed('process_data')
+def process_data(df, thresholds=None, as_of=None):
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        return None, f"Missing: {', '.join(missing)}"
+
+    if 'stock_value' not in df.columns:
+        df['stock_value'] = df['current_stock'] * df['unit_cost']
+    # Dates win over exported day counts, which are only right on the day the file was written
+    aged = age_inventory(df, as_of)
+    if 'days_since_last_sale' not in df.columns:
+        df['days_since_last_sale'] = 0
+    if 'holding_cost' not in df.columns:
+        df['holding_cost'] = 0
+    # A status exported with the file is stale once days idle were re-aged
+    classify_inventory(df, thresholds, overwrite='days_since_last_sale' in aged)
+    forecast_inventory(df, as_of, thresholds)
+    apply_schema(df)
+    return df, None
+
+
+def inventory_chunks(chunks, progress=None, as_of=None, catalog=None):
+    """Raw inventory chunks from raw upload chunks, timed as stage 'parse'.
+
+    An inventory passes through as it is read. A sales event log (see
+    events.py) is reduced first and comes out as one per-SKU chunk, joined
+    onto catalog when the log has no product columns; progress(events) is
+    called while it is reduced, and None is returned if it returns False.
+    """
+    chunks = timed_chunks(chunks, 'parse')
+    first = next(chunks, None)
+    if first is None:
+        return iter(())
+    if not is_event_log(first.columns):
+        return itertools.chain([first], chunks)
+    reducer = reduce_events(itertools.chain([first], chunks), progress)
+    if reducer is None:
+        return None
+    return iter([event_inventory(reducer, catalog, as_of)])
+
+
+def process_chunks(chunks, thresholds=None, keep_frame=False, progress=None, as_of=None, catalog=None):
+    """Validate, classify and summarize an iterable of raw chunks.
+
+    Returns (summary, frame, error). Only the running dashboard aggregates are
+    kept between chunks; the processed rows are concatenated into frame only
+    when keep_frame is set, otherwise frame is None. progress(rows) is called
+    after each chunk and stops processing with error "Cancelled" if it
+    returns False. Rows with dates are aged against as_of (default today).
+
+    Chunks of a sales event log (see events.py) are first reduced to one
+    per-SKU frame, joined onto catalog when the log has no product columns.
+    """
+    summary = InventorySummary.empty()
+    kept = [] if keep_frame else None
+    try:
+        chunks = inventory_chunks(chunks, progress, as_of, catalog)
+        if chunks is None:
+            return None, None, "Cancelled"
+        for chunk in chunks:
+            chunk, error = process_data(chunk, thresholds, as_of)
+            if error:
+                return None, None, error
+            summary = summary.merge(summarize(chunk))
+            if keep_frame:
+                kept.append(chunk)
+            if progress is not None and progress(summary.rows) is False:
+                return None, None, "Cancelled"
+    except Exception as e:
+        return None, None, str(e)
+    if summary.rows == 0:
+        return None, None, "No rows found"
+    frame = concat_frames(kept) if keep_frame else None
+    return summary, frame, None
+
+
+def stream_upload(contents, filename, thresholds=None, chunksize=DEFAULT_CHUNKSIZE, keep_frame=False, progress=None, as_of=None, catalog=None):
+    """Parse, validate and classify an upload chunk by chunk; see process_chunks"""
+    return process_chunks(iter_upload_chunks(contents, chunksize), thresholds, keep_frame, progress, as_of, catalog)
+
+
+def upload_columns(contents):
+    """Column names of an upload, read from its first row"""
+    return list(next(iter_upload_chunks(contents, chunksize=1), pd.DataFrame()).columns)
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ============== BACKGROUND JOBS ==============
+# Heavy uploads run on a small in-process thread pool instead of inside the
+# request, so the callback returns at once and a dcc.Interval polls for
+# progress. Jobs are cancelled cooperatively: the pipeline asks the job
+# whether to carry on after every chunk.
+
+DEFAULT_WORKERS = 2
+# Finished jobs are forgotten after this many seconds
+DEFAULT_RETENTION = 3600
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class Job:
+    """State of one background job; result or error is set once it finishes"""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.state = QUEUED
+        self.rows = 0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def report(self, rows):
+        """Progress hook for process_chunks: record rows done, return False once cancelled"""
+        self.rows = rows
+        return not self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+
+class JobQueue:
+    """Thread pool running func(job, *args) per job ID, at most one active job per ID"""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, retention=DEFAULT_RETENTION):
+        self.retention = retention
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stockaudit-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, func, *args):
+        """Queue func for job_id unless a job with that ID is already queued or running; returns the job"""
+        with self._lock:
+            self._prune_locked()
+            job = self._jobs.get(job_id)
+            if job is not None and job.active:
+                return job
+            job = self._jobs[job_id] = Job(job_id)
+        self._pool.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.cancel()
+        return job
+
+    def _run(self, job, func, args):
+        if job.cancelled:
+            job.state, job.finished = CANCELLED, time.time()
+            return
+        job.state, job.started = RUNNING, time.time()
+        try:
+            job.result = func(job, *args)
+            job.state = CANCELLED if job.cancelled else DONE
+        except Exception as e:
+            job.error = str(e)
+            job.state = CANCELLED if job.cancelled else FAILED
+        job.finished = time.time()
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+def jobs_from_env():
+    """Build the job queue configured by STOCKAUDIT_JOB_WORKERS, or None when it is 0"""
+    workers = int(os.environ.get('STOCKAUDIT_JOB_WORKERS', DEFAULT_WORKERS))
+    return JobQueue(workers) if workers > 0 else None
@@ -0,0 +1,203 @@
+import functools
+import os
+import threading
+import time
+import tracemalloc
+
+# ============== STAGE METRICS ==============
+# Wall time, rows and peak traced memory per pipeline stage, kept per process
+# and served in Prometheus text format from /metrics. Stages nest: a stage's
+# time and peak include the stages it calls.
+#
+#   STOCKAUDIT_TRACE_MEMORY=1   record peak memory per stage with tracemalloc
+#                               (slows allocation-heavy code, so off by default)
+#   STOCKAUDIT_SERVER_TIMING=1  add a Server-Timing header listing the stages
+#                               each request ran
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.peak_bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class StageRecorder:
+    """Per-process stage statistics plus the stages run by the current request"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def start_request(self):
+        self._local.timings = []
+
+    def finish_request(self):
+        """(stage, seconds) pairs recorded on this thread since start_request"""
+        timings, self._local.timings = getattr(self._local, 'timings', None) or [], None
+        return timings
+
+    def stage(self, name, rows=None):
+        return _Stage(self, name, rows)
+
+    def record(self, name, seconds, rows=None, peak_bytes=0):
+        with self._lock:
+            stats = self._stats.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.rows += rows or 0
+            stats.peak_bytes = max(stats.peak_bytes, peak_bytes)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            timings.append((name, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: (s.calls, s.seconds, s.rows, s.peak_bytes, list(s.buckets)) for name, s in self._stats.items()}
+
+    def prometheus(self):
+        """All stage statistics in Prometheus text exposition format"""
+        stats = self.snapshot()
+        lines = [
+            '# HELP stockaudit_stage_seconds Wall time per pipeline stage.',
+            '# TYPE stockaudit_stage_seconds histogram',
+        ]
+        for name, (calls, seconds, rows, peak, buckets) in sorted(stats.items()):
+            # Buckets are cumulative already: record() counts a call in every bound it fits under
+            for bound, count in zip(BUCKETS, buckets):
+                lines.append(f'stockaudit_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'stockaudit_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {calls}')
+            lines.append(f'stockaudit_stage_seconds_sum{{stage="{name}"}} {seconds:.6f}')
+            lines.append(f'stockaudit_stage_seconds_count{{stage="{name}"}} {calls}')
+        lines += ['# HELP stockaudit_stage_rows_total Rows processed per pipeline stage.', '# TYPE stockaudit_stage_rows_total counter']
+        lines += [f'stockaudit_stage_rows_total{{stage="{name}"}} {s[2]}' for name, s in sorted(stats.items())]
+        if self.trace_memory:
+            lines += ['# HELP stockaudit_stage_peak_memory_bytes Largest traced allocation peak seen in one call of the stage.', '# TYPE stockaudit_stage_peak_memory_bytes gauge']
+            lines += [f'stockaudit_stage_peak_memory_bytes{{stage="{name}"}} {s[3]}' for name, s in sorted(stats.items())]
+        rss = max_rss_bytes()
+        if rss is not None:
+            lines += ['# HELP stockaudit_process_max_rss_bytes Peak resident set size of this worker process.', '# TYPE stockaudit_process_max_rss_bytes gauge', f'stockaudit_process_max_rss_bytes {rss}']
+        return '\n'.join(lines) + '\n'
+
+
+class _Stage:
+    """Context manager timing one stage; set .rows inside the block if not known up front,
+    or .discard to leave the call out of the statistics"""
+
+    def __init__(self, recorder, name, rows=None):
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+        self.discard = False
+
+    def __enter__(self):
+        if self.recorder.trace_memory:
+            stack = self.recorder._stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            # [memory at entry, highest peak seen so far inside this stage]
+            stack.append([current, current])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak_bytes = 0
+        if self.recorder.trace_memory:
+            stack = self.recorder._stack()
+            entry, running = stack.pop()
+            highest = max(running, tracemalloc.get_traced_memory()[1])
+            peak_bytes = highest - entry
+            if stack:
+                stack[-1][1] = max(stack[-1][1], highest)
+        if not self.discard:
+            self.recorder.record(self.name, seconds, self.rows, peak_bytes)
+        return False
+
+
+def max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+RECORDER = StageRecorder(trace_memory=os.environ.get('STOCKAUDIT_TRACE_MEMORY', '') == '1')
+
+
+def stage(name, rows=None):
+    """with stage('parse') as s: ...; s.rows = len(df)"""
+    return RECORDER.stage(name, rows)
+
+
+def timed(name):
+    """Decorator recording each call as stage name; a DataFrame first argument counts as its rows"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Checked by name so importing metrics does not import pandas
+            rows = len(args[0]) if args and type(args[0]).__name__ == 'DataFrame' else None
+            with RECORDER.stage(name, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_chunks(chunks, name):
+    """Yield from chunks, recording the time spent producing each one as stage name"""
+    chunks = iter(chunks)
+    while True:
+        with RECORDER.stage(name) as s:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                s.discard = True
+                break
+            s.rows = len(chunk)
+        yield chunk
+
+
+def install(server):
+    """Add /metrics and, with STOCKAUDIT_SERVER_TIMING=1, Server-Timing headers to a Flask server"""
+    from flask import Response
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(RECORDER.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    if os.environ.get('STOCKAUDIT_SERVER_TIMING', '') != '1':
+        return
+
+    @server.before_request
+    def start_timing():
+        RECORDER.start_request()
+
+    @server.after_request
+    def add_server_timing(response):
+        timings = RECORDER.finish_request()
+        if timings:
+            totals = {}
+            for name, seconds in timings:
+                totals[name] = totals.get(name, 0.0) + seconds
+            response.headers['Server-Timing'] = ', '.join(f'{name.replace(".", "-")};dur={seconds * 1000:.1f}' for name, seconds in totals.items())
+        return response
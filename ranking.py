@@ -0,0 +1,128 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from aggregate import PRIORITY_COLUMNS
+from schema import rounded_floats
+
+# ============== PRIORITY RANKING ==============
+# Row orderings for the server-paged priority table. An ordering is an int32
+# array of row positions, computed once per (dataset, sort, filter); serving
+# a page is then a slice of it, so each page costs O(page size). The first
+# page of the urgency ordering is exactly InventorySummary.top_priority.
+
+# DataTable filter_query operators, longest symbols first so '>=' wins over '>'
+FILTER_OPERATORS = [
+    ('ge', '>='), ('le', '<='), ('ne', '!='), ('eq', '='), ('lt', '<'), ('gt', '>'),
+    ('contains', 'contains'), ('datestartswith', 'datestartswith'),
+]
+FILTER_PART = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s*(?P<op>\S+)\s*(?P<value>.*?)\s*$')
+
+
+def parse_filter_query(filter_query):
+    """Split a DataTable filter_query into (column, operator, value) triples.
+
+    Raises ValueError for parts it cannot read.
+    """
+    parts = []
+    for part in (filter_query or '').split(' && '):
+        if not part.strip():
+            continue
+        match = FILTER_PART.match(part)
+        if not match:
+            raise ValueError(f"Cannot read filter: {part}")
+        op = match.group('op')
+        for name, symbol in FILTER_OPERATORS:
+            if op in (name, symbol):
+                op = name
+                break
+        else:
+            raise ValueError(f"Unknown filter operator: {op}")
+        value = match.group('value')
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+            value = value[1:-1]
+        parts.append((match.group('column'), op, value))
+    return parts
+
+
+def _text_match(series, op, value):
+    """Evaluate a text operator once per category instead of once per row"""
+    values = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    labels = values.cat.categories.astype(str)
+    if op == 'contains':
+        hit = labels.str.contains(value, case=False, regex=False)
+    elif op == 'datestartswith':
+        hit = labels.str.startswith(value)
+    elif op == 'eq':
+        hit = labels == value
+    elif op == 'ne':
+        hit = labels != value
+    else:
+        raise ValueError(f"Operator {op} needs a numeric column")
+    codes = values.cat.codes.to_numpy()
+    return np.where(codes >= 0, np.asarray(hit)[codes], op == 'ne')
+
+
+def filter_mask(df, filter_query):
+    """Boolean row mask for a DataTable filter_query"""
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in parse_filter_query(filter_query):
+        if column not in df.columns:
+            raise ValueError(f"Unknown column: {column}")
+        series = df[column]
+        if pd.api.types.is_datetime64_dtype(series) and op not in ('contains', 'datestartswith'):
+            data = series.to_numpy()
+            moment = np.datetime64(pd.Timestamp(value))
+            # NaT compares False, so undated rows only pass 'ne'
+            mask &= {'ge': data >= moment, 'le': data <= moment, 'lt': data < moment,
+                     'gt': data > moment, 'eq': data == moment, 'ne': data != moment}[op]
+        elif pd.api.types.is_numeric_dtype(series) and op not in ('contains', 'datestartswith'):
+            number = float(value)
+            # Compared as displayed: a float32 79.62 is 79.6200027 until rounded back
+            data = rounded_floats(df[[column]])[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            mask &= {'ge': data >= number, 'le': data <= number, 'lt': data < number,
+                     'gt': data > number, 'eq': data == number, 'ne': data != number}[op]
+        else:
+            mask &= _text_match(series, op, value)
+    return mask
+
+
+def urgency_order(df):
+    """Row positions by urgency_score, highest first, ties in file order"""
+    scores = df['urgency_score'].to_numpy(dtype=np.float64, na_value=-np.inf)
+    return np.argsort(-scores, kind='stable').astype(np.int32)
+
+
+def rank_positions(df, sort_by=None, filter_query='', base_order=None):
+    """Row positions in display order for one sort/filter combination.
+
+    base_order (the urgency ordering) is reused when given. Rows tied on the
+    sort column keep their urgency rank.
+    """
+    positions = urgency_order(df) if base_order is None else base_order
+    if filter_query:
+        positions = positions[filter_mask(df, filter_query)[positions]]
+    for sort in reversed(sort_by or []):
+        values = df[sort['column_id']].iloc[positions].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype) and not values.cat.ordered:
+            # Unordered categories sort by label, not by the order they were first seen in
+            values = values.cat.reorder_categories(values.cat.categories.sort_values())
+        order = values.sort_values(ascending=sort['direction'] == 'asc', kind='stable', na_position='last').index.to_numpy()
+        positions = positions[order]
+    return positions
+
+
+def table_records(rows):
+    """DataTable records for priority rows, floats as exported, dates as YYYY-MM-DD and missing dates as None"""
+    rows = rounded_floats(rows.reindex(columns=PRIORITY_COLUMNS))
+    for col in rows.columns:
+        if pd.api.types.is_datetime64_dtype(rows[col]):
+            rows[col] = rows[col].dt.strftime('%Y-%m-%d').astype(object).where(rows[col].notna(), None)
+    return rows.to_dict('records')
+
+
+def page_records(df, positions, page_current, page_size):
+    """DataTable rows for one page of positions"""
+    start = page_current * page_size
+    return table_records(df.iloc[positions[start:start + page_size]])
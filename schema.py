@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from classification import ACTION_DTYPE, STATUS_DTYPE
+
+# ============== INVENTORY SCHEMA ==============
+# Compact dtypes for inventory frames: low-cardinality text as category,
+# counts as int32 and day counts as int16 when they fit, money as float32
+# when every value survives the round trip to the cent.
+
+MOVEMENT_DTYPE = pd.CategoricalDtype(['fast', 'medium', 'slow', 'dead'], ordered=True)
+
+CATEGORICAL_COLUMNS = {
+    'category': 'category',
+    'stock_status': STATUS_DTYPE,
+    'action_required': ACTION_DTYPE,
+    'movement_category': MOVEMENT_DTYPE,
+    'stock_received_date': 'category',
+    'last_sale_date': 'category',
+}
+# Fixed targets rather than per-chunk downcasts, so chunks concatenate cleanly
+INTEGER_COLUMNS = {
+    'initial_quantity': np.int32,
+    'current_stock': np.int32,
+    'total_sold': np.int32,
+    'days_since_last_sale': np.int16,
+    'days_in_stock': np.int16,
+}
+MONEY_COLUMNS = ['unit_cost', 'unit_price', 'stock_value', 'potential_revenue', 'holding_cost']
+FLOAT32_COLUMNS = ['profit_margin_pct', 'monthly_velocity', 'urgency_score']
+
+# float32 has a 24-bit mantissa, so cents are exact below 2**23 / 100
+FLOAT32_MAX_CENTS = 2 ** 23 / 100
+# Other text columns become categorical when at most this share of values is unique
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def csv_dtypes():
+    """dtype mapping for pd.read_csv so categorical columns are never built as object.
+
+    Fixed label sets are applied afterwards by apply_schema, since read_csv would
+    turn labels outside them into NaN.
+    """
+    return {col: 'category' for col in CATEGORICAL_COLUMNS}
+
+
+def _downcast_integer(series, dtype):
+    if series.dtype == dtype or series.dtype.kind not in 'iuf' or len(series) == 0:
+        return series
+    if series.dtype.kind == 'f' and (series.isna().any() or not (series == np.floor(series)).all()):
+        return series
+    info = np.iinfo(dtype)
+    if series.min() < info.min or series.max() > info.max:
+        return series
+    return series.astype(dtype)
+
+
+def _downcast_money(series):
+    if series.dtype.kind not in 'iuf' or series.dtype == np.float32:
+        return series
+    # Whole-Pula chunks parse as int; cast them too so chunks share one dtype
+    if len(series) == 0 or series.abs().max() < FLOAT32_MAX_CENTS:
+        return series.astype(np.float32)
+    return series
+
+
+def apply_schema(df):
+    """Convert df's columns to compact dtypes in place and return it"""
+    for col, dtype in CATEGORICAL_COLUMNS.items():
+        if col not in df.columns:
+            continue
+        is_categorical = isinstance(df[col].dtype, pd.CategoricalDtype)
+        if isinstance(dtype, str):
+            if not is_categorical:
+                df[col] = df[col].astype('category')
+        elif df[col].dtype != dtype and df[col].dropna().isin(dtype.categories).all():
+            df[col] = df[col].astype(dtype)
+        elif not is_categorical:
+            # Labels outside the fixed set (e.g. from another tool) stay as a plain category
+            df[col] = df[col].astype('category')
+    for col, dtype in INTEGER_COLUMNS.items():
+        if col in df.columns:
+            df[col] = _downcast_integer(df[col], dtype)
+    for col in MONEY_COLUMNS:
+        if col in df.columns:
+            df[col] = _downcast_money(df[col])
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns and df[col].dtype.kind == 'f':
+            df[col] = df[col].astype(np.float32)
+    for col in df.columns:
+        if df[col].dtype == object and col not in CATEGORICAL_COLUMNS and col != 'sku':
+            if df[col].nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(df):
+                df[col] = df[col].astype('category')
+    return df
+
+
+def concat_frames(frames):
+    """pd.concat that keeps categorical columns categorical across chunks with different categories"""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    frames = [f.copy(deep=False) for f in frames]
+    for col in frames[0].columns:
+        dtypes = [f[col].dtype for f in frames if col in f.columns]
+        if all(isinstance(d, pd.CategoricalDtype) for d in dtypes) and any(d != dtypes[0] for d in dtypes):
+            union = union_categoricals([f[col].array for f in frames], sort_categories=True, ignore_order=True).dtype
+            for f in frames:
+                f[col] = f[col].astype(union)
+    return pd.concat(frames, ignore_index=True)
+
+
+def rounded_floats(df):
+    """Shallow copy of df for output, float32 columns rounded back to what they were stored from.
+
+    Money goes back to the cent and rates and scores to 4 places, so 2.6 is
+    written as 2.6 and not 2.5999999046.
+    """
+    df = df.copy(deep=False)
+    for columns, places in ((MONEY_COLUMNS, 2), (FLOAT32_COLUMNS, 4)):
+        for col in columns:
+            if col in df.columns and df[col].dtype == np.float32:
+                df[col] = df[col].astype(np.float64).round(places)
+    return df
+
+
+def memory_report(before, after):
+    """Per-column and total deep memory usage (bytes) of two versions of a frame"""
+    report = pd.DataFrame({
+        'before': before.memory_usage(deep=True, index=False),
+        'after': after.memory_usage(deep=True, index=False),
+    })
+    report['dtype_before'] = before.dtypes.astype(str)
+    report['dtype_after'] = after.dtypes.astype(str)
+    report.loc['TOTAL', ['before', 'after']] = report[['before', 'after']].sum()
+    report['ratio'] = report['before'] / report['after']
+    return report